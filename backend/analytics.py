@@ -0,0 +1,347 @@
+import hmac
+import time
+import asyncio
+import hashlib
+import logging
+import secrets
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+STATE_ID = "download_rollups"
+# Fallback IP hash key, generated once when ANALYTICS_IP_SECRET is not set
+SECRET_ID = "ip_hash_secret"
+
+GRANULARITIES = ("hour", "day")
+
+# Rollup documents remember this many recently applied batches, so a batch
+# replayed after a crash, or by a lagging worker, is not counted twice
+APPLIED_BATCHES = 16
+
+
+def hash_ip(ip_address: str, secret: bytes) -> str:
+    """Identify an IP in rollups without storing it in clear.
+
+    Keyed, since a plain hash of the whole IPv4 space is quick to reverse.
+    """
+    return hmac.new(secret, ip_address.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def user_agent_family(user_agent: str) -> Tuple[str, str]:
+    """Classify a user agent as (browser family, device)"""
+    ua = (user_agent or "").lower()
+    device = "mobile" if "mobi" in ua or "android" in ua or "iphone" in ua else "desktop"
+    if not ua or ua == "unknown":
+        return "unknown", device
+    if any(marker in ua for marker in ("bot", "crawl", "spider", "curl", "wget", "python", "httpx")):
+        return "bot", "bot"
+    if "edg/" in ua or "edge/" in ua:
+        return "edge", device
+    if "opr/" in ua or "opera" in ua:
+        return "opera", device
+    if "firefox/" in ua or "fxios/" in ua:
+        return "firefox", device
+    if "chrome/" in ua or "crios/" in ua:
+        return "chrome", device
+    if "safari/" in ua:
+        return "safari", device
+    return "other", device
+
+
+class DownloadAnalytics:
+    """Hourly and daily download rollups built incrementally from ``download_tracking``.
+
+    Each pass aggregates the events written since a watermark on
+    ``recorded_at`` (the time the writer inserted them, so buffered and
+    replayed records are not missed) into ``download_rollups_hourly`` and
+    ``download_rollups_daily``: downloads, unique IPs and user-agent
+    breakdown per ebook and period. The IPs themselves are kept, keyed-hashed,
+    as one document per IP and period in ``download_unique_ips``, so a
+    popular ebook never grows a rollup document. Events younger than ``settle_seconds``
+    are left for the next pass, as batches still in flight may land before
+    them. Queries read only the rollups, and rolled-up raw events can be
+    moved to ``download_tracking_archive``.
+    """
+
+    def __init__(self, db, default_slug: str, settle_seconds: float = 120,
+                 max_window: timedelta = timedelta(days=1), archive_batch_size: int = 1000,
+                 ip_secret: Optional[str] = None):
+        self.db = db
+        self.events = db.download_tracking
+        self.archive_collection = db.download_tracking_archive
+        self.rollups = {"hour": db.download_rollups_hourly, "day": db.download_rollups_daily}
+        self.unique_ips = db.download_unique_ips
+        self.state = db.analytics_state
+        self.ip_secret = ip_secret.encode("utf-8") if ip_secret else None
+        # Records from before the catalog have no slug and belong to the default ebook
+        self.default_slug = default_slug
+        self.settle_seconds = settle_seconds
+        self.max_window = max_window
+        self.archive_batch_size = archive_batch_size
+        self._lock = asyncio.Lock()
+
+    async def ensure_indexes(self):
+        """Create the rollup indexes and migrate events and rollups written by older versions"""
+        await self.events.update_many(
+            {"recorded_at": {"$exists": False}},
+            [{"$set": {"recorded_at": "$timestamp"}}]
+        )
+        await self.events.create_index("recorded_at")
+        for collection in self.rollups.values():
+            await collection.create_index([("slug", ASCENDING), ("period", ASCENDING)], unique=True)
+            await collection.create_index("period")
+            # Rollups from before download_unique_ips kept their IP hashes inline
+            await collection.update_many(
+                {"ip_hashes": {"$exists": True}},
+                [{"$set": {"unique_ips": {"$size": "$ip_hashes"}}}, {"$project": {"ip_hashes": 0}}]
+            )
+        await self.unique_ips.create_index(
+            [("granularity", ASCENDING), ("slug", ASCENDING), ("period", ASCENDING), ("ip_hash", ASCENDING)],
+            unique=True
+        )
+
+    async def _secret(self) -> bytes:
+        """Get the IP hash key, shared by every worker through analytics_state when not configured"""
+        if self.ip_secret is None:
+            document = await self.state.find_one_and_update(
+                {"_id": SECRET_ID},
+                {"$setOnInsert": {"secret": secrets.token_hex(32)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            logger.warning("ANALYTICS_IP_SECRET is not set, hashing IPs with a key stored in analytics_state")
+            self.ip_secret = document["secret"].encode("utf-8")
+        return self.ip_secret
+
+    async def rollup(self) -> int:
+        """Roll up every settled event past the watermark, return how many were added"""
+        rolled_up = 0
+        async with self._lock:
+            while True:
+                window = await self._next_window()
+                if window is None:
+                    return rolled_up
+                start, end = window
+                started = time.monotonic()
+                count = await self._apply(start, end)
+                # Only the first worker to finish the window matches, and windows
+                # end past the watermark, so it only moves forward
+                await self.state.update_one(
+                    {"_id": STATE_ID, "pending.start": start},
+                    {"$set": {"watermark": end}, "$unset": {"pending": ""}}
+                )
+                rolled_up += count
+                if count:
+                    logger.info(f"Rolled up {count} download events up to {end.isoformat()} "
+                                f"in {time.monotonic() - started:.2f}s")
+
+    async def _next_window(self) -> Optional[Tuple[datetime, datetime]]:
+        """Claim the next window of events to roll up, resuming an unfinished one first"""
+        while True:
+            state = await self.state.find_one({"_id": STATE_ID}) or {}
+            pending = state.get("pending")
+            if pending:
+                return pending["start"], pending["end"]
+
+            settled = datetime.utcnow() - timedelta(seconds=self.settle_seconds)
+            claimed = {"_id": STATE_ID, "pending": None, "watermark": state.get("watermark")}
+            watermark = state.get("watermark", datetime.min)
+            # Jump over stretches without events instead of walking them window by window
+            first = await self.events.find_one(
+                {"recorded_at": {"$gte": watermark, "$lt": settled}},
+                {"recorded_at": 1},
+                sort=[("recorded_at", ASCENDING)]
+            )
+            if first is None:
+                try:
+                    await self.state.update_one(
+                        claimed,
+                        {"$set": {"watermark": settled}},
+                        upsert=True
+                    )
+                except DuplicateKeyError:
+                    pass  # Another worker moved the state meanwhile
+                return None
+
+            start = max(watermark, first["recorded_at"])
+            end = min(settled, start + self.max_window)
+            # The window is recorded before it is applied so a crashed pass is
+            # replayed with the same bounds, and concurrent workers share it
+            try:
+                await self.state.update_one(
+                    claimed,
+                    {"$set": {"pending": {"start": start, "end": end}}},
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                continue
+            state = await self.state.find_one({"_id": STATE_ID})
+            pending = state["pending"]
+            return pending["start"], pending["end"]
+
+    async def _apply(self, start: datetime, end: datetime) -> int:
+        """Add the events recorded in [start, end) to the hourly and daily rollups"""
+        groups = await self.events.aggregate([
+            {"$match": {"recorded_at": {"$gte": start, "$lt": end}}},
+            {"$group": {
+                "_id": {
+                    "slug": "$slug",
+                    "year": {"$year": "$timestamp"},
+                    "month": {"$month": "$timestamp"},
+                    "day": {"$dayOfMonth": "$timestamp"},
+                    "hour": {"$hour": "$timestamp"},
+                    "user_agent": "$user_agent",
+                },
+                "downloads": {"$sum": 1},
+                "ips": {"$addToSet": "$ip_address"},
+            }},
+        ]).to_list(None)
+        if not groups:
+            return 0
+
+        secret = await self._secret()
+        rollups = {granularity: defaultdict(lambda: {"downloads": 0, "ips": set(), "user_agents": Counter(),
+                                                     "devices": Counter()})
+                   for granularity in GRANULARITIES}
+        for group in groups:
+            key = group["_id"]
+            hour = datetime(key["year"], key["month"], key["day"], key["hour"])
+            slug = key.get("slug") or self.default_slug
+            family, device = user_agent_family(key.get("user_agent"))
+            ips = {hash_ip(ip, secret) for ip in group["ips"] if ip}
+            for granularity, period in (("hour", hour), ("day", hour.replace(hour=0))):
+                rollup = rollups[granularity][(slug, period)]
+                rollup["downloads"] += group["downloads"]
+                rollup["ips"] |= ips
+                rollup["user_agents"][family] += group["downloads"]
+                rollup["devices"][device] += group["downloads"]
+
+        batch = start.isoformat()
+        for granularity, periods in rollups.items():
+            await self._write(self.rollups[granularity], batch, periods)
+            await self._count_unique_ips(granularity, periods)
+        return sum(group["downloads"] for group in groups)
+
+    async def _count_unique_ips(self, granularity: str, periods: Dict[Tuple[str, datetime], Dict[str, Any]]):
+        """Record the IPs of each period, then set its unique IP count from them"""
+        documents = [
+            {"granularity": granularity, "slug": slug, "period": period, "ip_hash": ip_hash}
+            for (slug, period), rollup in periods.items() for ip_hash in sorted(rollup["ips"])
+        ]
+        if not documents:
+            return
+        try:
+            await self.unique_ips.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # Duplicates are IPs already seen in the period, or a replayed batch
+            errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+            if errors:
+                raise
+
+        # A recount is idempotent, and $max keeps the most complete one when
+        # workers applying the same window finish in either order
+        operations = []
+        for slug, period in periods:
+            count = await self.unique_ips.count_documents(
+                {"granularity": granularity, "slug": slug, "period": period}
+            )
+            operations.append(UpdateOne({"slug": slug, "period": period}, {"$max": {"unique_ips": count}}))
+        await self.rollups[granularity].bulk_write(operations, ordered=False)
+
+    @staticmethod
+    async def _write(collection, batch: str, periods: Dict[Tuple[str, datetime], Dict[str, Any]]):
+        """Upsert rollup increments, skipping documents that already have this batch"""
+        operations = []
+        for (slug, period), rollup in periods.items():
+            increments = {"downloads": rollup["downloads"]}
+            increments.update({f"user_agents.{name}": count for name, count in rollup["user_agents"].items()})
+            increments.update({f"devices.{name}": count for name, count in rollup["devices"].items()})
+            operations.append(UpdateOne(
+                {"slug": slug, "period": period, "batches": {"$ne": batch}},
+                {
+                    "$inc": increments,
+                    "$push": {"batches": {"$each": [batch], "$slice": -APPLIED_BATCHES}},
+                },
+                upsert=True
+            ))
+        try:
+            await collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # A document that already has the batch fails its filter, and the
+            # upsert then collides with it on the unique (slug, period) index
+            errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+            if errors:
+                raise
+
+    async def archive(self, older_than: timedelta) -> int:
+        """Move rolled-up events older than older_than to the archive, return how many moved"""
+        state = await self.state.find_one({"_id": STATE_ID}) or {}
+        watermark = state.get("watermark")
+        if watermark is None:
+            return 0
+        # Only events behind the watermark are in the rollups
+        cutoff = min(watermark, datetime.utcnow() - older_than)
+
+        moved = 0
+        while True:
+            documents = await self.events.find(
+                {"recorded_at": {"$lt": cutoff}}
+            ).sort("recorded_at", ASCENDING).to_list(self.archive_batch_size)
+            if not documents:
+                break
+            try:
+                await self.archive_collection.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                # Duplicates come from a previous pass that stopped before deleting
+                errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+                if errors:
+                    raise
+            await self.events.delete_many({"_id": {"$in": [document["_id"] for document in documents]}})
+            moved += len(documents)
+        if moved:
+            logger.info(f"Archived {moved} download events recorded before {cutoff.isoformat()}")
+        return moved
+
+    async def get_downloads(self, granularity: str, start: datetime, end: datetime,
+                            slug: Optional[str] = None, limit: int = 2000) -> Dict[str, Any]:
+        """Get downloads per period in [start, end) from the rollups, with totals"""
+        query: Dict[str, Any] = {"period": {"$gte": start, "$lt": end}}
+        if slug:
+            query["slug"] = slug
+        documents = await self.rollups[granularity].find(
+            query, {"_id": 0, "batches": 0}
+        ).sort([("period", ASCENDING), ("slug", ASCENDING)]).to_list(limit)
+
+        series: List[Dict[str, Any]] = []
+        totals = {"downloads": 0, "user_agents": Counter(), "devices": Counter()}
+        for document in documents:
+            series.append({
+                "period": document["period"],
+                "slug": document["slug"],
+                "downloads": document.get("downloads", 0),
+                "unique_ips": document.get("unique_ips", 0),
+                "user_agents": document.get("user_agents", {}),
+                "devices": document.get("devices", {}),
+            })
+            totals["downloads"] += document.get("downloads", 0)
+            totals["user_agents"].update(document.get("user_agents", {}))
+            totals["devices"].update(document.get("devices", {}))
+
+        state = await self.state.find_one({"_id": STATE_ID}) or {}
+        return {
+            "granularity": granularity,
+            "start": start,
+            "end": end,
+            # Events recorded after this are not in the rollups yet
+            "watermark": state.get("watermark"),
+            "series": series,
+            "totals": {
+                "downloads": totals["downloads"],
+                "user_agents": dict(totals["user_agents"]),
+                "devices": dict(totals["devices"]),
+            },
+        }
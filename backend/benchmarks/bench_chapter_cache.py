@@ -0,0 +1,70 @@
+"""Re-render time as a function of the number of changed chapters.
+
+Renders a synthetic ebook once to fill the chapter cache, then edits k
+chapters and times the next render, against a full single-pass build.
+
+    python benchmarks/bench_chapter_cache.py --chapters 20
+"""
+import copy
+import time
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+from common import synthetic_ebook, write_results
+from pdf_generator import PDFGenerator
+
+
+def edit_chapters(content, count: int, revision: int):
+    """Return a copy of content with the first count chapters edited"""
+    edited = copy.deepcopy(content)
+    for chapter in edited["chapters"][:count]:
+        chapter["content"][0]["text"][0] += f" Révision {revision}."
+    return edited
+
+
+def timed(fn, repeat: int) -> float:
+    """Median wall time of fn over repeat runs"""
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chapters", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/chapter_cache-<rev>.json)")
+    args = parser.parse_args()
+
+    content = synthetic_ebook(args.chapters)
+    with tempfile.TemporaryDirectory() as storage:
+        generator = PDFGenerator(storage)
+        output = Path(storage) / "out.pdf"
+        generator.build_pdf(content, output)
+
+        full = timed(lambda: generator.build_single_pdf(content, output), args.repeat)
+        print(f"{'changed':>8} {'seconds':>9} {'vs full':>8}")
+        print(f"{'full':>8} {full:9.3f} {1:8.2f}")
+        results = {"chapters": args.chapters, "full_build_s": full, "rerender": []}
+
+        revision = 0
+        for changed in sorted({0, 1, 2, 5, args.chapters // 2, args.chapters}):
+            def rerender():
+                nonlocal revision
+                revision += 1
+                generator.build_pdf(edit_chapters(content, changed, revision), output)
+
+            seconds = timed(rerender, args.repeat)
+            results["rerender"].append({"changed_chapters": changed, "rerender_s": seconds})
+            print(f"{changed:>8} {seconds:9.3f} {seconds / full:8.2f}")
+
+    write_results("chapter_cache", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Load test of the hot HTTP endpoints against an in-memory Mongo stand-in.
+
+Runs the FastAPI app in-process through httpx's ASGI transport with
+mongomock-motor in place of Motor, and reports per-endpoint latency
+percentiles, throughput, event-loop lag and RSS, along with the cold
+start: importing the app, running its lifespan startup and the first
+successful health check.
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/bench_http.py --requests 500 --concurrency 50
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+from collections import Counter
+
+from common import LoopLagMonitor, summarize, rss_mb, write_results
+
+
+def load_server(storage: str, render_workers: int):
+    """Import the app with Motor swapped for mongomock-motor"""
+    os.environ["PDF_STORAGE_PATH"] = storage
+    os.environ["RENDER_WORKERS"] = str(render_workers)
+
+    import motor.motor_asyncio
+    import mongomock_motor
+    motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+
+    started = time.perf_counter()
+    import server
+    return server, time.perf_counter() - started
+
+
+async def run_endpoint(client, method: str, path: str, requests: int, concurrency: int):
+    """Fire requests at one endpoint with bounded concurrency"""
+    semaphore = asyncio.Semaphore(concurrency)
+    durations = []
+    statuses = Counter()
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.request(method, path)
+            durations.append(time.perf_counter() - started)
+            statuses[response.status_code] += 1
+
+    monitor = LoopLagMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(requests)])
+    elapsed = time.perf_counter() - started
+    lag = await monitor.stop()
+
+    return {
+        **summarize(durations, elapsed),
+        **lag,
+        "statuses": dict(statuses),
+        "rss_mb": rss_mb(),
+    }
+
+
+async def wait_ready(client, timeout: float = 120.0):
+    """Wait until the warm-up render has finished"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if (await client.get("/api/health")).status_code == 200:
+            return
+        await asyncio.sleep(0.1)
+    raise RuntimeError("Service did not become ready")
+
+
+async def bench(args):
+    import httpx
+
+    with tempfile.TemporaryDirectory() as storage:
+        server, import_s = load_server(storage, args.render_workers)
+        app = server.app
+
+        started = time.perf_counter()
+        async with app.router.lifespan_context(app):
+            startup_s = time.perf_counter() - started
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                await wait_ready(client)
+                ready_s = time.perf_counter() - started
+                print(f"Cold start: import {import_s:.2f}s, startup {startup_s:.2f}s, ready {ready_s:.2f}s")
+                token = (await client.post("/api/generate-pdf")).json()["token"]
+
+                endpoints = [
+                    ("POST", "/api/generate-pdf"),
+                    ("GET", f"/api/download-pdf/{token}"),
+                    ("GET", "/api/stats"),
+                    ("GET", "/api/ebook/content"),
+                ]
+                results = {}
+                print(f"{'endpoint':<28} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'lag p99':>8}")
+                for method, path in endpoints:
+                    name = f"{method} {path.replace(token, '{token}')}"
+                    result = await run_endpoint(client, method, path, args.requests, args.concurrency)
+                    results[name] = result
+                    print(f"{name:<28} {result['p50_ms']:8.1f} {result['p95_ms']:8.1f} "
+                          f"{result['p99_ms']:8.1f} {result['throughput_rps']:8.0f} {result['lag_p99_ms']:8.1f}")
+
+    write_results("http", {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "render_workers": args.render_workers,
+        "cold_start": {"import_s": import_s, "startup_s": startup_s, "ready_s": ready_s},
+        "endpoints": results,
+    }, args.output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--render-workers", type=int, default=2)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/http-<rev>.json)")
+    asyncio.run(bench(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Import time of the backend entry points, as seen by a cold process.
+
+Runs ``python -X importtime -c "import <module>"`` in a fresh interpreter
+for each entry point, without Mongo settings, and reports the total import
+time and the modules that cost the most on their own.
+
+    python benchmarks/bench_import.py --modules server worker cli --top 15
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+from typing import Dict
+
+from common import BACKEND_DIR, write_results
+
+
+def import_times(module: str) -> Dict[str, Dict[str, float]]:
+    """Import a module in a fresh interpreter, return each imported module's self and cumulative ms"""
+    env = {key: value for key, value in os.environ.items() if key not in ("MONGO_URL", "DB_NAME")}
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    times = {}
+    # Lines look like "import time:       412 |       1650 |   pdf_generator"
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = {"self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000}
+    return times
+
+
+def bench_module(module: str, repeat: int, top: int):
+    """Benchmark one entry point"""
+    runs = [import_times(module) for _ in range(repeat)]
+    totals = [run[module]["cumulative_ms"] for run in runs]
+    # The costliest modules of the median run
+    median_run = runs[totals.index(sorted(totals)[len(totals) // 2])]
+    heaviest = sorted(median_run.items(), key=lambda item: item[1]["self_ms"], reverse=True)[:top]
+    return {
+        "import_ms": statistics.median(totals),
+        "modules": len(median_run),
+        "heaviest": [{"module": name, **times} for name, times in heaviest],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", nargs="+", default=["server", "worker", "cli"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/import-<rev>.json)")
+    args = parser.parse_args()
+
+    results: Dict[str, Dict] = {}
+    for module in args.modules:
+        result = results[module] = bench_module(module, args.repeat, args.top)
+        print(f"{module}: {result['import_ms']:.0f} ms, {result['modules']} modules")
+        print(f"  {'self ms':>8} {'cum ms':>8}  module")
+        for entry in result["heaviest"]:
+            print(f"  {entry['self_ms']:8.1f} {entry['cumulative_ms']:8.1f}  {entry['module']}")
+
+    write_results("import", {"repeat": args.repeat, "modules": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Output size and optimization time of each output profile, across ebook sizes.
+
+For each target size, builds the PDF once and runs it through every
+profile in ``optimize.OUTPUT_PROFILES``, recording the size before and
+after, the optimization time and whether the result is linearized.
+
+    python benchmarks/bench_output_profiles.py --pages 10 100 500
+"""
+import io
+import argparse
+import tempfile
+import statistics
+
+from common import synthetic_ebook_pages, write_results
+from pdf_generator import PDFGenerator
+from optimize import OUTPUT_PROFILES, HAS_PIKEPDF, optimize_pdf
+
+
+def bench_size(pages: int, repeat: int):
+    """Benchmark one ebook size"""
+    content = synthetic_ebook_pages(pages)
+    with tempfile.TemporaryDirectory() as storage:
+        document = io.BytesIO()
+        PDFGenerator(storage).build_pdf(content, document)
+        data = document.getvalue()
+
+    results = []
+    for name, profile in OUTPUT_PROFILES.items():
+        reports = []
+        for _ in range(repeat):
+            output = io.BytesIO()
+            reports.append(optimize_pdf(io.BytesIO(data), output, profile))
+        linearized = None
+        if HAS_PIKEPDF:
+            import pikepdf
+            with pikepdf.open(io.BytesIO(output.getvalue())) as pdf:
+                linearized = pdf.is_linearized
+        results.append({
+            "target_pages": pages,
+            "profile": name,
+            "bytes_before": reports[0]["bytes_before"],
+            "bytes_after": reports[0]["bytes_after"],
+            "saved_ratio": reports[0]["saved_ratio"],
+            "optimize_s": statistics.median(report["seconds"] for report in reports),
+            "linearized": linearized,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/output_profiles-<rev>.json)")
+    args = parser.parse_args()
+
+    if not HAS_PIKEPDF:
+        print("pikepdf is not installed: no object streams nor linearization")
+    print(f"{'pages':>6} {'profile':>8} {'before':>9} {'after':>9} {'saved':>7} {'seconds':>8} {'linear':>7}")
+    results = []
+    for pages in args.pages:
+        for result in bench_size(pages, args.repeat):
+            results.append(result)
+            print(f"{pages:>6} {result['profile']:>8} {result['bytes_before']:>9} {result['bytes_after']:>9} "
+                  f"{result['saved_ratio']:7.1%} {result['optimize_s']:8.3f} {str(result['linearized']):>7}")
+
+    write_results("output_profiles", {"sizes": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
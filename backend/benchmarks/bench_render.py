@@ -0,0 +1,85 @@
+"""Microbenchmarks for PDFGenerator rendering across ebook sizes.
+
+For each target size, times a cold single-pass build (``build_single_pdf``)
+and a cold and warm chapter-cached build (``build_pdf``), and records page
+count, output size and RSS.
+
+    python benchmarks/bench_render.py --pages 10 100 1000
+"""
+import time
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+from common import synthetic_ebook_pages, rss_mb, write_results
+from pdf_generator import PDFGenerator
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # page counts need pypdf
+    PdfReader = None
+
+
+def timed(fn, repeat: int):
+    """Wall times of fn over repeat runs"""
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def bench_size(pages: int, repeat: int):
+    """Benchmark one ebook size"""
+    content = synthetic_ebook_pages(pages)
+    with tempfile.TemporaryDirectory() as storage:
+        output = Path(storage) / "out.pdf"
+
+        single = timed(lambda: PDFGenerator(storage).build_single_pdf(content, output), repeat)
+
+        def cold_cached():
+            # A fresh storage path means an empty chapter cache
+            with tempfile.TemporaryDirectory() as cold_storage:
+                PDFGenerator(cold_storage).build_pdf(content, output)
+
+        cold = timed(cold_cached, repeat)
+        generator = PDFGenerator(storage)
+        generator.build_pdf(content, output)
+        warm = timed(lambda: generator.build_pdf(content, output), repeat)
+
+        actual_pages = len(PdfReader(str(output)).pages) if PdfReader else None
+        return {
+            "target_pages": pages,
+            "pages": actual_pages,
+            "chapters": len(content["chapters"]),
+            "bytes": output.stat().st_size,
+            "single_pass_s": statistics.median(single),
+            "chapter_cache_cold_s": statistics.median(cold),
+            "chapter_cache_warm_s": statistics.median(warm),
+            "rss_mb": rss_mb(),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 50, 100, 500, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/render-<rev>.json)")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'pages':>6} {'single s':>9} {'cold s':>8} {'warm s':>8} {'KiB':>7} {'RSS MiB':>8}")
+    for pages in args.pages:
+        result = bench_size(pages, args.repeat)
+        results.append(result)
+        print(f"{result['pages'] or pages:>6} {result['single_pass_s']:9.3f} "
+              f"{result['chapter_cache_cold_s']:8.3f} {result['chapter_cache_warm_s']:8.3f} "
+              f"{result['bytes'] / 1024:7.0f} {result['rss_mb']:8.0f}")
+
+    write_results("render", {"sizes": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
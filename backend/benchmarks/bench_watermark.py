@@ -0,0 +1,85 @@
+"""Per-download watermark cost against a full render, across ebook sizes.
+
+For each target size, times a full single-pass build (``build_single_pdf``)
+and a chapter-cached build of unchanged content (``build_pdf``) against
+stamping a watermark overlay onto the cached artifact (``stamp_artifact``,
+cold and with the parsed base kept by the worker), and records output sizes.
+
+    python benchmarks/bench_watermark.py --pages 10 100 500
+"""
+import time
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+from common import synthetic_ebook_pages, write_results
+from pdf_generator import PDFGenerator, stamp_artifact, _worker_state
+
+TEXT = "Exemplaire personnel n° 0123456789abcdef · 192.168.1.x · 01/01/2025"
+
+
+def timed(fn, repeat: int) -> float:
+    """Median wall time of fn over repeat runs"""
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+
+def bench_size(pages: int, repeat: int):
+    """Benchmark one ebook size"""
+    content = synthetic_ebook_pages(pages)
+    with tempfile.TemporaryDirectory() as storage:
+        generator = PDFGenerator(storage)
+        output = Path(storage) / "out.pdf"
+
+        full = timed(lambda: generator.build_single_pdf(content, output), repeat)
+        key = generator.render_artifact(content)
+        cached = timed(lambda: generator.build_pdf(content, output), repeat)
+
+        def stamp_cold():
+            _worker_state.stamp_base = None
+            stamp_artifact(storage, key, "0123456789abcdef", TEXT)
+
+        stamp_cold_s = timed(stamp_cold, repeat)
+        stamp_s = timed(lambda: stamp_artifact(storage, key, "0123456789abcdef", TEXT), repeat)
+
+        base_size = generator.cache.store.size(generator.cache.artifact_name(key))
+        stamped_size = generator.cache.store.size(generator.cache.personalized_name("0123456789abcdef"))
+
+    return {
+        "target_pages": pages,
+        "full_render_s": full,
+        "cached_render_s": cached,
+        "stamp_cold_s": stamp_cold_s,
+        "stamp_s": stamp_s,
+        "stamp_vs_full": stamp_s / full,
+        "base_bytes": base_size,
+        "stamped_bytes": stamped_size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/watermark-<rev>.json)")
+    args = parser.parse_args()
+
+    print(f"{'pages':>6} {'full s':>8} {'cached s':>9} {'stamp cold':>11} {'stamp s':>8} {'vs full':>8} {'size':>12}")
+    results = []
+    for pages in args.pages:
+        result = bench_size(pages, args.repeat)
+        results.append(result)
+        print(f"{pages:>6} {result['full_render_s']:8.3f} {result['cached_render_s']:9.3f} "
+              f"{result['stamp_cold_s']:11.3f} {result['stamp_s']:8.3f} {result['stamp_vs_full']:8.1%} "
+              f"{result['base_bytes'] // 1024:>5}→{result['stamped_bytes'] // 1024}K")
+
+    write_results("watermark", {"sizes": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Shared helpers for the benchmark scripts: synthetic content, latency
+statistics, resource sampling and JSON result files."""
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import platform
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+SENTENCE = "Gagner de l'argent en étant étudiant demande de la méthode et de la régularité. "
+
+# Roughly one A4 page of body text with the default styles
+PARAGRAPHS_PER_PAGE = 5
+
+
+def synthetic_ebook(chapters: int, sections: int = 4, paragraphs: int = 6) -> Dict[str, Any]:
+    """Build ebook content shaped like the real one"""
+    return {
+        "title": "Benchmark Ebook",
+        "subtitle": "Contenu synthétique",
+        "author": "Bench",
+        "chapters": [
+            {
+                "title": f"Chapitre synthétique {c}",
+                "description": "Description du chapitre.",
+                "content": [
+                    {
+                        "subtitle": f"Section {c}.{s}",
+                        "text": [SENTENCE * 8 for _ in range(paragraphs)],
+                        "tips": "Un conseil pratique pour avancer plus vite.",
+                    }
+                    for s in range(sections)
+                ],
+            }
+            for c in range(chapters)
+        ],
+    }
+
+
+def synthetic_ebook_pages(pages: int) -> Dict[str, Any]:
+    """Build a synthetic ebook of approximately the given number of pages"""
+    chapters = max(1, pages // 10)
+    paragraphs = max(1, pages * PARAGRAPHS_PER_PAGE // (chapters * 4))
+    return synthetic_ebook(chapters, sections=4, paragraphs=paragraphs)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(durations: List[float], elapsed: Optional[float] = None) -> Dict[str, float]:
+    """Latency percentiles in milliseconds, plus throughput when elapsed is given"""
+    summary = {
+        "count": len(durations),
+        "mean_ms": 1000 * sum(durations) / len(durations) if durations else 0.0,
+        "p50_ms": 1000 * percentile(durations, 50),
+        "p95_ms": 1000 * percentile(durations, 95),
+        "p99_ms": 1000 * percentile(durations, 99),
+        "max_ms": 1000 * max(durations, default=0.0),
+    }
+    if elapsed:
+        summary["throughput_rps"] = len(durations) / elapsed
+    return summary
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process in MiB"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class LoopLagMonitor:
+    """Measures event-loop lag by timing a short periodic sleep"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> Dict[str, float]:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        return {
+            "lag_p50_ms": 1000 * percentile(self.lags, 50),
+            "lag_p99_ms": 1000 * percentile(self.lags, 99),
+            "lag_max_ms": 1000 * max(self.lags, default=0.0),
+        }
+
+
+def git_revision() -> str:
+    """Short hash of the checked-out commit, 'unknown' outside a git tree"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def write_results(name: str, results: Dict[str, Any], output: Optional[str] = None) -> Path:
+    """Write results with run metadata to JSON, return the file path"""
+    revision = git_revision()
+    document = {
+        "benchmark": name,
+        "revision": revision,
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    path = Path(output) if output else RESULTS_DIR / f"{name}-{revision}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(document, indent=2))
+    print(f"Results written to {path}")
+    return path
@@ -0,0 +1,73 @@
+"""Compare two benchmark result files and flag regressions.
+
+Walks both result trees, pairs up numeric metrics by path and prints the
+relative change. Latency, duration, lag and memory metrics (lower is
+better) and throughput (higher is better) beyond the threshold count as
+regressions, and make the script exit non-zero.
+
+    python benchmarks/compare.py results/http-abc123.json results/http-def456.json
+"""
+import sys
+import json
+import argparse
+from typing import Any, Dict, Iterator, Tuple
+
+LOWER_IS_BETTER = ("_ms", "_s", "rss_mb", "bytes")
+HIGHER_IS_BETTER = ("throughput_rps",)
+
+
+def flatten(tree: Any, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    """Yield (path, value) for every numeric leaf"""
+    if isinstance(tree, dict):
+        for key, value in tree.items():
+            yield from flatten(value, f"{prefix}.{key}" if prefix else str(key))
+    elif isinstance(tree, list):
+        for index, value in enumerate(tree):
+            yield from flatten(value, f"{prefix}[{index}]")
+    elif isinstance(tree, (int, float)) and not isinstance(tree, bool):
+        yield prefix, float(tree)
+
+
+def direction(path: str) -> int:
+    """+1 if higher is better, -1 if lower is better, 0 if informational"""
+    if path.endswith(HIGHER_IS_BETTER):
+        return 1
+    if path.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+def compare(baseline: Dict[str, Any], candidate: Dict[str, Any], threshold: float) -> int:
+    """Print metric deltas, return the number of regressions"""
+    before = dict(flatten(baseline["results"]))
+    after = dict(flatten(candidate["results"]))
+    regressions = 0
+
+    print(f"{baseline.get('revision')} -> {candidate.get('revision')} ({baseline.get('benchmark')})")
+    for path in sorted(before.keys() & after.keys()):
+        sign = direction(path)
+        if not sign or before[path] == 0:
+            continue
+        change = (after[path] - before[path]) / before[path]
+        regressed = change * sign < -threshold
+        regressions += regressed
+        marker = "REGRESSION" if regressed else ""
+        print(f"{path:<60} {before[path]:12.2f} {after[path]:12.2f} {change:+8.1%} {marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change tolerated (default 0.10)")
+    args = parser.parse_args()
+
+    with open(args.baseline) as baseline, open(args.candidate) as candidate:
+        regressions = compare(json.load(baseline), json.load(candidate), args.threshold)
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Services built from the environment, shared by the API (server.py) and the render workers (worker.py).
+
+Settings are read when a service is built, not on import, so a ``.env``
+loaded by the entry point applies.
+"""
+import os
+import tempfile
+
+from cache import ChangeStreamInvalidator, TTLCache
+from jobs import JobQueue
+from pdf_generator import PDFGenerator
+from render_pool import RenderPool
+from services import EbookService
+from tokens import TokenRegistry
+from tracking import DownloadWriter
+
+# Collections whose changes invalidate cache namespaces. Download counts
+# change too often to invalidate per insert, stats use TTL expiry only
+CACHE_INVALIDATIONS = {
+    "ebook_content": ["ebook_content", "catalog", "toc", "chapter"],
+    "testimonials": ["testimonials"],
+}
+
+
+def create_pdf_generator() -> PDFGenerator:
+    """Build the PDF generator on the artifact store, a local directory or an s3://bucket/prefix URL"""
+    return PDFGenerator(
+        os.environ.get('PDF_STORAGE_PATH', '/tmp/pdfs/'),
+        # Output optimizations of cached PDFs (web, print or none), overridable per request with ?profile=
+        output_profile=os.environ.get('PDF_OUTPUT_PROFILE', 'web')
+    )
+
+
+def create_token_registry(db) -> TokenRegistry:
+    """Build the download token registry"""
+    max_downloads = os.environ.get('TOKEN_MAX_DOWNLOADS')
+    return TokenRegistry(
+        db.download_tokens,
+        ttl_hours=float(os.environ.get('PDF_EXPIRY_HOURS', '24')),
+        max_downloads=int(max_downloads) if max_downloads else None
+    )
+
+
+def create_download_writer(db) -> DownloadWriter:
+    """Build the batched download_tracking writer"""
+    return DownloadWriter(
+        db.download_tracking,
+        batch_size=int(os.environ.get('DOWNLOAD_BATCH_SIZE', '100')),
+        flush_interval=float(os.environ.get('DOWNLOAD_FLUSH_SECONDS', '1')),
+        spill_path=os.environ.get('DOWNLOAD_SPILL_PATH', os.path.join(tempfile.gettempdir(), 'download_tracking.spill.jsonl'))
+    )
+
+
+def create_ebook_service(db, pdf_generator: PDFGenerator, render_pool: RenderPool,
+                         download_writer: DownloadWriter, tokens: TokenRegistry) -> EbookService:
+    """Build the ebook service"""
+    return EbookService(db, pdf_generator, render_pool, download_writer=download_writer, tokens=tokens,
+                        watermark=os.environ.get('WATERMARK_DOWNLOADS', 'false').lower() == 'true')
+
+
+def create_job_queue(db) -> JobQueue:
+    """Build the durable PDF job queue"""
+    return JobQueue(
+        db.pdf_jobs,
+        lease_seconds=float(os.environ.get('JOB_LEASE_SECONDS', '60')),
+        max_attempts=int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+    )
+
+
+def create_cache_invalidator(db, cache: TTLCache) -> ChangeStreamInvalidator:
+    """Build the watcher invalidating cached content when Mongo changes"""
+    return ChangeStreamInvalidator(db, cache, CACHE_INVALIDATIONS)
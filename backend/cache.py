@@ -0,0 +1,141 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+from pymongo.errors import OperationFailure
+from metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """In-process read-through cache with per-key TTLs.
+
+    Concurrent misses on a key are coalesced: the first caller runs the
+    loader and the others await the same result, so N simultaneous misses
+    cost a single Mongo query. Loader errors and None results (unknown
+    items) are not cached, and at most ``max_entries`` values are kept,
+    least recently used first out, so keys taken from requests cannot grow
+    it without bound. Keys scoped to one item of a namespace are written
+    ``<namespace>:<item>``.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: float) -> Any:
+        """Get a cached value, loading it with loader() on a miss"""
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            record_cache(self.namespace(key), hit=True)
+            return entry[1]
+
+        record_cache(self.namespace(key), hit=False)
+        loading = self._loading.get(key)
+        if loading is None:
+            loading = asyncio.ensure_future(self._load(key, loader, ttl))
+            self._loading[key] = loading
+            loading.add_done_callback(lambda done: self._forget_load(key, done))
+        return await asyncio.shield(loading)
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: float) -> Any:
+        """Run the loader and store its result unless invalidated meanwhile"""
+        value = await loader()
+        # invalidate() drops the load in flight, its result may be stale
+        if value is not None and self._loading.get(key) is asyncio.current_task():
+            self._store(key, value, ttl)
+        return value
+
+    def _store(self, key: str, value: Any, ttl: float):
+        """Add a value, dropping expired entries then the least recently used"""
+        now = time.monotonic()
+        for expired in [name for name, (expires, _) in self._entries.items() if expires <= now]:
+            del self._entries[expired]
+        self._entries[key] = (now + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _forget_load(self, key: str, done: asyncio.Future):
+        """Forget a finished load unless a newer one replaced it"""
+        if self._loading.get(key) is done:
+            del self._loading[key]
+
+    def invalidate(self, *keys: str):
+        """Drop cached values, including any load already in flight"""
+        for key in keys:
+            self._entries.pop(key, None)
+            self._loading.pop(key, None)
+
+    @staticmethod
+    def namespace(key: str) -> str:
+        return key.split(":", 1)[0]
+
+    def invalidate_namespace(self, *namespaces: str):
+        """Drop every key of the namespaces, e.g. one entry per ebook"""
+        self.invalidate(*[
+            key for key in {*self._entries, *self._loading}
+            if self.namespace(key) in namespaces
+        ])
+
+    def clear(self):
+        """Drop every cached value"""
+        self.invalidate(*list(self._entries), *list(self._loading))
+
+
+class ChangeStreamInvalidator:
+    """Invalidates cache namespaces when the backing Mongo collections change.
+
+    Change streams need a replica set or sharded cluster; on a standalone
+    mongod the watcher gives up and the cache falls back to TTL expiry.
+    """
+
+    def __init__(self, db, cache: TTLCache, collections: Dict[str, List[str]], retry_delay: float = 5.0):
+        # collection name -> cache namespaces it backs
+        self.db = db
+        self.cache = cache
+        self.collections = collections
+        self.retry_delay = retry_delay
+        self.listeners: List[Callable[[str], None]] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def add_listener(self, listener: Callable[[str], None]):
+        """Call listener(collection) after a change has invalidated the cache"""
+        self.listeners.append(listener)
+
+    def start(self):
+        """Start one watcher task per collection"""
+        for collection in self.collections:
+            self._tasks.append(asyncio.create_task(self._watch(collection)))
+
+    def stop(self):
+        """Stop the watcher tasks"""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+
+    async def _watch(self, collection: str):
+        """Watch a collection and invalidate its namespaces on every change"""
+        namespaces = self.collections[collection]
+        while True:
+            try:
+                async with self.db[collection].watch() as stream:
+                    # Anything cached before the stream opened may be stale
+                    self.cache.invalidate_namespace(*namespaces)
+                    async for _ in stream:
+                        self.cache.invalidate_namespace(*namespaces)
+                        for listener in self.listeners:
+                            listener(collection)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                logger.warning(f"Change streams unavailable for {collection}, using TTL expiry only: {str(e)}")
+                return
+            except Exception as e:
+                logger.error(f"Change stream on {collection} failed: {str(e)}")
+                self.cache.invalidate_namespace(*namespaces)
+                await asyncio.sleep(self.retry_delay)
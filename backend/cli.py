@@ -0,0 +1,257 @@
+"""Command-line tools for the ebook backend.
+
+Render every ebook in Mongo into the artifact store, in the default output
+profile and for print, then show the timings of the run:
+
+    python cli.py render --profile web --profile print
+    python cli.py summary batch-render.json
+
+``render`` also takes JSON files or directories of them instead of Mongo.
+"""
+import os
+import json
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import typer
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from pdf_generator import PDFGenerator, render_artifact
+from default_content import DEFAULT_EBOOK_SLUG, get_default_content
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+app = typer.Typer(help="Batch tools for the ebook backend", no_args_is_help=True)
+
+# Render phases shown in the summary, see PDFGenerator.timings
+PHASES = ("story", "layout", "merge", "optimize", "store")
+
+
+@dataclass
+class RenderJob:
+    """One ebook rendered in one output profile"""
+    slug: str
+    output_profile: str
+    content: Dict[str, Any]
+    key: str
+
+    @property
+    def id(self) -> str:
+        return f"{self.slug}:{self.output_profile}"
+
+
+class Manifest:
+    """Progress of a batch render, saved after every job so an interrupted run can resume"""
+
+    def __init__(self, path: Path, resume: bool = True):
+        self.path = path
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        if resume and path.exists():
+            self.jobs = json.loads(path.read_text(encoding="utf-8"))["jobs"]
+
+    def done(self, job: RenderJob) -> bool:
+        """Whether a previous run already stored this job's artifact"""
+        entry = self.jobs.get(job.id)
+        return entry is not None and entry["key"] == job.key and entry["status"] != "failed"
+
+    def record(self, job: RenderJob, status: str, **details):
+        self.jobs[job.id] = {
+            "slug": job.slug,
+            "output_profile": job.output_profile,
+            "key": job.key,
+            "status": status,
+            **details,
+            "finished_at": datetime.utcnow().isoformat(),
+        }
+        self.save()
+
+    def save(self):
+        # Written aside then renamed, so an interruption never leaves half a manifest
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        temp_path.write_text(json.dumps({"updated_at": datetime.utcnow().isoformat(), "jobs": self.jobs},
+                                        indent=2), encoding="utf-8")
+        os.replace(temp_path, self.path)
+
+
+def load_json_contents(paths: List[Path]) -> Iterator[Dict[str, Any]]:
+    """Yield ebook contents from JSON files, or from every *.json file of directories"""
+    for path in paths:
+        files = sorted(path.glob("*.json")) if path.is_dir() else [path]
+        for file in files:
+            data = json.loads(file.read_text(encoding="utf-8"))
+            # A file holds one ebook, or a list of them as exported from ebook_content
+            contents = data if isinstance(data, list) else [data]
+            for i, content in enumerate(contents):
+                content.setdefault("slug", file.stem if len(contents) == 1 else f"{file.stem}-{i + 1}")
+                yield content
+
+
+def load_mongo_contents(mongo_url: str, db_name: str) -> Iterator[Dict[str, Any]]:
+    """Yield the latest version of every ebook in the ebook_content collection"""
+    client = MongoClient(mongo_url)
+    try:
+        documents = list(client[db_name].ebook_content.aggregate([
+            {"$sort": {"slug": 1, "version": -1}},
+            {"$group": {"_id": "$slug", "content": {"$first": "$$ROOT"}}},
+        ]))
+    finally:
+        client.close()
+
+    slugs = set()
+    for document in documents:
+        content = document["content"]
+        content.pop("_id", None)
+        # Documents from before slugs belong to the default ebook
+        content["slug"] = document["_id"] or DEFAULT_EBOOK_SLUG
+        slugs.add(content["slug"])
+        yield content
+    # The API serves the built-in ebook until one is stored
+    if DEFAULT_EBOOK_SLUG not in slugs:
+        yield get_default_content()
+
+
+def plan_jobs(generator: PDFGenerator, contents: Iterator[Dict[str, Any]], output_profiles: List[str],
+              slugs: List[str]) -> List[RenderJob]:
+    """Build a job per ebook and output profile"""
+    jobs: Dict[str, RenderJob] = {}
+    for content in contents:
+        if slugs and content["slug"] not in slugs:
+            continue
+        for output_profile in output_profiles:
+            job = RenderJob(content["slug"], output_profile, content,
+                            generator.get_cache_key(content, output_profile))
+            if job.id in jobs:
+                logger.warning(f"Ebook {job.slug} is given twice, rendering the last one")
+            jobs[job.id] = job
+    return list(jobs.values())
+
+
+def format_size(size: Optional[int]) -> str:
+    return "-" if size is None else f"{size / 1024:.0f}K"
+
+
+def print_summary(entries: List[Dict[str, Any]]):
+    """Print per-job timings and totals"""
+    width = max([len("job")] + [len(f"{entry['slug']}:{entry['output_profile']}") for entry in entries])
+    typer.echo(f"{'job':<{width}} {'status':>9} {'render s':>9} "
+               + " ".join(f"{phase:>8}" for phase in PHASES) + f" {'size':>8}")
+    for entry in entries:
+        timings = entry.get("timings") or {}
+        phases = " ".join(f"{timings[phase]:8.2f}" if phase in timings else f"{'-':>8}" for phase in PHASES)
+        seconds = f"{entry['seconds']:9.2f}" if entry.get("seconds") is not None else f"{'-':>9}"
+        typer.echo(f"{entry['slug'] + ':' + entry['output_profile']:<{width}} {entry['status']:>9} "
+                   f"{seconds} {phases} {format_size(entry.get('bytes')):>8}")
+        if entry.get("error"):
+            typer.echo(f"{'':<{width}}   {entry['error']}")
+
+    counts = {status: sum(1 for entry in entries if entry["status"] == status)
+              for status in ("rendered", "unchanged", "failed")}
+    typer.echo(", ".join(f"{count} {status}" for status, count in counts.items()))
+
+
+@app.command()
+def render(
+    paths: Optional[List[Path]] = typer.Argument(
+        None, exists=True, help="JSON files or directories of ebook content, instead of the ebook_content collection"
+    ),
+    output_profiles: Optional[List[str]] = typer.Option(
+        None, "--profile", "-p", help="Output profile to render, repeat for several [default: PDF_OUTPUT_PROFILE]"
+    ),
+    slugs: Optional[List[str]] = typer.Option(None, "--slug", "-s", help="Only render these ebooks"),
+    workers: int = typer.Option(os.cpu_count() or 1, "--workers", "-w", min=1, help="Render processes"),
+    storage_path: str = typer.Option("/tmp/pdfs/", "--storage", envvar="PDF_STORAGE_PATH",
+                                     help="Artifact store, a local directory or an s3://bucket/prefix URL"),
+    manifest_path: Path = typer.Option(Path("batch-render.json"), "--manifest", "-m",
+                                       help="Progress file, rerun with the same one to resume"),
+    resume: bool = typer.Option(True, help="Skip jobs the manifest records as done"),
+):
+    """Render ebooks into the artifact store, skipping those whose content is unchanged"""
+    logging.basicConfig(level=logging.WARNING)
+    default_profile = os.environ.get('PDF_OUTPUT_PROFILE', 'web')
+    try:
+        generator = PDFGenerator(storage_path, output_profile=default_profile)
+        output_profiles = [generator.get_profile(name).name for name in output_profiles or [default_profile]]
+    except ValueError as e:
+        raise typer.BadParameter(str(e), param_hint="--profile")
+
+    if paths:
+        contents = load_json_contents(paths)
+    else:
+        contents = load_mongo_contents(os.environ['MONGO_URL'], os.environ['DB_NAME'])
+    jobs = plan_jobs(generator, contents, output_profiles, slugs or [])
+    if not jobs:
+        typer.echo("No ebooks to render")
+        raise typer.Exit(1)
+
+    manifest = Manifest(manifest_path, resume)
+    pending = []
+    for job in jobs:
+        if not generator.cache.has_artifact(job.key):
+            pending.append(job)
+        elif not manifest.done(job):
+            manifest.record(job, "unchanged", bytes=generator.cache.store.size(generator.cache.artifact_name(job.key)))
+    typer.echo(f"{len(jobs)} jobs, {len(jobs) - len(pending)} already in the artifact store, "
+               f"rendering {len(pending)} on {min(workers, max(len(pending), 1))} workers")
+
+    started = time.monotonic()
+    render_seconds = 0.0
+    if pending:
+        # Largest ebooks first, so a long render does not start last and hold up the batch
+        pending.sort(key=lambda job: len(json.dumps(job.content, default=str)), reverse=True)
+        # spawn, as in RenderPool: workers start clean instead of copying this process
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(pending)),
+                                       mp_context=multiprocessing.get_context("spawn"))
+        try:
+            futures = {
+                executor.submit(render_artifact, storage_path, job.content, False, job.output_profile): job
+                for job in pending
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                job = futures[future]
+                try:
+                    key, timings, _, optimization = future.result()
+                except Exception as e:
+                    manifest.record(job, "failed", error=f"{type(e).__name__}: {e}")
+                    typer.echo(f"[{done}/{len(pending)}] {job.id} failed: {e}", err=True)
+                    continue
+                seconds = sum(timings.values())
+                render_seconds += seconds
+                manifest.record(job, "rendered", seconds=seconds, timings=timings, optimization=optimization,
+                                bytes=generator.cache.store.size(generator.cache.artifact_name(key)))
+                typer.echo(f"[{done}/{len(pending)}] {job.id} rendered in {seconds:.2f}s")
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            typer.echo(f"Interrupted, rerun with --manifest {manifest_path} to resume", err=True)
+            raise typer.Exit(130)
+        executor.shutdown()
+
+    entries = [manifest.jobs[job.id] for job in jobs]
+    print_summary(entries)
+    if pending:
+        elapsed = time.monotonic() - started
+        # Render seconds over wall seconds: how much the pool ran in parallel
+        typer.echo(f"This run: {len(pending)} jobs in {elapsed:.1f}s, {render_seconds:.1f}s of rendering "
+                   f"({render_seconds / elapsed:.1f}x parallel)")
+    if any(entry["status"] == "failed" for entry in entries):
+        raise typer.Exit(1)
+
+
+@app.command()
+def summary(manifest_path: Path = typer.Argument(Path("batch-render.json"), exists=True,
+                                                  help="Manifest written by render")):
+    """Show the per-job timings recorded in a batch render manifest"""
+    print_summary(list(Manifest(manifest_path).jobs.values()))
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,53 @@
+import random
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ShardedCounter:
+    """Counter spread over several documents to avoid hot-document contention.
+
+    Each increment hits one random shard ``{_id: "<name>:<n>", count}``;
+    reading sums the shards through the ``_id`` index, which is O(shards)
+    regardless of how many events were counted.
+    """
+
+    def __init__(self, collection, name: str, shards: int = 8):
+        self.collection = collection
+        self.name = name
+        self.shards = shards
+
+    def _shard_ids(self):
+        return [f"{self.name}:{shard}" for shard in range(self.shards)]
+
+    async def increment(self, amount: int = 1):
+        """Add amount to a random shard"""
+        shard_id = f"{self.name}:{random.randrange(self.shards)}"
+        await self.collection.update_one(
+            {"_id": shard_id},
+            {"$inc": {"count": amount}},
+            upsert=True
+        )
+
+    async def get(self) -> int:
+        """Get the counter value"""
+        total = 0
+        async for shard in self.collection.find({"_id": {"$in": self._shard_ids()}}):
+            total += shard.get("count", 0)
+        return total
+
+    async def reconcile(self, exact: int) -> int:
+        """Correct drift against an exact count, return the applied correction.
+
+        Increments racing with the recount can leave a small error, which
+        the next reconciliation pass corrects.
+        """
+        drift = exact - await self.get()
+        if drift:
+            await self.collection.update_one(
+                {"_id": f"{self.name}:0"},
+                {"$inc": {"count": drift}},
+                upsert=True
+            )
+            logger.warning(f"Corrected {self.name} counter drift of {drift}")
+        return drift
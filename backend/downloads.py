@@ -0,0 +1,155 @@
+import os
+import re
+import asyncio
+from typing import AsyncIterator, Optional, Tuple
+from urllib.parse import quote
+from fastapi import Request
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+from storage import ArtifactStore, CHUNK_SIZE
+
+# Artifacts are named by content hash and never change once written
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range Range header into inclusive (start, end).
+
+    Returns None when the header should be ignored (malformed or multiple
+    ranges) and raises ValueError when the range is unsatisfiable.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match / If-Range header against an ETag"""
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def requested_range(request: Request, etag: str, size: int) -> Optional[Tuple[int, int]]:
+    """Get the inclusive byte range a request asks for, None for the whole file.
+
+    Raises ValueError when the range is unsatisfiable. A stale If-Range
+    validator means the client needs the whole new file.
+    """
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if not range_header or (if_range and if_range.strip() != etag):
+        return None
+    return parse_range(range_header, size)
+
+
+def transfer_length(request: Request, etag: str, size: int) -> int:
+    """Get how many bytes artifact_response sends for a request to a file of size bytes.
+
+    Revalidations and unsatisfiable ranges send none; whatever the Range
+    header looks like, the rest is the number of bytes actually served.
+    """
+    etag = f'"{etag}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return 0
+    try:
+        byte_range = requested_range(request, etag, size)
+    except ValueError:
+        return 0
+    if byte_range is None:
+        return size
+    start, end = byte_range
+    return end - start + 1
+
+
+async def artifact_response(request: Request, store: ArtifactStore, name: str, etag: str, filename: str,
+                            cache_control: str, redirect: bool = False,
+                            media_type: str = "application/pdf") -> Response:
+    """Serve a stored artifact with strong ETag, conditional GET and single-range support.
+
+    With redirect, stores that can presign URLs send the client straight to
+    the object store instead of proxying the bytes through the API.
+    Raises ArtifactNotFound if the artifact does not exist.
+    """
+    etag = f'"{etag}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if redirect:
+        url = await asyncio.to_thread(store.presigned_url, name, filename)
+        if url:
+            # The presigned URL expires, so the redirect itself must not be cached
+            return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-store"})
+
+    size = await asyncio.to_thread(store.size, name)
+    headers["Content-Disposition"] = f"attachment; filename*=utf-8''{quote(filename)}"
+
+    try:
+        byte_range = requested_range(request, etag, size)
+    except ValueError:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    return StreamingResponse(
+        store.stream(name, start, end),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers
+    )
+
+
+async def iter_temp_file(path: str) -> AsyncIterator[bytes]:
+    """Iterate over a file in chunks and delete it once done, abandoned or cancelled by a disconnect"""
+    try:
+        with open(path, "rb") as file:
+            while True:
+                chunk = await asyncio.to_thread(file.read, CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.unlink(path)
+
+
+def rendered_response(data: Optional[bytes], path: Optional[str], filename: str) -> Response:
+    """Send a one-off render as the response body, from memory or streamed from its temp file"""
+    headers = {
+        "Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}",
+        "Cache-Control": "no-store",
+    }
+    if path is None:
+        return Response(content=data, media_type="application/pdf", headers=headers)
+    headers["Content-Length"] = str(os.path.getsize(path))
+    return StreamingResponse(iter_temp_file(path), media_type="application/pdf", headers=headers)
@@ -0,0 +1,240 @@
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, AsyncIterator
+from pymongo import ASCENDING, ReturnDocument
+from models import PDFJob
+from render_pool import RenderQueueFull
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("done", "failed")
+
+
+class JobQueue:
+    """Durable queue of PDF jobs in the ``pdf_jobs`` collection, shared by worker processes.
+
+    Workers claim the oldest queued job with ``find_one_and_update``, which
+    marks it rendering under their name with a lease. While it renders, the
+    worker renews the lease with heartbeats; a job whose lease runs out (the
+    worker crashed or lost Mongo) is claimed again by another worker, up to
+    ``max_attempts`` claims. Results are only written by the worker holding
+    the job, so a worker that lost its lease cannot overwrite the retry.
+    """
+
+    def __init__(self, collection, lease_seconds: float = 60, max_attempts: int = 3):
+        self.collection = collection
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    async def ensure_indexes(self):
+        """Create the indexes used to claim jobs"""
+        await self.collection.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+        await self.collection.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+
+    def _lease(self) -> datetime:
+        return datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+
+    async def claim(self, worker_id: str) -> Optional[PDFJob]:
+        """Take the oldest queued or abandoned job, None if there is none"""
+        now = datetime.utcnow()
+        document = await self.collection.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "queued", "available_at": {"$not": {"$gt": now}}},
+                    {"status": "rendering", "lease_expires_at": {"$lt": now}},
+                ],
+                "attempts": {"$lt": self.max_attempts},
+            },
+            {
+                "$set": {"status": "rendering", "worker": worker_id, "lease_expires_at": self._lease(),
+                         "updated_at": now},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+        if document is None:
+            return None
+        document.pop("_id", None)
+        job = PDFJob(**document)
+        if job.attempts > 1:
+            logger.warning(f"PDF job {job.id} claimed by {worker_id}, attempt {job.attempts}/{self.max_attempts}")
+        return job
+
+    async def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Extend the lease of a claimed job, False if the worker no longer holds it"""
+        result = await self.collection.update_one(
+            {"id": job_id, "worker": worker_id, "status": "rendering"},
+            {"$set": {"lease_expires_at": self._lease()}}
+        )
+        return result.matched_count == 1
+
+    async def complete(self, job_id: str, worker_id: str, **fields) -> bool:
+        """Record the outcome of a claimed job, False if the worker no longer holds it"""
+        fields.update(lease_expires_at=None, updated_at=datetime.utcnow())
+        result = await self.collection.update_one(
+            {"id": job_id, "worker": worker_id, "status": "rendering"},
+            {"$set": fields}
+        )
+        return result.matched_count == 1
+
+    async def release(self, job_id: str, worker_id: str, delay: float = 0, count_attempt: bool = True) -> bool:
+        """Put a claimed job back in the queue, claimable again after delay seconds.
+
+        With ``count_attempt=False`` the claim is given back too, for jobs that
+        never got to render (the worker's render pool was saturated).
+        """
+        now = datetime.utcnow()
+        update = {"$set": {"status": "queued", "worker": None, "lease_expires_at": None,
+                           "available_at": now + timedelta(seconds=delay), "updated_at": now}}
+        if not count_attempt:
+            update["$inc"] = {"attempts": -1}
+        result = await self.collection.update_one(
+            {"id": job_id, "worker": worker_id, "status": "rendering"}, update
+        )
+        return result.matched_count == 1
+
+    async def fail_abandoned(self) -> int:
+        """Fail jobs whose lease ran out on their last attempt, return how many"""
+        result = await self.collection.update_many(
+            {
+                "status": "rendering",
+                "lease_expires_at": {"$lt": datetime.utcnow()},
+                "attempts": {"$gte": self.max_attempts},
+            },
+            {"$set": {
+                "status": "failed",
+                "error": f"Render worker lost the job {self.max_attempts} times",
+                "lease_expires_at": None,
+                "updated_at": datetime.utcnow(),
+            }}
+        )
+        if result.modified_count:
+            logger.error(f"Failed {result.modified_count} PDF jobs abandoned by their workers")
+        return result.modified_count
+
+    async def depth(self) -> Dict[str, Any]:
+        """Count queued and rendering jobs, with the age of the oldest queued one"""
+        counts = {"queued": 0, "rendering": 0}
+        groups = await self.collection.aggregate([
+            {"$match": {"status": {"$in": list(counts)}}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+        ]).to_list(None)
+        for group in groups:
+            counts[group["_id"]] = group["count"]
+        oldest = await self.collection.find_one(
+            {"status": "queued"}, {"created_at": 1}, sort=[("created_at", ASCENDING)]
+        )
+        counts["oldest_queued_seconds"] = (
+            (datetime.utcnow() - oldest["created_at"]).total_seconds() if oldest else 0.0
+        )
+        return counts
+
+
+class PDFJobManager:
+    """Runs PDF generation as background jobs tracked in the ``pdf_jobs`` collection.
+
+    Job documents live in Mongo so that any replica can answer status polls.
+    The render itself runs on the replica that accepted the job, or with a
+    ``queue`` is left to standalone workers (see ``worker.py``).
+    """
+
+    def __init__(self, db, ebook_service, max_queue_wait: float = 300.0, job_ttl_hours: int = 24,
+                 queue: Optional[JobQueue] = None):
+        self.db = db
+        self.ebook_service = ebook_service
+        self.max_queue_wait = max_queue_wait
+        self.job_ttl_hours = job_ttl_hours
+        self.queue = queue
+        self._tasks = set()
+        self._changed: Dict[str, asyncio.Event] = {}
+
+    async def ensure_indexes(self):
+        """Create the indexes used by job lookups and expiry"""
+        await self.db.pdf_jobs.create_index("id", unique=True)
+        await self.db.pdf_jobs.create_index(
+            "created_at", expireAfterSeconds=self.job_ttl_hours * 3600
+        )
+        if self.queue:
+            await self.queue.ensure_indexes()
+
+    async def submit(self, user_agent: str, ip_address: str, slug: Optional[str] = None,
+                     output_profile: Optional[str] = None) -> PDFJob:
+        """Create a job and start it in the background, or queue it for the workers"""
+        job = PDFJob(slug=slug, output_profile=output_profile, user_agent=user_agent, ip_address=ip_address)
+        await self.db.pdf_jobs.insert_one(job.dict())
+        if self.queue:
+            return job
+
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def get_job(self, job_id: str) -> Optional[PDFJob]:
+        """Get a job by id"""
+        document = await self.db.pdf_jobs.find_one({"id": job_id})
+        if not document:
+            return None
+        document.pop("_id", None)
+        return PDFJob(**document)
+
+    async def watch(self, job_id: str, poll_interval: float = 1.0) -> AsyncIterator[PDFJob]:
+        """Yield the job each time its status changes, until it is done or failed"""
+        last_status = None
+        try:
+            while True:
+                job = await self.get_job(job_id)
+                if job is None:
+                    return
+                if job.status != last_status:
+                    last_status = job.status
+                    yield job
+                if job.status in TERMINAL_STATUSES:
+                    return
+
+                # Wake up early for jobs running here, poll for jobs on other replicas
+                changed = self._changed.setdefault(job_id, asyncio.Event())
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # Jobs rendered by a worker or another replica never clear their event
+            self._changed.pop(job_id, None)
+
+    async def _run(self, job: PDFJob):
+        """Generate the PDF for a job, waiting for render capacity if needed"""
+        deadline = time.monotonic() + self.max_queue_wait
+        try:
+            while True:
+                try:
+                    await self._update(job.id, status="rendering")
+                    token = await self.ebook_service.generate_pdf(
+                        job.user_agent, job.ip_address, job.slug, output_profile=job.output_profile
+                    )
+                    break
+                except RenderQueueFull as e:
+                    # Stay queued instead of failing while the pool is saturated
+                    if time.monotonic() + e.retry_after > deadline:
+                        raise
+                    await self._update(job.id, status="queued")
+                    await asyncio.sleep(e.retry_after)
+
+            await self._update(job.id, status="done", token=token)
+        except Exception as e:
+            logger.error(f"PDF job {job.id} failed: {str(e)}")
+            await self._update(job.id, status="failed", error=str(e) or type(e).__name__)
+        finally:
+            self._changed.pop(job.id, None)
+
+    async def _update(self, job_id: str, **fields):
+        """Persist job fields and wake up local watchers"""
+        fields["updated_at"] = datetime.utcnow()
+        await self.db.pdf_jobs.update_one({"id": job_id}, {"$set": fields})
+
+        changed = self._changed.pop(job_id, None)
+        if changed:
+            changed.set()
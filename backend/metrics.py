@@ -0,0 +1,164 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Optional, Tuple
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+)
+from prometheus_client import multiprocess
+
+logger = logging.getLogger(__name__)
+
+# With several uvicorn workers, point PROMETHEUS_MULTIPROC_DIR at an empty
+# directory shared by the workers (wiped on deploy) so /metrics aggregates all
+# of them instead of reporting whichever worker served the scrape.
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+RENDER_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time to response headers by route",
+    ["method", "route", "status"]
+)
+
+RENDER_DURATION = Histogram(
+    "pdf_render_duration_seconds",
+    "Wall time of PDF renders in the render pool, including queueing",
+    buckets=RENDER_BUCKETS
+)
+RENDER_PHASE_DURATION = Histogram(
+    "pdf_render_phase_seconds",
+    "Time spent in each render phase: story (flowables), layout (doc.build), merge and store",
+    ["phase"],
+    buckets=RENDER_BUCKETS
+)
+PDF_OPTIMIZE_SAVED_RATIO = Histogram(
+    "pdf_optimize_saved_ratio",
+    "Share of the PDF size removed by the output optimization stage, by output profile",
+    ["profile"],
+    buckets=(0, 0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.8)
+)
+RENDER_QUEUE_DEPTH = Gauge(
+    "pdf_render_queue_depth",
+    "Renders admitted to the render pool and not yet finished",
+    multiprocess_mode="livesum"
+)
+RENDER_REJECTED = Counter(
+    "pdf_render_rejected_total",
+    "Renders refused because the queue was full or that timed out",
+    ["reason"]
+)
+
+# Global values read from pdf_jobs by each API process, hence livemax rather than a sum
+PDF_JOB_QUEUE_DEPTH = Gauge(
+    "pdf_job_queue_depth",
+    "PDF jobs waiting for (queued) or held by (rendering) a render worker with PDF_JOB_QUEUE=mongo",
+    ["status"],
+    multiprocess_mode="livemax"
+)
+PDF_JOB_OLDEST_QUEUED = Gauge(
+    "pdf_job_oldest_queued_seconds",
+    "Age of the oldest queued PDF job, the signal to scale render workers on",
+    multiprocess_mode="livemax"
+)
+PDF_JOBS_PROCESSED = Counter(
+    "pdf_jobs_processed_total",
+    "PDF jobs handled by render workers by outcome (done, failed, retried, deferred or lease_lost)",
+    ["outcome"]
+)
+
+PDF_GENERATION_THROTTLED = Counter(
+    "pdf_generation_throttled_total",
+    "PDF generation requests refused (rate_limited) or answered with a recent token (deduplicated)",
+    ["reason"]
+)
+
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result (hit or miss)",
+    ["cache", "result"]
+)
+
+MONGO_LATENCY = Histogram(
+    "mongo_operation_duration_seconds",
+    "Latency of Mongo operations by EbookService method",
+    ["operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Delay of a periodic event-loop callback beyond its scheduled time",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+DOWNLOAD_RECORDS = Counter(
+    "download_records_total",
+    "Download tracking records by outcome (written, spilled or dropped)",
+    ["outcome"]
+)
+DOWNLOAD_BUFFER_DEPTH = Gauge(
+    "download_buffer_depth",
+    "Download tracking records waiting for the next flush",
+    multiprocess_mode="livesum"
+)
+DOWNLOAD_FLUSH_DURATION = Histogram(
+    "download_flush_duration_seconds",
+    "Time to write a batch of download records to Mongo"
+)
+
+
+def record_cache(cache: str, hit: bool):
+    """Count a cache lookup"""
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_render(duration: float, timings: dict):
+    """Record a finished render and its phase timings from the worker"""
+    RENDER_DURATION.observe(duration)
+    for phase, seconds in timings.items():
+        RENDER_PHASE_DURATION.labels(phase).observe(seconds)
+
+
+def record_optimization(report: Optional[dict]):
+    """Record and log the size and time deltas of an output optimization from the worker"""
+    if not report:
+        return
+    PDF_OPTIMIZE_SAVED_RATIO.labels(report["profile"]).observe(max(0.0, report["saved_ratio"]))
+    logger.info(
+        f"Optimized PDF ({report['profile']}): {report['bytes_before']} -> {report['bytes_after']} bytes "
+        f"({-report['saved_ratio']:+.1%}) in {report['seconds']:.3f}s"
+    )
+
+
+def record_job_queue(depth: dict):
+    """Publish the depth of the durable PDF job queue"""
+    for status in ("queued", "rendering"):
+        PDF_JOB_QUEUE_DEPTH.labels(status).set(depth[status])
+    PDF_JOB_OLDEST_QUEUED.set(depth["oldest_queued_seconds"])
+
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Measure how late a periodic sleep wakes up, forever"""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, time.perf_counter() - started - interval))
+
+
+def latest() -> Tuple[bytes, str]:
+    """Render all metrics in the Prometheus text format"""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead():
+    """Drop this worker's live gauges from the multiprocess aggregate"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
@@ -15,6 +15,8 @@ class Chapter(BaseModel):
 
 class EbookContent(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    slug: str
+    version: int = 1
     title: str
     subtitle: str
     author: str
@@ -29,6 +31,9 @@ class DownloadTracking(BaseModel):
     user_agent: str
     ip_address: str
     filename: str
+    slug: Optional[str] = None
+    # Printed on every page of a watermarked download, for leak tracing
+    watermark_id: Optional[str] = None
 
 class Statistics(BaseModel):
     students_helped: int = 15000
@@ -36,6 +41,29 @@ class Statistics(BaseModel):
     avg_time_to_results: int = 30
     total_downloads: int = 0
 
+class EbookSummary(BaseModel):
+    slug: str
+    version: int = 1
+    title: str
+    subtitle: str
+    author: str
+    pages: int
+
+class ChapterSummary(BaseModel):
+    number: int
+    title: str
+    description: str
+    section_count: int
+
+class TableOfContents(BaseModel):
+    slug: str
+    version: int = 1
+    title: str
+    subtitle: str
+    author: str
+    pages: int
+    chapters: List[ChapterSummary]
+
 class Testimonial(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
@@ -52,4 +80,45 @@ class PDFGenerationResponse(BaseModel):
     success: bool
     download_url: str
     filename: str
-    token: str
\ No newline at end of file
+    token: str
+    artifact_url: Optional[str] = None
+
+class PDFJob(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    status: str = "queued"  # queued, rendering, done, failed
+    slug: Optional[str] = None
+    output_profile: Optional[str] = None
+    user_agent: str
+    ip_address: str
+    token: Optional[str] = None
+    error: Optional[str] = None
+    # Queue bookkeeping with PDF_JOB_QUEUE=mongo: the claiming worker and its lease
+    attempts: int = 0
+    worker: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    # Not claimed before this time, set when a worker hands the job back for later
+    available_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class PDFJobResponse(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+    events_url: str
+    download_url: Optional[str] = None
+    filename: Optional[str] = None
+    token: Optional[str] = None
+    error: Optional[str] = None
+
+class DownloadToken(BaseModel):
+    token: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    artifact: str
+    slug: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime
+    max_downloads: Optional[int] = None
+    # Bytes sent under a download limit, charged against max_downloads times the file size
+    served_bytes: int = 0
+    # Set when the token serves a watermarked copy instead of the shared artifact
+    watermark_id: Optional[str] = None
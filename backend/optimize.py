@@ -0,0 +1,104 @@
+import io
+import time
+import importlib.util
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Union
+
+# Looked up without importing them, only renders do: without pypdf resources
+# are not deduplicated, without pikepdf there are no object streams nor linearization
+HAS_PYPDF = importlib.util.find_spec("pypdf") is not None
+HAS_PIKEPDF = importlib.util.find_spec("pikepdf") is not None
+
+
+@dataclass(frozen=True)
+class OutputProfile:
+    """What the output stage does to a rendered PDF"""
+    name: str
+    # Merge identical objects, e.g. the fonts and graphic states each cached part carries
+    dedupe: bool = True
+    # Pack objects into compressed object streams (PDF 1.5)
+    object_streams: bool = True
+    # Fast web view: first page objects up front, with hint tables
+    linearize: bool = True
+
+    def cache_key(self) -> str:
+        """Identify the profile in render cache keys"""
+        if not self.enabled:
+            return self.name
+        flags = "".join(flag for flag, on in (
+            ("d", self.dedupe), ("o", self.object_streams and HAS_PIKEPDF),
+            ("l", self.linearize and HAS_PIKEPDF),
+        ) if on)
+        return f"{self.name}:{flags}"
+
+    @property
+    def enabled(self) -> bool:
+        return self.dedupe or self.object_streams or self.linearize
+
+
+OUTPUT_PROFILES = {
+    # Served to browsers: smallest file, first page shown while the rest downloads
+    "web": OutputProfile("web"),
+    # Sent to printers and archived: object streams and linearization only
+    # get in the way of older tools, keep a plain PDF 1.4 structure
+    "print": OutputProfile("print", object_streams=False, linearize=False),
+    "none": OutputProfile("none", dedupe=False, object_streams=False, linearize=False),
+}
+
+
+def get_profile(name: str) -> OutputProfile:
+    """Get an output profile by name, raises ValueError for unknown names"""
+    try:
+        return OUTPUT_PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown output profile {name!r}, expected one of {', '.join(OUTPUT_PROFILES)}")
+
+
+def optimize_pdf(source: Union[Path, BinaryIO], output: Union[Path, BinaryIO],
+                 profile: OutputProfile) -> Dict[str, Any]:
+    """Write source to output through the profile's optimizations.
+
+    Returns a report with the sizes before and after and the time spent.
+    """
+    started = time.perf_counter()
+    data = source.read_bytes() if isinstance(source, Path) else source.read()
+    size_before = len(data)
+
+    if profile.dedupe and HAS_PYPDF:
+        from pypdf import PdfReader, PdfWriter
+        # Added in pypdf 4.3
+        if hasattr(PdfWriter, "compress_identical_objects"):
+            writer = PdfWriter(clone_from=PdfReader(io.BytesIO(data)))
+            writer.compress_identical_objects()
+            buffer = io.BytesIO()
+            writer.write(buffer)
+            data = buffer.getvalue()
+
+    if HAS_PIKEPDF and (profile.object_streams or profile.linearize):
+        import pikepdf
+        buffer = io.BytesIO()
+        with pikepdf.open(io.BytesIO(data)) as pdf:
+            pdf.remove_unreferenced_resources()
+            pdf.save(
+                buffer,
+                linearize=profile.linearize,
+                object_stream_mode=(pikepdf.ObjectStreamMode.generate if profile.object_streams
+                                    else pikepdf.ObjectStreamMode.preserve),
+                compress_streams=True
+            )
+        data = buffer.getvalue()
+
+    if isinstance(output, Path):
+        output.write_bytes(data)
+    else:
+        output.write(data)
+
+    return {
+        "profile": profile.name,
+        "bytes_before": size_before,
+        "bytes_after": len(data),
+        "saved_ratio": 1 - len(data) / size_before if size_before else 0.0,
+        "seconds": time.perf_counter() - started,
+    }
+
@@ -0,0 +1,108 @@
+import gzip
+import json
+import hashlib
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+# FastAPI is imported by the functions that use it: render workers and the
+# CLI import services but never build nor serve payloads
+if TYPE_CHECKING:
+    from fastapi import Request
+    from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip covers every client
+    brotli = None
+
+# Bodies this small are not worth a Content-Encoding
+MIN_COMPRESS_BYTES = 512
+
+# Preference order when the client accepts several encodings equally
+ENCODING_PREFERENCE = ("br", "gzip", "identity")
+
+
+class JsonPayload:
+    """A JSON response body serialized and compressed once, with strong ETags.
+
+    Cached payloads are served as-is on every hit instead of re-encoding
+    and re-compressing the same document per request. Building one is
+    CPU-bound, so do it off the event loop for large documents.
+    """
+
+    def __init__(self, data: Any):
+        from fastapi.encoders import jsonable_encoder
+
+        self.body = json.dumps(
+            jsonable_encoder(data), ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+
+        self.bodies: Dict[str, bytes] = {"identity": self.body}
+        if len(self.body) >= MIN_COMPRESS_BYTES:
+            self.bodies["gzip"] = gzip.compress(self.body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.bodies["br"] = brotli.compress(self.body, mode=brotli.MODE_TEXT, quality=11)
+        # Each encoding is a different representation, so it gets its own strong ETag
+        self.etags = {
+            encoding: self.etag if encoding == "identity" else f'"{digest}-{encoding}"'
+            for encoding in self.bodies
+        }
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """Parse an Accept-Encoding header into {encoding: q}"""
+    accepted: Dict[str, float] = {}
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def negotiate_encoding(header: Optional[str], available) -> str:
+    """Pick the best available encoding the client accepts"""
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*")
+
+    def quality(encoding: str) -> float:
+        if encoding in accepted:
+            return accepted[encoding]
+        if wildcard is not None:
+            return wildcard
+        # identity is acceptable unless explicitly refused
+        return 1.0 if encoding == "identity" else 0.0
+
+    candidates = [encoding for encoding in ENCODING_PREFERENCE if encoding in available and quality(encoding) > 0]
+    if not candidates:
+        return "identity"
+    return max(candidates, key=quality)
+
+
+def payload_response(request: "Request", payload: JsonPayload, cache_control: str) -> "Response":
+    """Serve a payload in the client's preferred encoding, or 304 when it already has it"""
+    from fastapi.responses import Response
+    from downloads import etag_matches
+
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"), payload.bodies)
+    headers = {
+        "ETag": payload.etags[encoding],
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+    # Same content in any encoding: a cached variant of another encoding is still fresh
+    if any(etag_matches(request.headers.get("if-none-match"), etag) for etag in payload.etags.values()):
+        return Response(status_code=304, headers=headers)
+
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=payload.bodies[encoding], media_type="application/json", headers=headers)
@@ -1,119 +1,258 @@
+import io
 import os
-import uuid
-from datetime import datetime, timedelta
-from typing import Dict, Any
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib.colors import HexColor
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import dataclasses
+import importlib.metadata
+from contextlib import contextmanager
+from datetime import datetime
+from typing import TYPE_CHECKING, BinaryIO, Dict, Any, List, Optional, Tuple, Union
 from pathlib import Path
+from functools import partial
+from render_cache import RenderCache, content_hash
+from storage import create_store
+from profiling import run_profiled
+from optimize import OutputProfile, HAS_PIKEPDF, HAS_PYPDF, get_profile, optimize_pdf
 import logging
 
+# ReportLab and pypdf are imported by the methods that render, so processes
+# that only look up the render cache (the API) start without loading them.
+# Chapter caching needs pypdf, without it renders fall back to full builds.
+if TYPE_CHECKING:
+    from reportlab.platypus import SimpleDocTemplate
+
 logger = logging.getLogger(__name__)
 
+# Paragraph styles added to ReportLab's sample stylesheet. Plain data, so the
+# style fingerprint in cache keys is computed without importing ReportLab.
+STYLE_DEFINITIONS: Dict[str, Dict[str, Any]] = {
+    'CustomTitle': dict(parent='Title', fontSize=24, textColor='#4F46E5', alignment='center', spaceAfter=30),
+    'CustomSubtitle': dict(parent='Normal', fontSize=16, textColor='#6B7280', alignment='center', spaceAfter=20),
+    'ChapterTitle': dict(parent='Heading1', fontSize=20, textColor='#4F46E5', spaceBefore=30, spaceAfter=15),
+    'SectionTitle': dict(parent='Heading2', fontSize=16, textColor='#1F2937', spaceBefore=20, spaceAfter=10),
+    'CustomBody': dict(parent='Normal', fontSize=11, textColor='#374151', alignment='justify', spaceAfter=12,
+                       leftIndent=0, rightIndent=0),
+    'TipsStyle': dict(parent='Normal', fontSize=10, textColor='#1E40AF', alignment='left', spaceAfter=15,
+                      leftIndent=20, rightIndent=20, backColor='#EBF4FF', borderColor='#3B82F6',
+                      borderWidth=1, borderPadding=10),
+}
+COLOR_FIELDS = ('textColor', 'backColor', 'borderColor')
+
+def style_key() -> str:
+    """Fingerprint the custom styles and the ReportLab release their sample stylesheet comes from"""
+    try:
+        reportlab_version = importlib.metadata.version('reportlab')
+    except importlib.metadata.PackageNotFoundError:
+        reportlab_version = None
+    definitions = json.dumps(STYLE_DEFINITIONS, sort_keys=True)
+    return hashlib.sha256(f"{reportlab_version}:{definitions}".encode('utf-8')).hexdigest()
+
+class SpooledOutput:
+    """Write-only PDF output kept in memory up to max_size bytes, then moved to a temp file.
+
+    Unlike SpooledTemporaryFile the overflow file is named, so another
+    process can stream it; whoever takes ``path`` must delete it.
+    """
+    
+    def __init__(self, max_size: int, dir: Optional[str] = None):
+        self.max_size = max_size
+        self.dir = dir
+        self.path: Optional[str] = None
+        self._output: BinaryIO = io.BytesIO()
+    
+    def write(self, data: bytes) -> int:
+        if self.path is None and self._output.tell() + len(data) > self.max_size:
+            fd, self.path = tempfile.mkstemp(suffix=".pdf", dir=self.dir)
+            spooled = self._output.getvalue()
+            self._output = os.fdopen(fd, "wb")
+            self._output.write(spooled)
+        return self._output.write(data)
+    
+    def tell(self) -> int:
+        return self._output.tell()
+    
+    def flush(self):
+        self._output.flush()
+    
+    def close(self):
+        if self.path is not None:
+            self._output.close()
+    
+    def getvalue(self) -> Optional[bytes]:
+        """Get the output while it is still in memory"""
+        return None if self.path is not None else self._output.getvalue()
+
 class PDFGenerator:
-    def __init__(self, storage_path: str = "/tmp/pdfs/"):
-        self.storage_path = Path(storage_path)
-        self.storage_path.mkdir(parents=True, exist_ok=True)
-        self.setup_styles()
+    def __init__(self, storage_path: str = "/tmp/pdfs/", output_profile: str = "web"):
+        # A local directory or an s3://bucket/prefix URL
+        self.storage_path = storage_path
+        self.cache = RenderCache(create_store(storage_path))
+        # Optimizations applied to finished PDFs, unless a render asks for another profile
+        self.output_profile = get_profile(output_profile)
+        if not HAS_PIKEPDF and (self.output_profile.linearize or self.output_profile.object_streams):
+            logger.warning("pikepdf is not installed, PDFs are neither linearized nor packed in object streams")
+        # Seconds spent per phase by the last render_artifact call
+        self.timings: Dict[str, float] = {}
+        # Size and time report of the last output optimization
+        self.optimization: Optional[Dict[str, Any]] = None
+        # Set up on first use, see setup_styles
+        self._styles = None
+        self._style_key: Optional[str] = None
+    
+    @property
+    def styles(self):
+        if self._styles is None:
+            self.setup_styles()
+        return self._styles
+    
+    @property
+    def style_key(self) -> str:
+        """Fingerprint the style set so style changes invalidate cached PDFs"""
+        if self._style_key is None:
+            self._style_key = style_key()
+        return self._style_key
     
     def setup_styles(self):
         """Setup custom styles for PDF generation"""
-        self.styles = getSampleStyleSheet()
-        
-        # Title style
-        self.styles.add(ParagraphStyle(
-            name='CustomTitle',
-            parent=self.styles['Title'],
-            fontSize=24,
-            textColor=HexColor('#4F46E5'),
-            alignment=TA_CENTER,
-            spaceAfter=30
-        ))
-        
-        # Subtitle style
-        self.styles.add(ParagraphStyle(
-            name='CustomSubtitle',
-            parent=self.styles['Normal'],
-            fontSize=16,
-            textColor=HexColor('#6B7280'),
-            alignment=TA_CENTER,
-            spaceAfter=20
-        ))
-        
-        # Chapter title style
-        self.styles.add(ParagraphStyle(
-            name='ChapterTitle',
-            parent=self.styles['Heading1'],
-            fontSize=20,
-            textColor=HexColor('#4F46E5'),
-            spaceBefore=30,
-            spaceAfter=15
-        ))
-        
-        # Section title style
-        self.styles.add(ParagraphStyle(
-            name='SectionTitle',
-            parent=self.styles['Heading2'],
-            fontSize=16,
-            textColor=HexColor('#1F2937'),
-            spaceBefore=20,
-            spaceAfter=10
-        ))
-        
-        # Body text style
-        self.styles.add(ParagraphStyle(
-            name='CustomBody',
-            parent=self.styles['Normal'],
-            fontSize=11,
-            textColor=HexColor('#374151'),
-            alignment=TA_JUSTIFY,
-            spaceAfter=12,
-            leftIndent=0,
-            rightIndent=0
-        ))
-        
-        # Tips style
-        self.styles.add(ParagraphStyle(
-            name='TipsStyle',
-            parent=self.styles['Normal'],
-            fontSize=10,
-            textColor=HexColor('#1E40AF'),
-            alignment=TA_LEFT,
-            spaceAfter=15,
-            leftIndent=20,
-            rightIndent=20,
-            backColor=HexColor('#EBF4FF'),
-            borderColor=HexColor('#3B82F6'),
-            borderWidth=1,
-            borderPadding=10
-        ))
-    
-    def generate_pdf(self, ebook_content: Dict[str, Any]) -> str:
-        """Generate PDF from ebook content"""
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.colors import HexColor
+        from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
+        
+        alignments = {'left': TA_LEFT, 'center': TA_CENTER, 'justify': TA_JUSTIFY}
+        self._styles = getSampleStyleSheet()
+        for name, definition in STYLE_DEFINITIONS.items():
+            attributes = dict(definition)
+            parent = self._styles[attributes.pop('parent')]
+            for field in COLOR_FIELDS:
+                if field in attributes:
+                    attributes[field] = HexColor(attributes[field])
+            if 'alignment' in attributes:
+                attributes['alignment'] = alignments[attributes['alignment']]
+            self._styles.add(ParagraphStyle(name=name, parent=parent, **attributes))
+    
+    def get_profile(self, output_profile: Optional[str] = None) -> OutputProfile:
+        """Get an output profile by name, the generator's default for None"""
+        return get_profile(output_profile) if output_profile else self.output_profile
+    
+    def get_cache_key(self, ebook_content: Dict[str, Any], output_profile: Optional[str] = None) -> str:
+        """Get the render cache key for ebook content in an output profile"""
+        # The title page prints the current year
+        profile = self.get_profile(output_profile)
+        return content_hash(ebook_content, f"{self.style_key}:{datetime.now().year}:{profile.cache_key()}")
+    
+    def render_artifact(self, ebook_content: Dict[str, Any], output_profile: Optional[str] = None) -> str:
+        """Render ebook content into the cache unless already there, return its key"""
+        self.timings = {}
+        self.optimization = None
+        profile = self.get_profile(output_profile)
+        key = self.get_cache_key(ebook_content, output_profile)
+        if self.cache.has_artifact(key):
+            return key
+        
+        temp_path = self.cache.get_temp_path(key)
         try:
-            # Generate unique filename
-            token = str(uuid.uuid4())
-            filename = f"ebook_{token}.pdf"
-            filepath = self.storage_path / filename
-            
-            # Create PDF document
-            doc = SimpleDocTemplate(
-                str(filepath),
-                pagesize=A4,
-                rightMargin=72,
-                leftMargin=72,
-                topMargin=72,
-                bottomMargin=72
-            )
-            
-            # Build PDF content
-            story = []
-            
+            self.build_pdf(ebook_content, temp_path)
+            if profile.enabled:
+                with self._timed('optimize'):
+                    self.optimization = optimize_pdf(temp_path, temp_path, profile)
+            with self._timed('store'):
+                self.cache.store_artifact(key, temp_path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+        return key
+    
+    def render_spooled(self, ebook_content: Dict[str, Any], max_size: int,
+                       watermark: Optional[Tuple[str, str]] = None,
+                       output_profile: Optional[str] = None) -> Tuple[Optional[bytes], Optional[str]]:
+        """Render ebook content without storing the PDF in the render cache.
+
+        Returns (bytes, None) when the PDF fits in max_size bytes, otherwise
+        (None, path) of a temp file the caller must delete. With a
+        (watermark id, text) pair, every page is stamped as in stamp_artifact.
+        The intermediate documents of the stamp and optimize stages spill to
+        temp files past max_size too, but those stages and the chapter merge
+        still parse the whole PDF in memory: max_size bounds the buffered
+        bytes, not the memory of the render itself.
+        """
+        self.timings = {}
+        self.optimization = None
+        profile = self.get_profile(output_profile)
+        output = SpooledOutput(max_size)
+        stages: List[BinaryIO] = []
+        try:
+            if watermark or profile.enabled:
+                document = tempfile.SpooledTemporaryFile(max_size)
+                stages.append(document)
+                self.build_pdf(ebook_content, document)
+                if watermark:
+                    from pypdf import PdfReader
+                    from watermark import render_overlay, stamp_pdf
+                    document.seek(0)
+                    watermark_id, text = watermark
+                    stamped = output
+                    if profile.enabled:
+                        stamped = tempfile.SpooledTemporaryFile(max_size)
+                        stages.append(stamped)
+                    with self._timed('watermark'):
+                        stamp_pdf(PdfReader(document), render_overlay(text), stamped, {'/WatermarkId': watermark_id})
+                    document = stamped
+                if profile.enabled:
+                    document.seek(0)
+                    with self._timed('optimize'):
+                        self.optimization = optimize_pdf(document, output, profile)
+            else:
+                self.build_pdf(ebook_content, output)
+        except Exception:
+            output.close()
+            if output.path:
+                os.unlink(output.path)
+            raise
+        finally:
+            for stage in stages:
+                stage.close()
+        output.close()
+        return output.getvalue(), output.path
+    
+    def build_pdf(self, ebook_content: Dict[str, Any], output: Union[Path, BinaryIO]):
+        """Render ebook content to a PDF file or stream, reusing cached chapter pages"""
+        if not HAS_PYPDF:
+            self.build_single_pdf(ebook_content, output)
+            return
+        from pypdf import PdfReader, PdfWriter
+        
+        # Every part starts on a new page, so parts lay out independently
+        writer = PdfWriter()
+        for key, add_part in self._document_parts(ebook_content):
+            data = self.cache.get_part(key)
+            if data is None:
+                story = []
+                with self._timed('story'):
+                    add_part(story)
+                with self._timed('layout'):
+                    data = self._render_story(story)
+                self.cache.store_part(key, data)
+            with self._timed('merge'):
+                writer.append(PdfReader(io.BytesIO(data)))
+        
+        with self._timed('merge'):
+            writer.add_metadata({'/Title': ebook_content['title'], '/Author': ebook_content['author']})
+            if isinstance(output, Path):
+                with open(output, 'wb') as file:
+                    writer.write(file)
+            else:
+                writer.write(output)
+    
+    def build_single_pdf(self, ebook_content: Dict[str, Any], output: Union[Path, BinaryIO]):
+        """Render ebook content to a PDF file or stream in a single ReportLab build"""
+        from reportlab.platypus import PageBreak
+        
+        # Build PDF content
+        story = []
+        
+        with self._timed('story'):
             # Title page
             self._add_title_page(story, ebook_content)
             story.append(PageBreak())
@@ -127,19 +266,70 @@ class PDFGenerator:
                 self._add_chapter(story, chapter, i + 1)
                 if i < len(ebook_content['chapters']) - 1:
                     story.append(PageBreak())
-            
-            # Build PDF
-            doc.build(story)
-            
-            logger.info(f"PDF generated successfully: {filename}")
-            return token
-            
-        except Exception as e:
-            logger.error(f"Error generating PDF: {str(e)}")
-            raise
+        
+        # Build PDF
+        with self._timed('layout'):
+            self._create_document(str(output) if isinstance(output, Path) else output).build(story)
+    
+    @contextmanager
+    def _timed(self, phase: str):
+        """Add the time spent in the block to a render phase"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[phase] = self.timings.get(phase, 0.0) + time.perf_counter() - started
+    
+    def _create_document(self, output) -> "SimpleDocTemplate":
+        """Create the PDF document template"""
+        from reportlab.lib.pagesizes import A4
+        from reportlab.platypus import SimpleDocTemplate
+        
+        return SimpleDocTemplate(
+            output,
+            pagesize=A4,
+            rightMargin=72,
+            leftMargin=72,
+            topMargin=72,
+            bottomMargin=72
+        )
+    
+    def _render_story(self, story: list) -> bytes:
+        """Lay out a story into PDF bytes"""
+        buffer = io.BytesIO()
+        self._create_document(buffer).build(story)
+        return buffer.getvalue()
+    
+    def _document_parts(self, ebook_content: Dict[str, Any]):
+        """Yield (cache key, story builder) for the front matter and each chapter"""
+        from reportlab.platypus import PageBreak
+        
+        style_key = f"{self.style_key}:{datetime.now().year}"
+        
+        front_matter = {
+            'part': 'front',
+            'title': ebook_content['title'],
+            'subtitle': ebook_content['subtitle'],
+            'author': ebook_content['author'],
+            'chapters': [chapter['title'] for chapter in ebook_content['chapters']],
+        }
+        
+        def add_front_matter(story):
+            self._add_title_page(story, ebook_content)
+            story.append(PageBreak())
+            self._add_table_of_contents(story, ebook_content)
+        
+        yield content_hash(front_matter, style_key), add_front_matter
+        
+        for i, chapter in enumerate(ebook_content['chapters']):
+            part = {'part': 'chapter', 'number': i + 1, 'chapter': chapter}
+            yield content_hash(part, style_key), partial(self._add_chapter, chapter=chapter, chapter_num=i + 1)
     
     def _add_title_page(self, story: list, ebook_content: Dict[str, Any]):
         """Add title page to PDF"""
+        from reportlab.platypus import Paragraph, Spacer
+        from reportlab.lib.units import inch
+        
         story.append(Spacer(1, 2*inch))
         
         # Title
@@ -159,6 +349,9 @@ class PDFGenerator:
     
     def _add_table_of_contents(self, story: list, ebook_content: Dict[str, Any]):
         """Add table of contents to PDF"""
+        from reportlab.platypus import Paragraph, Spacer
+        from reportlab.lib.units import inch
+        
         story.append(Paragraph("Table des Matières", self.styles['ChapterTitle']))
         story.append(Spacer(1, 0.3*inch))
         
@@ -169,6 +362,9 @@ class PDFGenerator:
     
     def _add_chapter(self, story: list, chapter: Dict[str, Any], chapter_num: int):
         """Add a chapter to PDF"""
+        from reportlab.platypus import Paragraph, Spacer
+        from reportlab.lib.units import inch
+        
         # Chapter title
         chapter_title = f"Chapitre {chapter_num}: {chapter['title']}"
         story.append(Paragraph(chapter_title, self.styles['ChapterTitle']))
@@ -197,24 +393,83 @@ class PDFGenerator:
             
             story.append(Spacer(1, 0.2*inch))
     
-    def get_pdf_path(self, token: str) -> Path:
-        """Get PDF file path from token"""
-        filename = f"ebook_{token}.pdf"
-        return self.storage_path / filename
-    
-    def cleanup_old_pdfs(self, hours: int = 24):
+    def cleanup_old_pdfs(self, hours: float = 24):
         """Clean up PDFs older than specified hours"""
         try:
-            cutoff_time = datetime.now() - timedelta(hours=hours)
-            
-            for pdf_file in self.storage_path.glob("ebook_*.pdf"):
-                if pdf_file.stat().st_mtime < cutoff_time.timestamp():
-                    pdf_file.unlink()
-                    logger.info(f"Cleaned up old PDF: {pdf_file.name}")
-                    
+            self.cache.cleanup(hours=hours)
         except Exception as e:
             logger.error(f"Error cleaning up old PDFs: {str(e)}")
+
+# Per render thread: a worker process has one, but with RENDER_WORKERS=0 renders
+# share the default thread pool and must not share generators or stamp bases
+_worker_state = threading.local()
+
+def _worker_generator(storage_path: str) -> PDFGenerator:
+    """Get the generator of this render worker for a storage path, reused across jobs"""
+    generators = getattr(_worker_state, "generators", None)
+    if generators is None:
+        generators = _worker_state.generators = {}
+    generator = generators.get(storage_path)
+    if generator is None:
+        generator = generators[storage_path] = PDFGenerator(storage_path)
+    return generator
+
+def render_artifact(storage_path: str, ebook_content: Dict[str, Any], profile: bool = False,
+                    output_profile: Optional[str] = None
+                    ) -> Tuple[str, Dict[str, float], Optional[bytes], Optional[Dict[str, Any]]]:
+    """Render ebook content into the cache at storage_path (runs in render workers).
+
+    Returns the cache key, the phase timings, with profile the marshalled
+    cProfile stats, and the output optimization report. The server records
+    timings and stores profiles, since anything left in a worker process
+    would be lost.
+    """
+    generator = _worker_generator(storage_path)
+    if profile:
+        key, stats = run_profiled(generator.render_artifact, ebook_content, output_profile)
+    else:
+        key, stats = generator.render_artifact(ebook_content, output_profile), None
+    return key, generator.timings, stats, generator.optimization
+
+def render_spooled(storage_path: str, ebook_content: Dict[str, Any], max_size: int,
+                   watermark: Optional[Tuple[str, str]] = None, output_profile: Optional[str] = None
+                   ) -> Tuple[Optional[bytes], Optional[str], Dict[str, float], Optional[Dict[str, Any]]]:
+    """Render ebook content for a single response (runs in render workers).
+
+    Returns the PDF bytes or the path of a temp file holding them (see
+    PDFGenerator.render_spooled), the phase timings and the output
+    optimization report. Chapter pages still come from and go to the render
+    cache at storage_path.
+    """
+    generator = _worker_generator(storage_path)
+    data, path = generator.render_spooled(ebook_content, max_size, watermark, output_profile)
+    return data, path, generator.timings, generator.optimization
+
+def stamp_artifact(storage_path: str, key: str, watermark_id: str, text: str,
+                   output_profile: Optional[str] = None) -> Tuple[str, float]:
+    """Store a copy of a cached artifact with a per-download watermark (runs in render workers).
+
+    Only a one-page overlay is rendered, then merged onto the base pages.
+    Returns the store name of the personalized copy and the seconds spent.
+    """
+    from pypdf import PdfReader
+    from watermark import render_overlay, stamp_pdf
+    
+    started = time.perf_counter()
+    cache = _worker_generator(storage_path).cache
+    # Downloads of the same artifact come in runs, keep its parsed pages
+    base = getattr(_worker_state, "stamp_base", None)
+    if base is None or base[0] != key:
+        base = _worker_state.stamp_base = (key, PdfReader(io.BytesIO(cache.store.get(cache.artifact_name(key)))))
     
-    def pdf_exists(self, token: str) -> bool:
-        """Check if PDF exists for given token"""
-        return self.get_pdf_path(token).exists()
\ No newline at end of file
+    output = io.BytesIO()
+    stamp_pdf(base[1], render_overlay(text), output, {'/WatermarkId': watermark_id})
+    # The base is already deduplicated, but stamping drops linearization and object streams
+    profile = dataclasses.replace(_worker_generator(storage_path).get_profile(output_profile), dedupe=False)
+    if profile.enabled:
+        stamped, output = output, io.BytesIO()
+        stamped.seek(0)
+        optimize_pdf(stamped, output, profile)
+    name = cache.personalized_name(watermark_id)
+    cache.store.put(name, output.getvalue())
+    return name, time.perf_counter() - started
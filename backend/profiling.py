@@ -0,0 +1,156 @@
+import io
+import time
+import uuid
+import hmac
+import pstats
+import random
+import marshal
+import asyncio
+import cProfile
+import logging
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from storage import ArtifactStore
+
+logger = logging.getLogger(__name__)
+
+PROFILE_PREFIX = "profiles/"
+# Orders accepted by format_profile
+SORT_KEYS = tuple(key.value for key in pstats.SortKey)
+
+
+def run_profiled(fn: Callable[..., Any], *args) -> Tuple[Any, Optional[bytes]]:
+    """Call fn(*args) under cProfile, return its result and the marshalled stats.
+
+    The stats are None when another profiler already holds the interpreter.
+    """
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return fn(*args), None
+    try:
+        result = fn(*args)
+    finally:
+        profiler.disable()
+    profiler.create_stats()
+    return result, marshal.dumps(profiler.stats)
+
+
+class _LoadedStats:
+    """Adapter letting pstats.Stats read marshalled stats from memory"""
+
+    def __init__(self, data: bytes):
+        self.stats = marshal.loads(data)
+
+    def create_stats(self):
+        pass
+
+
+def format_profile(data: bytes, sort: str = "cumulative", limit: int = 40) -> str:
+    """Render marshalled stats as a pstats text report"""
+    output = io.StringIO()
+    stats = pstats.Stats(_LoadedStats(data), stream=output)
+    stats.sort_stats(sort).print_stats(limit)
+    return output.getvalue()
+
+
+class ProfileSession:
+    """Collects the profiles taken while serving one request"""
+
+    def __init__(self, profiler: "Profiler", request_id: str):
+        self.profiler = profiler
+        self.request_id = request_id
+
+    async def save(self, part: str, data: bytes):
+        """Store one part of the request's profile (request, render, ...)"""
+        name = self.profiler.profile_name(self.request_id, part)
+        try:
+            await asyncio.to_thread(self.profiler.store.put, name, data)
+        except Exception as e:
+            logger.error(f"Error saving profile {name}: {str(e)}")
+
+
+# The session of the request being profiled, inherited by the tasks it starts
+current_session: ContextVar[Optional[ProfileSession]] = ContextVar("profile_session", default=None)
+
+
+class Profiler:
+    """Opt-in cProfile profiling of requests and the renders they trigger.
+
+    A request is profiled when it carries ``X-Profile: 1`` with a valid
+    ``X-Admin-Token``, or at random with probability ``sample_rate``.
+    Profiles are stored as ``profiles/<request id>.<part>.prof`` (pstats
+    format, e.g. for snakeviz) in the artifact store. cProfile hooks the
+    whole thread, so only one request is profiled at a time and requests
+    interleaved on the event loop show up in its profile too; renders are
+    profiled separately inside the render worker.
+    """
+
+    def __init__(self, store: ArtifactStore, admin_token: Optional[str] = None, sample_rate: float = 0.0):
+        self.store = store
+        self.admin_token = admin_token
+        self.sample_rate = sample_rate
+        self._active = False
+
+    def is_admin(self, token: Optional[str]) -> bool:
+        """Check an admin token, always False when none is configured"""
+        if not self.admin_token or not token:
+            return False
+        return hmac.compare_digest(token.encode("utf-8"), self.admin_token.encode("utf-8"))
+
+    def wants_profile(self, headers) -> bool:
+        """Decide whether to profile a request"""
+        if headers.get("x-profile") == "1" and self.is_admin(headers.get("x-admin-token")):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @staticmethod
+    def profile_name(request_id: str, part: str) -> str:
+        return f"{PROFILE_PREFIX}{request_id}.{part}.prof"
+
+    async def profile_request(self, request, call_next):
+        """Run call_next under the profiler if the request asks or is sampled"""
+        if self._active or not self.wants_profile(request.headers):
+            return await call_next(request)
+
+        request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+        if not request_id.replace("-", "").isalnum():
+            request_id = uuid.uuid4().hex
+        session = ProfileSession(self, request_id)
+        reset = current_session.set(session)
+        profiler = cProfile.Profile()
+        self._active = True
+        try:
+            profiler.enable()
+            try:
+                response = await call_next(request)
+            finally:
+                profiler.disable()
+        finally:
+            self._active = False
+            current_session.reset(reset)
+
+        profiler.create_stats()
+        await session.save("request", marshal.dumps(profiler.stats))
+        response.headers["X-Profile-Id"] = request_id
+        return response
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """List stored profiles grouped by request id"""
+        profiles: Dict[str, List[str]] = {}
+        for name in self.store.list_older_than(PROFILE_PREFIX, time.time() + 1):
+            request_id, part, _ = name[len(PROFILE_PREFIX):].rsplit(".", 2)
+            profiles.setdefault(request_id, []).append(part)
+        return [{"request_id": request_id, "parts": sorted(parts)} for request_id, parts in profiles.items()]
+
+    def get_profile(self, request_id: str, part: str) -> bytes:
+        """Get a stored profile part, raises ArtifactNotFound if missing"""
+        return self.store.get(self.profile_name(request_id, part))
+
+    def cleanup(self, hours: float = 24):
+        """Remove profiles older than specified hours"""
+        cutoff = (datetime.now() - timedelta(hours=hours)).timestamp()
+        for name in list(self.store.list_older_than(PROFILE_PREFIX, cutoff)):
+            self.store.delete(name)
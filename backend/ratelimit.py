@@ -0,0 +1,151 @@
+import math
+import time
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from pymongo import ReturnDocument
+
+
+class RateLimited(Exception):
+    """Raised when a client has used up its request budget"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Rate limit exceeded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class MemoryRateLimitBackend:
+    """Token buckets and recent results held in this process.
+
+    Each worker limits on its own, so with N workers a client gets up to
+    N times the configured rate. Least recently seen clients are evicted
+    past ``max_keys``.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._recent: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """Take a token, return 0 or the seconds until one is available"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (float(burst), now))
+        tokens = min(float(burst), tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._remember(self._buckets, key, (tokens, now))
+        return wait
+
+    async def get_recent(self, key: str) -> Optional[str]:
+        """Get a value stored within its time to live"""
+        entry = self._recent.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+    async def set_recent(self, key: str, value: str, ttl: float):
+        """Store a value for ttl seconds"""
+        self._remember(self._recent, key, (value, time.monotonic() + ttl))
+
+    def _remember(self, entries: OrderedDict, key: str, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_keys:
+            entries.popitem(last=False)
+
+
+class MongoRateLimitBackend:
+    """Token buckets and recent results shared by every worker through Mongo.
+
+    A bucket is refilled and drawn from in a single pipeline update on the
+    server clock, so concurrent requests from several workers cannot
+    overdraw it. A TTL index removes idle buckets.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        """Create the TTL index that purges idle buckets and recent results"""
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """Take a token, return 0 or the seconds until one is available"""
+        elapsed = {"$divide": [{"$subtract": ["$$NOW", {"$ifNull": ["$updated_at", "$$NOW"]}]}, 1000]}
+        refilled = {"$min": [burst, {"$add": [{"$ifNull": ["$tokens", burst]}, {"$multiply": [elapsed, rate]}]}]}
+        # A full bucket is the same as no bucket, so it can expire once refilled
+        idle_ms = int(math.ceil(burst / rate * 1000))
+        bucket = await self.collection.find_one_and_update(
+            {"_id": f"bucket:{key}"},
+            [
+                {"$set": {"tokens": refilled, "updated_at": "$$NOW"}},
+                {"$set": {
+                    "allowed": {"$gte": ["$tokens", 1]},
+                    "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    "expires_at": {"$add": ["$$NOW", idle_ms]},
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if bucket["allowed"]:
+            return 0.0
+        return (1 - bucket["tokens"]) / rate
+
+    async def get_recent(self, key: str) -> Optional[str]:
+        """Get a value stored within its time to live"""
+        document = await self.collection.find_one(
+            {"_id": f"recent:{key}", "expires_at": {"$gt": datetime.utcnow()}}
+        )
+        return document["value"] if document else None
+
+    async def set_recent(self, key: str, value: str, ttl: float):
+        """Store a value for ttl seconds"""
+        await self.collection.update_one(
+            {"_id": f"recent:{key}"},
+            {"$set": {"value": value, "expires_at": datetime.utcnow() + timedelta(seconds=ttl)}},
+            upsert=True
+        )
+
+
+class RateLimiter:
+    """Token-bucket limit and click deduplication per client (IP and user agent).
+
+    Each client may burst ``burst`` requests, then gets ``rate_per_minute``
+    more per minute. Results remembered with ``remember`` are handed back
+    by ``recent`` for ``dedup_window`` seconds, so repeated clicks reuse
+    the first result instead of spending budget.
+    """
+
+    def __init__(self, backend, rate_per_minute: float = 10, burst: int = 5, dedup_window: float = 10):
+        self.backend = backend
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.dedup_window = dedup_window
+
+    @staticmethod
+    def client_key(ip_address: str, user_agent: str) -> str:
+        """Identify a client without storing its IP in clear"""
+        return hashlib.sha256(f"{ip_address}\0{user_agent}".encode("utf-8")).hexdigest()[:32]
+
+    async def check(self, client: str, scope: str = "default"):
+        """Spend one request from the client's budget, raise RateLimited if empty"""
+        wait = await self.backend.take(f"{scope}:{client}", self.rate, self.burst)
+        if wait > 0:
+            raise RateLimited(max(1, math.ceil(wait)))
+
+    async def recent(self, client: str, scope: str) -> Optional[str]:
+        """Get the result remembered for the client within the dedup window"""
+        if self.dedup_window <= 0:
+            return None
+        return await self.backend.get_recent(f"{scope}:{client}")
+
+    async def remember(self, client: str, scope: str, value: str):
+        """Remember a result to hand back to the client's repeated requests"""
+        if self.dedup_window > 0:
+            await self.backend.set_recent(f"{scope}:{client}", value, self.dedup_window)
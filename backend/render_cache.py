@@ -0,0 +1,120 @@
+import json
+import time
+import uuid
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, Optional
+from storage import ArtifactStore, ArtifactNotFound
+
+logger = logging.getLogger(__name__)
+
+# Document metadata that does not affect the rendered output
+IGNORED_CONTENT_FIELDS = ("_id", "id", "slug", "version", "created_at", "updated_at")
+
+
+def content_hash(ebook_content: Dict[str, Any], style_key: str = "") -> str:
+    """Compute a stable hash of the ebook content and the style set"""
+    payload = {
+        key: value
+        for key, value in ebook_content.items()
+        if key not in IGNORED_CONTENT_FIELDS
+    }
+    serialized = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    digest = hashlib.sha256()
+    digest.update(serialized.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(style_key.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """Content-addressed cache of rendered PDFs on top of an artifact store.
+
+    Each distinct (content, style) pair is rendered once into
+    ``artifacts/<key>.pdf`` and shared by every download token minted for
+    it (see ``TokenRegistry``). Changed content hashes to a new key, which
+    is what invalidates the cache. Rendered chapters are kept in
+    ``parts/`` so a new content version only re-renders the chapters that
+    changed. Watermarked copies of an artifact for single downloads live
+    in ``personalized/``.
+    """
+
+    def __init__(self, store: ArtifactStore, touch_interval: float = 3600):
+        self.store = store
+        self.touch_interval = touch_interval
+        self._touched: Dict[str, float] = {}
+
+    @staticmethod
+    def artifact_name(key: str) -> str:
+        """Get the store name of the artifact for a cache key"""
+        return f"artifacts/{key}.pdf"
+
+    @staticmethod
+    def personalized_name(watermark_id: str) -> str:
+        """Get the store name of a watermarked copy"""
+        return f"personalized/{watermark_id}.pdf"
+
+    def get_temp_path(self, key: str) -> Path:
+        """Get a unique local path to render an artifact into"""
+        return self.store.scratch_path / f"{key}.{uuid.uuid4().hex}.tmp"
+
+    def has_artifact(self, key: str) -> bool:
+        """Check if an artifact is cached for a key"""
+        return self.store.exists(self.artifact_name(key))
+
+    def store_artifact(self, key: str, temp_path: Path):
+        """Publish a rendered file as the artifact for a key"""
+        self.store.put_file(self.artifact_name(key), temp_path)
+        self._touched[key] = time.monotonic()
+        logger.info(f"Cached PDF artifact: {key}")
+
+    def get_part(self, key: str) -> Optional[bytes]:
+        """Get a cached rendered part (front matter or chapter pages)"""
+        name = f"parts/{key}.pdf"
+        try:
+            data = self.store.get(name)
+        except ArtifactNotFound:
+            return None
+        self._touch(name, key)
+        return data
+
+    def store_part(self, key: str, data: bytes):
+        """Cache a rendered part"""
+        self.store.put(f"parts/{key}.pdf", data)
+
+    def touch_artifact(self, key: str) -> bool:
+        """Keep a cached artifact alive for a new download, False on a miss"""
+        try:
+            # Keep the artifact at least as long as the tokens pointing at it
+            self._touch(self.artifact_name(key), key)
+        except ArtifactNotFound:
+            return False
+        return True
+
+    def _touch(self, name: str, key: str):
+        """Refresh an object's age, at most once per touch interval"""
+        now = time.monotonic()
+        if now - self._touched.get(key, float("-inf")) < self.touch_interval:
+            return
+        self.store.touch(name)
+        self._touched[key] = now
+
+    def cleanup(self, hours: float = 24):
+        """Remove artifacts and parts older than specified hours"""
+        cutoff = (datetime.now() - timedelta(hours=hours)).timestamp()
+        # Touches are throttled, so cached objects get one extra interval
+        cached_cutoff = cutoff - self.touch_interval
+
+        for prefix in ("artifacts/", "parts/"):
+            for name in list(self.store.list_older_than(prefix, cached_cutoff)):
+                self.store.delete(name)
+                logger.info(f"Cleaned up old PDF artifact: {name}")
+        # Personalized copies are only reachable through their token
+        for name in list(self.store.list_older_than("personalized/", cutoff)):
+            self.store.delete(name)
+        # Renders killed midway leave their temp file behind, on local disk whatever the store
+        self.store.cleanup_scratch(cutoff)
+
+        self._touched.clear()
@@ -0,0 +1,143 @@
+import math
+import time
+import asyncio
+import logging
+import weakref
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable
+from metrics import RENDER_QUEUE_DEPTH, RENDER_REJECTED
+
+logger = logging.getLogger(__name__)
+
+
+class RenderQueueFull(Exception):
+    """Raised when the render pool cannot accept more work"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Render queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class RenderTimeout(Exception):
+    """Raised when a render does not finish within the configured timeout"""
+
+
+class RenderPool:
+    """Bounded pool running blocking renders off the event loop.
+
+    Renders run in worker processes (``max_workers > 0``) or in the default
+    thread pool (``max_workers == 0``, handy for development). At most
+    ``max_workers + max_queue`` renders are admitted at once; beyond that
+    ``run`` fails fast with ``RenderQueueFull`` so callers can shed load.
+    A render that outlives ``timeout`` has its pool's processes killed so
+    it frees its slot; the other renders of that pool run again once in a
+    fresh pool. Threads cannot be killed: with ``max_workers == 0`` a
+    timed-out render keeps its slot until it finishes.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 16, timeout: float = 120.0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.pending = 0
+        self.avg_duration = 1.0
+        # Created by the first run, so importing the server starts no processes
+        # (and a server forking its workers after import never forks a pool)
+        self.executor = None
+        # Pools killed over a timeout, whose other renders failed through no fault of their own
+        self._recycled: "weakref.WeakSet[ProcessPoolExecutor]" = weakref.WeakSet()
+
+    def _create_executor(self):
+        """Create the worker process pool, None to use the default thread pool"""
+        if self.max_workers <= 0:
+            return None
+        # spawn: never fork a process that holds the event loop and Mongo threads
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+
+    @property
+    def capacity(self) -> int:
+        """Maximum number of renders admitted at once"""
+        return max(self.max_workers, 1) + self.max_queue
+
+    def retry_after(self) -> int:
+        """Estimate in seconds until a slot frees up"""
+        backlog = self.pending / max(self.max_workers, 1)
+        return max(1, math.ceil(backlog * self.avg_duration))
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        """Run fn(*args) in the pool, enforcing the queue bound and timeout"""
+        if self.pending >= self.capacity:
+            RENDER_REJECTED.labels("queue_full").inc()
+            raise RenderQueueFull(self.retry_after())
+
+        retried = False
+        while True:
+            if self.executor is None:
+                self.executor = self._create_executor()
+            executor = self.executor
+            try:
+                return await self._run_in(executor, fn, args)
+            except BrokenProcessPool:
+                if executor in self._recycled and not retried:
+                    # Killed along with a render that timed out
+                    logger.warning("Render interrupted by the restart of its pool, running it again")
+                    retried = True
+                    continue
+                # A worker died (e.g. OOM kill): replace the pool for the next renders
+                logger.error("Render worker terminated abruptly, restarting the pool")
+                if self.executor is executor and getattr(executor, "_broken", False):
+                    self.executor = self._create_executor()
+                raise
+
+    async def _run_in(self, executor, fn: Callable[..., Any], args: tuple) -> Any:
+        """Run fn(*args) in an executor, holding a slot until it is done"""
+        self.pending += 1
+        RENDER_QUEUE_DEPTH.inc()
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(executor, partial(fn, *args))
+
+        def release(done):
+            # The slot is held until the worker is really done or killed
+            if not done.cancelled():
+                # Nobody awaits a render that timed out: retrieve its error so asyncio does not log it
+                done.exception()
+            self.pending -= 1
+            RENDER_QUEUE_DEPTH.dec()
+            self.avg_duration = 0.8 * self.avg_duration + 0.2 * (time.monotonic() - started)
+
+        future.add_done_callback(release)
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Render timed out after {self.timeout}s")
+            RENDER_REJECTED.labels("timeout").inc()
+            self._recycle(executor)
+            raise RenderTimeout(f"Render did not finish within {self.timeout}s")
+
+    def _recycle(self, executor):
+        """Kill the processes of a pool whose render timed out, later renders get a new pool"""
+        if executor is None:
+            logger.warning("Render threads cannot be stopped, the timed-out render keeps its slot")
+            return
+        if self.executor is executor:
+            self.executor = None
+        self._recycled.add(executor)
+        # ProcessPoolExecutor only gets a public way to kill its workers in Python 3.14
+        processes = list((executor._processes or {}).values())
+        # Not cancel_futures: queued renders fail with BrokenProcessPool and are retried
+        executor.shutdown(wait=False)
+        for process in processes:
+            process.terminate()
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
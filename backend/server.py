@@ -1,35 +1,128 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import re
+import hashlib
+import time
 import logging
 from pathlib import Path
-from typing import Dict, Any
-from models import PDFGenerationRequest, PDFGenerationResponse, Statistics
-from services import EbookService
-from pdf_generator import PDFGenerator
+from urllib.parse import quote
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+from models import PDFGenerationRequest, PDFGenerationResponse, Statistics, PDFJob, PDFJobResponse, DownloadToken
+from services import EbookService, EbookNotFound
+from default_content import DEFAULT_EBOOK_SLUG
+from jobs import PDFJobManager, JobQueue
+from cache import ChangeStreamInvalidator
+from bootstrap import (create_pdf_generator, create_token_registry, create_download_writer,
+                       create_ebook_service, create_job_queue, create_cache_invalidator)
+from tracking import DownloadWriter
+from tokens import TokenRegistry
+from downloads import artifact_response, transfer_length, rendered_response, IMMUTABLE_CACHE_CONTROL
+from payloads import payload_response
+from storage import ArtifactNotFound
+from render_pool import RenderPool, RenderQueueFull, RenderTimeout
+import metrics
+from profiling import Profiler, format_profile, SORT_KEYS
+from analytics import DownloadAnalytics, GRANULARITIES
+from ratelimit import RateLimiter, RateLimited, MemoryRateLimitBackend, MongoRateLimitBackend
 import asyncio
+from contextlib import asynccontextmanager
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
-
 # Initialize services
-pdf_generator = PDFGenerator()
-ebook_service = EbookService(db, pdf_generator)
+# A local directory or an s3://bucket/prefix URL
+pdf_generator = create_pdf_generator()
+# Download tokens expire after this long, artifacts are kept at least as long
+PDF_EXPIRY_HOURS = float(os.environ.get('PDF_EXPIRY_HOURS', '24'))
+# Redirect downloads to presigned object-store URLs when the store supports it
+PRESIGNED_DOWNLOADS = os.environ.get('PRESIGNED_DOWNLOADS', 'true').lower() == 'true'
+render_pool = RenderPool(
+    max_workers=int(os.environ.get('RENDER_WORKERS', '2')),
+    max_queue=int(os.environ.get('RENDER_QUEUE_SIZE', '16')),
+    timeout=float(os.environ.get('RENDER_TIMEOUT_SECONDS', '120'))
+)
+# Opt-in profiling: X-Profile: 1 with the admin token, or a sampled share of requests
+profiler = Profiler(
+    pdf_generator.cache.store,
+    admin_token=os.environ.get('ADMIN_TOKEN'),
+    sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+)
+# How /generate-pdf answers: a download token, a job to follow, or the PDF itself
+PDF_GENERATION_MODES = ("sync", "async", "stream")
+# mode=stream renders up to this many bytes in memory, larger PDFs go through a temp file
+STREAM_SPOOL_BYTES = int(os.environ.get('STREAM_SPOOL_BYTES', str(4 * 1024 * 1024)))
+# Rolled-up download events older than this move to download_tracking_archive, 0 keeps them
+ANALYTICS_ARCHIVE_DAYS = float(os.environ.get('ANALYTICS_ARCHIVE_DAYS', '30'))
+
+# MongoDB connection and the services bound to it, set up by connect() when
+# the app starts: importing this module (e.g. in a server's master process
+# before it forks workers) creates no client
+client: Optional[AsyncIOMotorClient] = None
+db = None
+download_tokens: Optional[TokenRegistry] = None
+download_writer: Optional[DownloadWriter] = None
+rate_limit_backend = None
+rate_limiter: Optional[RateLimiter] = None
+ebook_service: Optional[EbookService] = None
+job_queue: Optional[JobQueue] = None
+job_manager: Optional[PDFJobManager] = None
+download_analytics: Optional[DownloadAnalytics] = None
+cache_invalidator: Optional[ChangeStreamInvalidator] = None
+
+def connect(mongo_client: AsyncIOMotorClient):
+    """Build the services bound to the database"""
+    global client, db, download_tokens, download_writer, rate_limit_backend, rate_limiter
+    global ebook_service, job_queue, job_manager, download_analytics, cache_invalidator
+    client = mongo_client
+    db = client[os.environ['DB_NAME']]
+    download_tokens = create_token_registry(db)
+    download_writer = create_download_writer(db)
+    # Per-client token bucket on PDF generation, shared through Mongo with RATE_LIMIT_BACKEND=mongo
+    rate_limit_backend = (
+        MongoRateLimitBackend(db.rate_limits)
+        if os.environ.get('RATE_LIMIT_BACKEND', 'memory') == 'mongo'
+        else MemoryRateLimitBackend()
+    )
+    rate_limiter = RateLimiter(
+        rate_limit_backend,
+        rate_per_minute=float(os.environ.get('RATE_LIMIT_PER_MINUTE', '10')),
+        burst=int(os.environ.get('RATE_LIMIT_BURST', '5')),
+        dedup_window=float(os.environ.get('DEDUP_WINDOW_SECONDS', '10'))
+    )
+    ebook_service = create_ebook_service(db, pdf_generator, render_pool, download_writer, download_tokens)
+    # PDF_JOB_QUEUE=mongo leaves async jobs to standalone render workers (worker.py) instead of this process
+    job_queue = create_job_queue(db) if os.environ.get('PDF_JOB_QUEUE', 'local') == 'mongo' else None
+    job_manager = PDFJobManager(db, ebook_service, queue=job_queue)
+    download_analytics = DownloadAnalytics(db, DEFAULT_EBOOK_SLUG, ip_secret=os.environ.get('ANALYTICS_IP_SECRET'))
+    cache_invalidator = create_cache_invalidator(db, ebook_service.cache)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Connect to MongoDB and run the background tasks while the app serves"""
+    connect(AsyncIOMotorClient(os.environ['MONGO_URL']))
+    await startup_event()
+    yield
+    await shutdown_db_client()
+
+PDF_FILENAME = f"{DEFAULT_EBOOK_SLUG}.pdf"
+ARTIFACT_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+# Ebook pieces revalidate with their ETag once the in-process cache TTL is up
+CONTENT_CACHE_CONTROL = "public, max-age=300"
+STATS_CACHE_CONTROL = "public, max-age=30"
 
 # Create the main app without a prefix
 app = FastAPI(
     title="Ebook Student API",
     description="API pour la plateforme d'ebook étudiant",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Create a router with the /api prefix
@@ -40,97 +133,481 @@ api_router = APIRouter(prefix="/api")
 async def root():
     return {"message": "Ebook Student API is running"}
 
+@api_router.get("/health")
+async def health():
+    """Report readiness, ready once the current ebook PDF is pre-rendered"""
+    if not ebook_service.ready:
+        return JSONResponse(status_code=503, content={"status": "warming"})
+    return {"status": "ready"}
+
+def pdf_filename(slug: Optional[str]) -> str:
+    """Get the download filename of an ebook"""
+    return f"{slug}.pdf" if slug else PDF_FILENAME
+
+def download_etag(record: DownloadToken) -> str:
+    """Get the ETag of a token's downloads, opaque unless the artifact key is public anyway"""
+    if record.watermark_id:
+        return record.watermark_id
+    if record.max_downloads is not None:
+        return hashlib.sha256(f"{record.token}:{record.artifact}".encode()).hexdigest()[:32]
+    return record.artifact
+
+def download_name(record: DownloadToken) -> str:
+    """Get the stored object a token downloads"""
+    if record.watermark_id:
+        return pdf_generator.cache.personalized_name(record.watermark_id)
+    return pdf_generator.cache.artifact_name(record.artifact)
+
+async def has_download_left(record: DownloadToken) -> bool:
+    """Whether a token can still serve a whole download"""
+    if record.max_downloads is None:
+        return True
+    try:
+        size = await asyncio.to_thread(pdf_generator.cache.store.size, download_name(record))
+    except ArtifactNotFound:
+        return False
+    return download_tokens.has_download_left(record, size)
+
+def shared_artifacts_enabled() -> bool:
+    """Whether /api/artifacts serves PDFs by key, unmarked and outside any download limit"""
+    return download_tokens.max_downloads is None and not ebook_service.watermark
+
+@api_router.get("/ebooks")
+async def list_ebooks(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=200)):
+    """List the ebooks of the catalog"""
+    try:
+        ebooks = await ebook_service.list_ebooks(skip, limit)
+        return {"success": True, "data": ebooks}
+    except Exception as e:
+        logging.error(f"Error listing ebooks: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error retrieving ebooks")
+
 @api_router.get("/ebook/content")
-async def get_ebook_content():
+async def get_ebook_content(request: Request):
     """Get ebook content"""
+    return await get_catalog_ebook_content(DEFAULT_EBOOK_SLUG, request)
+
+@api_router.get("/ebooks/{slug}/content")
+async def get_catalog_ebook_content(slug: str, request: Request):
+    """Get the content of an ebook of the catalog"""
     try:
-        content = await ebook_service.get_ebook_content()
-        return {"success": True, "data": content}
+        payload = await ebook_service.get_ebook_content_payload(slug)
     except Exception as e:
         logging.error(f"Error getting ebook content: {str(e)}")
         raise HTTPException(status_code=500, detail="Error retrieving ebook content")
+    
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Ebook not found")
+    return payload_response(request, payload, CONTENT_CACHE_CONTROL)
+
+@api_router.get("/ebook/toc")
+async def get_table_of_contents(request: Request):
+    """Get the table of contents"""
+    return await get_catalog_table_of_contents(DEFAULT_EBOOK_SLUG, request)
+
+@api_router.get("/ebooks/{slug}/toc")
+async def get_catalog_table_of_contents(slug: str, request: Request):
+    """Get the table of contents of an ebook of the catalog"""
+    try:
+        payload = await ebook_service.get_table_of_contents(slug)
+    except Exception as e:
+        logging.error(f"Error getting table of contents: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error retrieving table of contents")
+    
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Ebook not found")
+    return payload_response(request, payload, CONTENT_CACHE_CONTROL)
+
+@api_router.get("/ebook/chapters/{number}")
+async def get_chapter(number: int, request: Request):
+    """Get one chapter by its 1-based number"""
+    return await get_catalog_chapter(DEFAULT_EBOOK_SLUG, number, request)
+
+@api_router.get("/ebooks/{slug}/chapters/{number}")
+async def get_catalog_chapter(slug: str, number: int, request: Request):
+    """Get one chapter of an ebook of the catalog"""
+    try:
+        payload = await ebook_service.get_chapter(number, slug)
+    except Exception as e:
+        logging.error(f"Error getting chapter: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error retrieving chapter")
+    
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Chapter not found")
+    return payload_response(request, payload, CONTENT_CACHE_CONTROL)
+
+def job_response(job: PDFJob) -> PDFJobResponse:
+    """Build the public view of a PDF job"""
+    response = PDFJobResponse(
+        job_id=job.id,
+        status=job.status,
+        status_url=f"/api/pdf-jobs/{job.id}",
+        events_url=f"/api/pdf-jobs/{job.id}/events",
+        error=job.error
+    )
+    if job.token:
+        response.download_url = f"/api/download-pdf/{job.token}"
+        response.filename = pdf_filename(job.slug)
+        response.token = job.token
+    return response
+
+def pdf_generation_response(slug: str, record: DownloadToken) -> PDFGenerationResponse:
+    """Build the response to a PDF generation request"""
+    return PDFGenerationResponse(
+        success=True,
+        download_url=f"/api/download-pdf/{record.token}",
+        filename=pdf_filename(slug),
+        token=record.token,
+        # The shared artifact would be an unmarked copy, or a way around the download limit
+        artifact_url=(None if record.watermark_id or record.max_downloads is not None
+                      or not shared_artifacts_enabled()
+                      else f"/api/artifacts/{record.artifact}.pdf?slug={quote(slug)}")
+    )
 
 @api_router.post("/generate-pdf", response_model=PDFGenerationResponse)
-async def generate_pdf(request: Request):
-    """Generate PDF and return download token"""
+async def generate_pdf(request: Request, mode: str = "sync", profile: Optional[str] = None):
+    """Generate PDF and return download token, a job id with mode=async, or the PDF itself with mode=stream"""
+    return await generate_catalog_pdf(DEFAULT_EBOOK_SLUG, request, mode, profile)
+
+@api_router.post("/ebooks/{slug}/generate-pdf", response_model=PDFGenerationResponse)
+async def generate_catalog_pdf(slug: str, request: Request, mode: str = "sync", profile: Optional[str] = None):
+    """Generate the PDF of an ebook of the catalog, optimized for the web (default) or print"""
+    if mode not in PDF_GENERATION_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown mode {mode!r}, expected one of {', '.join(PDF_GENERATION_MODES)}"
+        )
+    try:
+        output_profile = pdf_generator.get_profile(profile).name
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
         # Get client info
         user_agent = request.headers.get('user-agent', 'Unknown')
         ip_address = request.client.host
+        client = rate_limiter.client_key(ip_address, user_agent)
         
-        # Generate PDF
-        token = await ebook_service.generate_pdf(user_agent, ip_address)
+        # Repeated clicks get the token of the first one, without a new render or download record
+        if mode == "sync":
+            token = await rate_limiter.recent(client, f"{slug}:{output_profile}")
+            record = await download_tokens.resolve(token) if token else None
+            if record and await has_download_left(record):
+                metrics.PDF_GENERATION_THROTTLED.labels("deduplicated").inc()
+                return pdf_generation_response(slug, record)
         
-        response = PDFGenerationResponse(
-            success=True,
-            download_url=f"/api/download-pdf/{token}",
-            filename="comment-faire-1000-euros-en-1-mois.pdf",
-            token=token
-        )
+        await rate_limiter.check(client, "generate-pdf")
         
-        return response
+        if mode == "async":
+            # Fail fast on unknown ebooks instead of in the job
+            if await ebook_service.get_ebook_content(slug) is None:
+                raise EbookNotFound(slug)
+            job = await job_manager.submit(user_agent, ip_address, slug, output_profile)
+            return JSONResponse(status_code=202, content=job_response(job).dict())
         
+        if mode == "stream":
+            # One round trip: the PDF is the response, nothing is stored or tokenized
+            data, path = await ebook_service.stream_pdf(
+                user_agent, ip_address, slug, STREAM_SPOOL_BYTES, output_profile
+            )
+            return rendered_response(data, path, pdf_filename(slug))
+        
+        # Generate PDF
+        token = await ebook_service.generate_pdf(user_agent, ip_address, slug, output_profile=output_profile)
+        await rate_limiter.remember(client, f"{slug}:{output_profile}", token)
+        record = await download_tokens.resolve(token)
+        
+        return pdf_generation_response(slug, record)
+        
+    except EbookNotFound:
+        raise HTTPException(status_code=404, detail="Ebook not found")
+    except RateLimited as e:
+        metrics.PDF_GENERATION_THROTTLED.labels("rate_limited").inc()
+        logging.warning(f"Rate limited PDF generation from {ip_address}: {str(e)}")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many PDF generation requests, please retry later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except RenderQueueFull as e:
+        logging.warning(f"Rejecting PDF generation: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail="PDF generation is busy, please retry",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except RenderTimeout:
+        raise HTTPException(status_code=504, detail="PDF generation timed out")
     except Exception as e:
         logging.error(f"Error generating PDF: {str(e)}")
         raise HTTPException(status_code=500, detail="Error generating PDF")
 
+@api_router.get("/pdf-jobs/{job_id}", response_model=PDFJobResponse)
+async def get_pdf_job(job_id: str):
+    """Get the status of a PDF generation job"""
+    try:
+        job = await job_manager.get_job(job_id)
+    except Exception as e:
+        logging.error(f"Error getting PDF job: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error retrieving PDF job")
+    
+    if job is None:
+        raise HTTPException(status_code=404, detail="PDF job not found or expired")
+    return job_response(job)
+
+@api_router.get("/pdf-jobs/{job_id}/events")
+async def stream_pdf_job(job_id: str):
+    """Stream PDF job status changes as server-sent events"""
+    if await job_manager.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="PDF job not found or expired")
+    
+    async def events():
+        async for job in job_manager.watch(job_id):
+            yield f"event: status\ndata: {job_response(job).json()}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @api_router.get("/download-pdf/{token}")
-async def download_pdf(token: str):
+async def download_pdf(token: str, request: Request):
     """Download PDF file"""
     try:
-        # Check if PDF exists
-        if not pdf_generator.pdf_exists(token):
+        record = await download_tokens.resolve(token)
+        if record is None:
             raise HTTPException(status_code=404, detail="PDF not found or expired")
         
-        # Get PDF path
-        pdf_path = pdf_generator.get_pdf_path(token)
-        
-        return FileResponse(
-            path=str(pdf_path),
-            media_type='application/pdf',
-            filename="comment-faire-1000-euros-en-1-mois.pdf"
+        name = download_name(record)
+        etag = download_etag(record)
+        limited = record.max_downloads is not None
+        if limited:
+            # Charge the bytes this response sends, so no Range header gets
+            # around the limit while revalidations stay free
+            size = await asyncio.to_thread(pdf_generator.cache.store.size, name)
+            length = transfer_length(request, etag, size)
+            if length and await download_tokens.redeem(token, length, size) is None:
+                raise HTTPException(status_code=404, detail="PDF not found or expired")
+        return await artifact_response(
+            request,
+            pdf_generator.cache.store,
+            name,
+            etag=etag,
+            filename=pdf_filename(record.slug),
+            cache_control="private, max-age=86400",
+            # A presigned URL would serve the file without charging the token
+            redirect=PRESIGNED_DOWNLOADS and not limited
         )
         
     except HTTPException:
         raise
+    except ArtifactNotFound:
+        raise HTTPException(status_code=404, detail="PDF not found or expired")
     except Exception as e:
         logging.error(f"Error downloading PDF: {str(e)}")
         raise HTTPException(status_code=500, detail="Error downloading PDF")
 
+@api_router.get("/artifacts/{key}.pdf")
+async def download_artifact(key: str, request: Request, slug: Optional[str] = None):
+    """Download a PDF artifact by content hash, cacheable forever, named after its ebook"""
+    if not ARTIFACT_KEY_PATTERN.match(key) or not shared_artifacts_enabled():
+        raise HTTPException(status_code=404, detail="PDF not found")
+    
+    try:
+        return await artifact_response(
+            request,
+            pdf_generator.cache.store,
+            pdf_generator.cache.artifact_name(key),
+            etag=key,
+            filename=pdf_filename(slug),
+            cache_control=IMMUTABLE_CACHE_CONTROL,
+            redirect=PRESIGNED_DOWNLOADS
+        )
+    except ArtifactNotFound:
+        raise HTTPException(status_code=404, detail="PDF not found")
+    except Exception as e:
+        logging.error(f"Error downloading PDF artifact: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error downloading PDF")
+
 @api_router.get("/stats", response_model=Statistics)
-async def get_statistics():
+async def get_statistics(request: Request):
     """Get platform statistics"""
     try:
-        stats = await ebook_service.get_statistics()
-        return stats
+        payload = await ebook_service.get_statistics_payload()
+        return payload_response(request, payload, STATS_CACHE_CONTROL)
+    except Exception as e:
+        logging.error(f"Error getting statistics: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error retrieving statistics")
+
+@api_router.get("/ebooks/{slug}/stats", response_model=Statistics)
+async def get_catalog_statistics(slug: str, request: Request):
+    """Get the statistics of an ebook of the catalog"""
+    try:
+        if await ebook_service.get_ebook_content(slug) is None:
+            raise HTTPException(status_code=404, detail="Ebook not found")
+        payload = await ebook_service.get_statistics_payload(slug)
+        return payload_response(request, payload, STATS_CACHE_CONTROL)
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error getting statistics: {str(e)}")
         raise HTTPException(status_code=500, detail="Error retrieving statistics")
 
 @api_router.get("/testimonials")
-async def get_testimonials():
+async def get_testimonials(request: Request):
     """Get testimonials"""
     try:
-        testimonials = await ebook_service.get_testimonials()
-        return {"success": True, "data": testimonials}
+        payload = await ebook_service.get_testimonials_payload()
+        return payload_response(request, payload, CONTENT_CACHE_CONTROL)
     except Exception as e:
         logging.error(f"Error getting testimonials: {str(e)}")
         raise HTTPException(status_code=500, detail="Error retrieving testimonials")
 
+def require_admin(request: Request):
+    """Reject requests without the admin token"""
+    if not profiler.is_admin(request.headers.get('x-admin-token')):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@api_router.get("/admin/profiles")
+async def list_profiles(request: Request):
+    """List stored request profiles"""
+    require_admin(request)
+    try:
+        profiles = await asyncio.to_thread(profiler.list_profiles)
+        return {"success": True, "data": profiles}
+    except Exception as e:
+        logging.error(f"Error listing profiles: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error retrieving profiles")
+
+@api_router.get("/admin/profiles/{request_id}/{part}")
+async def get_profile(request_id: str, part: str, request: Request, format: str = "text",
+                      sort: str = "cumulative", limit: int = 40):
+    """Get a request or render profile as a pstats report, or raw with format=prof"""
+    require_admin(request)
+    if sort not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SORT_KEYS)}")
+    try:
+        data = await asyncio.to_thread(profiler.get_profile, request_id, part)
+        if format == "prof":
+            return Response(
+                content=data,
+                media_type="application/octet-stream",
+                headers={"Content-Disposition": f'attachment; filename="{request_id}.{part}.prof"'}
+            )
+        return PlainTextResponse(format_profile(data, sort=sort, limit=limit))
+    except ArtifactNotFound:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    except Exception as e:
+        logging.error(f"Error getting profile: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error retrieving profile")
+
+@api_router.get("/admin/analytics/downloads")
+async def get_download_analytics(request: Request, granularity: str = "day", slug: Optional[str] = None,
+                                 start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Get downloads, unique IPs and user agents per hour or day from the rollups"""
+    require_admin(request)
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail="granularity must be hour or day")
+    end = end or datetime.utcnow()
+    start = start or end - (timedelta(days=2) if granularity == "hour" else timedelta(days=30))
+    try:
+        data = await download_analytics.get_downloads(granularity, start, end, slug)
+        return {"success": True, "data": data}
+    except Exception as e:
+        logging.error(f"Error getting download analytics: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error retrieving download analytics")
+
 # Background task to clean up old PDFs
 async def cleanup_old_pdfs():
     """Background task to clean up old PDFs"""
     while True:
         try:
-            pdf_generator.cleanup_old_pdfs(hours=24)
+            await asyncio.to_thread(pdf_generator.cleanup_old_pdfs, hours=PDF_EXPIRY_HOURS)
+            await asyncio.to_thread(profiler.cleanup, hours=PDF_EXPIRY_HOURS)
             await asyncio.sleep(3600)  # Run every hour
         except Exception as e:
             logging.error(f"Error in cleanup task: {str(e)}")
             await asyncio.sleep(3600)
 
+# Background task to keep the current ebook PDF pre-rendered
+async def warm_pdf():
+    """Background task to render the current content before it is requested"""
+    # Content changes seen through TTL expiry are picked up on the next pass
+    interval = int(os.environ.get('WARM_INTERVAL_SECONDS', '60'))
+    while True:
+        try:
+            await ebook_service.warm()
+        except Exception as e:
+            logging.error(f"Error in PDF warm-up task: {str(e)}")
+        await asyncio.sleep(interval)
+
+def on_content_change(collection: str):
+    """Re-warm as soon as a change stream reports new ebook content"""
+    if collection == "ebook_content":
+        asyncio.create_task(ebook_service.warm())
+
+# Background task to correct download counter drift
+async def reconcile_download_counter():
+    """Background task to recount downloads periodically"""
+    interval = int(os.environ.get('COUNTER_RECONCILE_SECONDS', '3600'))
+    while True:
+        try:
+            await ebook_service.reconcile_download_counter()
+        except Exception as e:
+            logging.error(f"Error in counter reconciliation task: {str(e)}")
+        await asyncio.sleep(interval)
+
+# Background task to roll up download events for analytics
+async def rollup_download_analytics():
+    """Background task to aggregate new download events and archive old ones"""
+    interval = int(os.environ.get('ANALYTICS_ROLLUP_SECONDS', '300'))
+    while True:
+        try:
+            await download_analytics.rollup()
+            if ANALYTICS_ARCHIVE_DAYS > 0:
+                await download_analytics.archive(timedelta(days=ANALYTICS_ARCHIVE_DAYS))
+        except Exception as e:
+            logging.error(f"Error in download analytics task: {str(e)}")
+        await asyncio.sleep(interval)
+
+# Background task to publish the depth of the durable job queue
+async def report_job_queue():
+    """Background task to refresh the job queue gauges that render workers scale on"""
+    interval = int(os.environ.get('JOB_QUEUE_METRICS_SECONDS', '15'))
+    while True:
+        try:
+            metrics.record_job_queue(await job_queue.depth())
+        except Exception as e:
+            logging.error(f"Error in job queue metrics task: {str(e)}")
+        await asyncio.sleep(interval)
+
 # Include the router in the main app
 app.include_router(api_router)
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Expose metrics in the Prometheus text format"""
+    data, content_type = metrics.latest()
+    return Response(content=data, media_type=content_type)
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """Profile requests that ask for it with the admin token, or are sampled"""
+    return await profiler.profile_request(request, call_next)
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Observe request latency, labelled by route template to bound cardinality"""
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.REQUEST_LATENCY.labels(
+        request.method,
+        route.path if route else "unmatched",
+        response.status_code
+    ).observe(time.perf_counter() - started)
+    return response
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -146,13 +623,36 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("startup")
 async def startup_event():
     """Startup event handler"""
     logger.info("Starting Ebook Student API...")
+    await ebook_service.ensure_indexes()
+    await job_manager.ensure_indexes()
+    await download_tokens.ensure_indexes()
+    await download_analytics.ensure_indexes()
+    if isinstance(rate_limit_backend, MongoRateLimitBackend):
+        await rate_limit_backend.ensure_indexes()
+    cache_invalidator.add_listener(on_content_change)
+    cache_invalidator.start()
+    download_writer.start()
     # Start cleanup task
     asyncio.create_task(cleanup_old_pdfs())
+    # Start warm-up task, /api/health reports ready once it has rendered
+    asyncio.create_task(warm_pdf())
+    # Start counter reconciliation task, its first pass seeds the counter
+    asyncio.create_task(reconcile_download_counter())
+    # Start analytics rollups, /api/admin/analytics reads only their output
+    asyncio.create_task(rollup_download_analytics())
+    # Start job queue metrics, render workers claim the jobs themselves
+    if job_queue:
+        asyncio.create_task(report_job_queue())
+    # Start event-loop lag sampling for /metrics
+    asyncio.create_task(metrics.monitor_event_loop_lag())
 
-@app.on_event("shutdown")
 async def shutdown_db_client():
+    """Shutdown event handler"""
+    cache_invalidator.stop()
+    await download_writer.stop()
+    render_pool.shutdown()
+    metrics.mark_process_dead()
     client.close()
\ No newline at end of file
@@ -1,346 +1,440 @@
 import os
+import time
+import uuid
+import asyncio
 import logging
-from typing import Dict, Any, List
+from functools import partial
+from typing import Dict, Any, List, Optional, Tuple
 from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime
-from models import EbookContent, DownloadTracking, Statistics, Testimonial
-from pdf_generator import PDFGenerator
+from models import (
+    EbookContent, EbookSummary, ChapterSummary, TableOfContents, DownloadTracking, Statistics, Testimonial
+)
+from pdf_generator import PDFGenerator, HAS_PYPDF, render_artifact, render_spooled, stamp_artifact
+from render_pool import RenderPool
+from cache import TTLCache
+from counters import ShardedCounter
+from tracking import DownloadWriter
+from tokens import TokenRegistry
+from metrics import MONGO_LATENCY, RENDER_PHASE_DURATION, record_cache, record_optimization, record_render
+from profiling import current_session
+from payloads import JsonPayload
+from default_content import DEFAULT_EBOOK_SLUG, get_default_content
+from watermark import mask_ip
 
 logger = logging.getLogger(__name__)
 
+# Seconds each read is served from the in-process cache
+DEFAULT_CACHE_TTLS = {
+    "ebook_content": 300,
+    "catalog": 300,
+    "toc": 300,
+    "chapter": 300,
+    "testimonials": 300,
+    "statistics": 30,
+}
+
+class EbookNotFound(Exception):
+    """Raised when no ebook exists for a slug"""
+
 class EbookService:
-    def __init__(self, db, pdf_generator: PDFGenerator):
+    def __init__(self, db, pdf_generator: PDFGenerator, render_pool: Optional[RenderPool] = None,
+                 cache: Optional[TTLCache] = None, cache_ttls: Optional[Dict[str, float]] = None,
+                 download_writer: Optional[DownloadWriter] = None, tokens: Optional[TokenRegistry] = None,
+                 watermark: bool = False):
         self.db = db
         self.pdf_generator = pdf_generator
-        self.ebook_content = self._get_default_content()
+        self.render_pool = render_pool or RenderPool(max_workers=0)
+        self.cache = cache or TTLCache()
+        self.cache_ttls = {**DEFAULT_CACHE_TTLS, **(cache_ttls or {})}
+        self.download_counter = ShardedCounter(db.counters, "downloads")
+        self._ebook_counters: Dict[str, ShardedCounter] = {}
+        self.download_writer = download_writer or DownloadWriter(db.download_tracking)
+        if self.download_writer.counter is None:
+            self.download_writer.counter = self.download_counter
+        if self.download_writer.ebook_counter is None:
+            self.download_writer.ebook_counter = self.ebook_download_counter
+        self.tokens = tokens or TokenRegistry(db.download_tokens)
+        # Stamp every download with a unique id and the client's masked IP
+        self.watermark = watermark and HAS_PYPDF
+        if watermark and not self.watermark:
+            logger.warning("Download watermarking needs pypdf, serving unmarked PDFs")
+        self._renders: Dict[str, asyncio.Future] = {}
+        self._content_keys: Dict[Tuple[str, str], Tuple[Dict[str, Any], str]] = {}
+        self._payloads: Dict[str, Tuple[Any, JsonPayload]] = {}
+        self.ready = False
+        self.ebook_content = get_default_content()
     
-    def _get_default_content(self) -> Dict[str, Any]:
-        """Get default ebook content"""
-        return {
-            "title": "Comment Faire 1000€ en 1 Mois en Étant Jeune",
-            "subtitle": "Guide Complet pour Étudiants Entrepreneurs",
-            "author": "EbookStudent",
-            "pages": 87,
-            "chapters": [
-                {
-                    "title": "Introduction : Pourquoi 1000€ en 1 Mois ?",
-                    "description": "Découvrez pourquoi cet objectif est réaliste et comment l'atteindre en tant qu'étudiant.",
-                    "content": [
-                        {
-                            "subtitle": "L'objectif réaliste de 1000€",
-                            "text": [
-                                "Gagner 1000€ en un mois peut sembler ambitieux, mais c'est tout à fait réalisable avec les bonnes stratégies. En tant qu'étudiant, vous avez des atouts uniques : la créativité, l'énergie et la capacité d'apprendre rapidement.",
-                                "Ce guide ne vous promet pas de solutions miracles, mais des méthodes éprouvées que des milliers d'étudiants ont déjà utilisées avec succès. Chaque chapitre vous donnera des outils concrets pour diversifier vos sources de revenus.",
-                                "L'important n'est pas seulement d'atteindre ce montant, mais de développer des compétences qui vous serviront toute votre vie professionnelle."
-                            ],
-                            "tips": "Commencez par fixer un objectif précis et réalisable. 1000€ en 30 jours = environ 33€ par jour. Cela devient plus gérable quand on le décompose ainsi !"
-                        },
-                        {
-                            "subtitle": "Votre profil d'étudiant entrepreneur",
-                            "text": [
-                                "En tant qu'étudiant, vous avez des contraintes spécifiques : emploi du temps chargé, budget limité, mais aussi des avantages considérables. Vous êtes dans un environnement propice à l'apprentissage et à l'expérimentation.",
-                                "Ce guide s'adapte à votre réalité : des méthodes qui s'intègrent dans votre planning étudiant, qui demandent peu ou pas d'investissement initial, et qui peuvent évoluer avec vos études.",
-                                "Nous couvrirons des stratégies adaptées à différents profils : que vous soyez plutôt créatif, technique, commercial ou organisationnel."
-                            ]
-                        }
-                    ]
-                },
-                {
-                    "title": "Freelancing : Monétiser vos Compétences",
-                    "description": "Apprenez à vendre vos services en ligne et à créer un profil attractif sur les plateformes de freelancing.",
-                    "content": [
-                        {
-                            "subtitle": "Identifier vos compétences vendables",
-                            "text": [
-                                "Vous avez plus de compétences que vous ne le pensez ! Rédaction, traduction, design graphique, programmation, montage vidéo, community management... Même des compétences de base peuvent être monétisées.",
-                                "Faites l'inventaire de vos compétences académiques et personnelles. Que savez-vous faire mieux que la moyenne ? Quels logiciels maîtrisez-vous ? Quelles langues parlez-vous ?",
-                                "Les entreprises recherchent constamment des freelances pour des missions ponctuelles. Votre profil d'étudiant peut même être un atout : vous représentez la fraîcheur et l'innovation."
-                            ],
-                            "tips": "Commencez par lister 10 compétences que vous possédez, même basiques. Vous seriez surpris de voir combien sont recherchées sur le marché !"
-                        },
-                        {
-                            "subtitle": "Créer un profil gagnant",
-                            "text": [
-                                "Votre profil sur les plateformes de freelancing (Upwork, Fiverr, 5euros.com) est votre vitrine. Une photo professionnelle, une description claire de vos services et des exemples de votre travail sont essentiels.",
-                                "Rédigez une bio qui met en avant vos compétences uniques et votre motivation. Mentionnez votre statut d'étudiant comme un avantage : disponibilité, tarifs compétitifs, approche moderne.",
-                                "Commencez par des tarifs attractifs pour obtenir vos premiers avis clients, puis augmentez progressivement vos prix en fonction de votre réputation."
-                            ]
-                        }
-                    ]
-                },
-                {
-                    "title": "Cours Particuliers et Tutorat",
-                    "description": "Transformez vos connaissances académiques en revenus réguliers grâce aux cours particuliers.",
-                    "content": [
-                        {
-                            "subtitle": "Choisir vos matières et niveaux",
-                            "text": [
-                                "Vous excellez dans certaines matières ? C'est votre ticket vers des revenus réguliers ! Les mathématiques, les sciences, les langues et l'informatique sont particulièrement demandées.",
-                                "Ciblez les niveaux que vous maîtrisez parfaitement : collège, lycée, ou même première année universitaire. Mieux vaut être excellent sur un niveau que moyen sur plusieurs.",
-                                "Calculez votre potentiel : 2 heures de cours par semaine à 20€/h = 160€/mois. Avec 4-5 élèves réguliers, vous atteignez facilement 600-800€ mensuels."
-                            ],
-                            "tips": "Commencez par proposer vos services à votre entourage : amis, famille, voisins. Le bouche-à-oreille est votre meilleur allié pour débuter !"
-                        },
-                        {
-                            "subtitle": "Cours en ligne vs cours physiques",
-                            "text": [
-                                "Les cours en ligne vous permettent d'élargir votre zone de chalandise et d'optimiser votre temps. Pas de déplacements, horaires flexibles, et possibilité de donner cours à plusieurs élèves simultanément.",
-                                "Les plateformes comme Superprof, Kelprof ou Acadomia facilitent la mise en relation avec des élèves. Vous pouvez également créer votre propre offre sur les réseaux sociaux.",
-                                "Pour les cours physiques, concentrez-vous sur votre quartier ou votre campus. Les tarifs sont généralement plus élevés, mais vous avez moins d'élèves potentiels."
-                            ]
-                        }
-                    ]
-                },
-                {
-                    "title": "Jobs Étudiants Bien Rémunérés",
-                    "description": "Découvrez les emplois étudiants qui offrent les meilleures rémunérations et conditions de travail.",
-                    "content": [
-                        {
-                            "subtitle": "Les secteurs qui payent bien",
-                            "text": [
-                                "Tous les jobs étudiants ne se valent pas ! Certains secteurs offrent des rémunérations bien supérieures au SMIC. L'événementiel, l'hôtellerie haut de gamme, la garde d'enfants VIP, et les missions spécialisées sont particulièrement intéressantes.",
-                                "Les jobs dans la tech (support technique, tests d'applications, modération) sont souvent bien payés et s'adaptent parfaitement aux étudiants en informatique.",
-                                "Les missions ponctuelles (enquêtes, sondages, tests produits) peuvent rapporter entre 50 et 200€ par jour selon la complexité."
-                            ],
-                            "tips": "Inscrivez-vous sur plusieurs plateformes de jobs étudiants et créez des alertes pour les missions bien rémunérées. La rapidité de candidature fait souvent la différence !"
-                        },
-                        {
-                            "subtitle": "Optimiser votre planning",
-                            "text": [
-                                "L'art du job étudiant, c'est de maximiser vos revenus tout en préservant vos études. Privilégiez les emplois flexibles qui s'adaptent à votre emploi du temps universitaire.",
-                                "Concentrez-vous sur les créneaux les plus rentables : soirées, week-ends, vacances scolaires. Certains événements ponctuels peuvent vous rapporter l'équivalent d'une semaine de travail classique.",
-                                "Négociez toujours vos horaires et votre rémunération. En tant qu'étudiant motivé et flexible, vous avez plus de pouvoir de négociation que vous ne le pensez."
-                            ]
-                        }
-                    ]
-                },
-                {
-                    "title": "Vente en Ligne et E-commerce",
-                    "description": "Lancez votre activité de vente en ligne avec des investissements minimaux et des risques contrôlés.",
-                    "content": [
-                        {
-                            "subtitle": "Dropshipping pour débutants",
-                            "text": [
-                                "Le dropshipping vous permet de vendre des produits sans les stocker. Vous jouez le rôle d'intermédiaire entre le fournisseur et le client final. C'est idéal pour débuter avec un budget limité.",
-                                "Choisissez une niche que vous connaissez bien : gaming, beauté, fitness, tech... Votre passion vous donnera une expertise naturelle pour sélectionner les bons produits et communiquer efficacement.",
-                                "Commencez petit avec 2-3 produits testés, puis élargissez votre catalogue en fonction des retours clients. Une boutique bien ciblée vaut mieux qu'un catalogue généraliste."
-                            ],
-                            "tips": "Testez toujours vos produits avant de les vendre. Commandés vous-même pour vérifier la qualité et les délais de livraison. Votre réputation en dépend !"
-                        },
-                        {
-                            "subtitle": "Plateformes et marketing",
-                            "text": [
-                                "Shopify, WooCommerce, ou même Facebook Marketplace peuvent héberger votre boutique. Commencez par les solutions gratuites ou peu coûteuses avant d'investir dans des outils plus sophistiqués.",
-                                "Le marketing sur les réseaux sociaux est votre arme secrète. Instagram, TikTok et Facebook vous permettent de toucher directement votre audience cible avec des budgets publicitaires maîtrisés.",
-                                "Créez du contenu authentique autour de vos produits. Les vidéos de déballage, les tutoriels d'utilisation et les témoignages clients sont particulièrement efficaces."
-                            ]
-                        }
-                    ]
-                },
-                {
-                    "title": "Création de Contenu et Monétisation",
-                    "description": "Transformez votre créativité en revenus grâce aux plateformes de contenu et aux partenariats.",
-                    "content": [
-                        {
-                            "subtitle": "YouTube et TikTok : au-delà du divertissement",
-                            "text": [
-                                "Créer du contenu sur YouTube ou TikTok n'est plus réservé aux influenceurs. Vous pouvez monétiser votre expertise dans votre domaine d'études : tutoriels, conseils, vulgarisation scientifique...",
-                                "La régularité est clé : mieux vaut publier une vidéo par semaine pendant 6 mois qu'une vidéo par jour pendant 3 semaines. Votre audience a besoin de constance pour s'attacher à votre contenu.",
-                                "Diversifiez vos sources de revenus : publicités, sponsoring, affiliation, vente de produits dérivés. Ne dépendez jamais d'une seule source de monétisation."
-                            ],
-                            "tips": "Commencez par partager vos connaissances dans votre domaine d'études. Vous avez une expertise naturelle que beaucoup recherchent !"
-                        },
-                        {
-                            "subtitle": "Blogging et rédaction web",
-                            "text": [
-                                "Un blog peut devenir une source de revenus passifs considérable. Choisissez un sujet qui vous passionne et dans lequel vous avez une expertise, même relative.",
-                                "Monétisez votre blog avec l'affiliation, la publicité, la vente de produits numériques (ebooks, cours en ligne) ou les articles sponsorisés.",
-                                "La rédaction web freelance est également très demandée. De nombreuses entreprises externalisent la création de leur contenu et recherchent des rédacteurs de qualité."
-                            ]
-                        }
-                    ]
-                },
-                {
-                    "title": "Applications et Micro-services",
-                    "description": "Exploitez l'économie des applications mobiles et des micro-services pour générer des revenus complémentaires.",
-                    "content": [
-                        {
-                            "subtitle": "Apps de services et tâches rémunérées",
-                            "text": [
-                                "Des applications comme Uber Eats, Deliveroo, ou TaskRabbit vous permettent de générer des revenus flexibles. Choisissez celles qui s'adaptent le mieux à votre situation et à vos disponibilités.",
-                                "Les missions de livraison peuvent être très rentables aux bonnes heures (déjeuner, dîner, week-ends). Certains livreurs gagnent plus de 15€/heure en optimisant leurs créneaux.",
-                                "Explorez aussi les applications de services à domicile : ménage, jardinage, bricolage, garde d'animaux. Vos compétences personnelles peuvent être monétisées."
-                            ],
-                            "tips": "Calculez toujours votre rentabilité réelle en déduisant les frais (essence, usure du véhicule, temps de trajet). L'optimisation de vos tournées est cruciale !"
-                        },
-                        {
-                            "subtitle": "Micro-investissements et cashback",
-                            "text": [
-                                "Les applications de cashback et de micro-investissement peuvent compléter vos revenus. Rakuten, eBuyClub, ou Yuka pour les courses, Coinbase pour les cryptomonnaies...",
-                                "Participez à des études de marché rémunérées. Votre profil d'étudiant est recherché par les entreprises qui veulent comprendre votre génération.",
-                                "Certaines applications vous paient pour marcher, répondre à des sondages, ou tester des produits. Individuellement, les gains sont faibles, mais cumulés, ils peuvent représenter 50-100€/mois."
-                            ]
-                        }
-                    ]
-                },
-                {
-                    "title": "Optimisation Fiscale et Légale",
-                    "description": "Comprenez vos obligations légales et optimisez votre situation fiscale en tant qu'étudiant entrepreneur.",
-                    "content": [
-                        {
-                            "subtitle": "Statuts et déclarations",
-                            "text": [
-                                "En tant qu'étudiant, vous bénéficiez de certains avantages fiscaux, mais attention aux seuils ! Au-delà de certains montants, vous devez déclarer vos revenus et potentiellement perdre des avantages familiaux.",
-                                "Le statut d'auto-entrepreneur est souvent le plus adapté pour débuter. Les démarches sont simplifiées et vous permet de facturer légalement vos services.",
-                                "Tenez un registre précis de vos revenus et dépenses. Cela vous sera utile pour vos déclarations et vous permettra d'optimiser votre rentabilité."
-                            ],
-                            "tips": "Consultez un comptable ou un conseiller fiscal au moins une fois par an. Cet investissement vous fera souvent économiser plus que son coût !"
-                        },
-                        {
-                            "subtitle": "Gestion de vos revenus",
-                            "text": [
-                                "Diversifiez vos sources de revenus pour réduire les risques. Ne dépendez jamais d'une seule activité, même si elle est très rentable.",
-                                "Épargnez automatiquement une partie de vos revenus. Même 10-20% mis de côté chaque mois vous constitueront rapidement une réserve de sécurité.",
-                                "Réinvestissez une partie de vos bénéfices dans votre développement : formations, outils, marketing. C'est ainsi que vous passerez de 1000€/mois à 2000€/mois."
-                            ]
-                        }
-                    ]
-                },
-                {
-                    "title": "Plan d'Action sur 30 Jours",
-                    "description": "Votre roadmap détaillée pour atteindre l'objectif de 1000€ en suivant une stratégie progressive.",
-                    "content": [
-                        {
-                            "subtitle": "Semaine 1 : Fondations",
-                            "text": [
-                                "Jours 1-2 : Faites le bilan de vos compétences et ressources. Identifiez 3 activités que vous pouvez commencer immédiatement.",
-                                "Jours 3-4 : Créez vos profils sur les plateformes pertinentes (freelancing, cours particuliers, vente en ligne).",
-                                "Jours 5-7 : Lancez vos premières actions : postez vos premiers services, contactez vos premiers prospects, créez votre premier contenu.",
-                                "Objectif semaine 1 : 100-200€ de revenus potentiels identifiés et premiers pas concrets réalisés."
-                            ],
-                            "tips": "Ne cherchez pas la perfection dès le début. Mieux vaut lancer une offre imparfaite que de ne rien lancer du tout !"
-                        },
-                        {
-                            "subtitle": "Semaines 2-3 : Accélération",
-                            "text": [
-                                "Optimisez vos premières actions en fonction des retours. Ajustez vos tarifs, améliorez vos descriptions, affinez votre ciblage.",
-                                "Diversifiez vos sources de revenus. Si le freelancing fonctionne bien, maintenez-le mais ajoutez les cours particuliers ou la vente en ligne.",
-                                "Automatisez ce qui peut l'être : réponses types, processus de commande, planification des publications sur les réseaux sociaux.",
-                                "Objectif semaines 2-3 : 400-600€ de revenus générés et systèmes optimisés."
-                            ]
-                        },
-                        {
-                            "subtitle": "Semaine 4 : Finalisation",
-                            "text": [
-                                "Concentrez-vous sur les activités les plus rentables. Éliminez ou réduisez celles qui ne rapportent pas assez par rapport au temps investi.",
-                                "Préparez le mois suivant : commandes récurrentes, clients fidélisés, contenu planifié à l'avance.",
-                                "Analysez vos résultats et identifiez les axes d'amélioration pour reproduire et amplifier vos succès.",
-                                "Objectif semaine 4 : Atteindre ou dépasser les 1000€ et avoir un système reproductible pour les mois suivants."
-                            ]
-                        }
-                    ]
-                },
-                {
-                    "title": "Bonus : Outils et Ressources",
-                    "description": "Votre boîte à outils complète avec applications, sites web et ressources pour maximiser vos résultats.",
-                    "content": [
-                        {
-                            "subtitle": "Applications indispensables",
-                            "text": [
-                                "Gestion : Notion (organisation), Todoist (tâches), Toggl (suivi du temps), Revolut (banque digitale)",
-                                "Création : Canva (design), Grammarly (correction), Loom (vidéos), Unsplash (images gratuites)",
-                                "Vente : Shopify (e-commerce), Mailchimp (email marketing), Hootsuite (réseaux sociaux), Stripe (paiements)"
-                            ],
-                            "tips": "Maîtrisez bien 2-3 outils plutôt que d'en utiliser 10 moyennement. L'efficacité vient de la maîtrise, pas de la quantité !"
-                        },
-                        {
-                            "subtitle": "Plateformes et communautés",
-                            "text": [
-                                "Freelancing : Upwork, Fiverr, 5euros.com, Malt, Freelancer.com",
-                                "Cours particuliers : Superprof, Kelprof, Acadomia, Coursenligne.fr",
-                                "Vente : Facebook Marketplace, Vinted, Leboncoin, Amazon, Etsy",
-                                "Communautés : Discord des entrepreneurs étudiants, groupes Facebook spécialisés, forums Reddit"
-                            ]
-                        }
-                    ]
-                }
-            ]
-        }
+    async def ensure_indexes(self):
+        """Create the catalog indexes, adopting documents from before slugs"""
+        legacy = await self.db.ebook_content.find({"slug": {"$exists": False}}, {"_id": 1}).to_list(None)
+        for i, document in enumerate(legacy):
+            # find_one() served the first document, keep it the latest version
+            await self.db.ebook_content.update_one(
+                {"_id": document["_id"]},
+                {"$set": {"slug": DEFAULT_EBOOK_SLUG, "version": len(legacy) - i}}
+            )
+        await self.db.ebook_content.create_index([("slug", 1), ("version", -1)], unique=True)
     
-    async def get_ebook_content(self) -> Dict[str, Any]:
-        """Get ebook content"""
+    async def _cached(self, namespace: str, loader, item: Optional[str] = None):
+        """Read through the in-process cache"""
+        key = namespace if item is None else f"{namespace}:{item}"
+        return await self.cache.get_or_load(key, loader, self.cache_ttls[namespace])
+    
+    async def get_ebook_content(self, slug: str = DEFAULT_EBOOK_SLUG) -> Optional[Dict[str, Any]]:
+        """Get the latest version of an ebook, None if the slug is unknown"""
         try:
-            # Try to get from database first
-            content = await self.db.ebook_content.find_one()
-            if content:
-                return content
-            
-            # Return default content if not found in database
-            return self.ebook_content
+            return await self._cached("ebook_content", partial(self._load_ebook_content, slug), slug)
         except Exception as e:
+            if slug != DEFAULT_EBOOK_SLUG:
+                raise
             logger.error(f"Error getting ebook content: {str(e)}")
             return self.ebook_content
     
-    async def generate_pdf(self, user_agent: str, ip_address: str) -> str:
+    async def get_ebook_content_payload(self, slug: str = DEFAULT_EBOOK_SLUG) -> Optional[JsonPayload]:
+        """Get the serialized and compressed content response of an ebook"""
+        content = await self.get_ebook_content(slug)
+        if content is None:
+            return None
+        return await self._payload(f"ebook_content:{slug}", content, lambda: {"success": True, "data": content})
+    
+    async def _payload(self, key: str, source: Any, build) -> JsonPayload:
+        """Get the payload built from source, rebuilding it only when source changes"""
+        # The read cache hands out the same object until it reloads
+        cached = self._payloads.get(key)
+        if cached is None or cached[0] is not source:
+            cached = self._payloads[key] = (source, await asyncio.to_thread(lambda: JsonPayload(build())))
+        return cached[1]
+    
+    async def _load_ebook_content(self, slug: str) -> Optional[Dict[str, Any]]:
+        """Load ebook content from the database"""
+        # Try to get from database first, through the (slug, version) index
+        with MONGO_LATENCY.labels("get_ebook_content").time():
+            content = await self.db.ebook_content.find_one({"slug": slug}, {"_id": 0}, sort=[("version", -1)])
+        if content:
+            return content
+        
+        # Return default content if not found in database
+        return self.ebook_content if slug == DEFAULT_EBOOK_SLUG else None
+    
+    async def get_table_of_contents(self, slug: str = DEFAULT_EBOOK_SLUG) -> Optional[JsonPayload]:
+        """Get the titles, descriptions and section counts of an ebook's chapters"""
+        return await self._cached("toc", partial(self._load_table_of_contents, slug), slug)
+    
+    async def _load_table_of_contents(self, slug: str) -> Optional[JsonPayload]:
+        """Load the table of contents without the chapter texts"""
+        projection = {
+            "_id": 0, "slug": 1, "version": 1, "title": 1, "subtitle": 1, "author": 1, "pages": 1,
+            "chapters.title": 1, "chapters.description": 1,
+            # Sections are only counted, their subtitle is the smallest field to fetch
+            "chapters.content.subtitle": 1,
+        }
+        with MONGO_LATENCY.labels("get_table_of_contents").time():
+            content = await self.db.ebook_content.find_one({"slug": slug}, projection, sort=[("version", -1)])
+        if not content:
+            if slug != DEFAULT_EBOOK_SLUG:
+                return None
+            content = self.ebook_content
+        
+        toc = TableOfContents(
+            **{key: value for key, value in content.items() if key != "chapters"},
+            chapters=[
+                ChapterSummary(
+                    number=i + 1,
+                    title=chapter["title"],
+                    description=chapter["description"],
+                    section_count=len(chapter.get("content", []))
+                )
+                for i, chapter in enumerate(content["chapters"])
+            ]
+        )
+        return await asyncio.to_thread(JsonPayload, {"success": True, "data": toc})
+    
+    async def get_chapter(self, number: int, slug: str = DEFAULT_EBOOK_SLUG) -> Optional[JsonPayload]:
+        """Get one chapter of an ebook by its 1-based number, None if either is unknown"""
+        if number < 1:
+            return None
+        return await self._cached("chapter", partial(self._load_chapter, slug, number), f"{slug}:{number}")
+    
+    async def _load_chapter(self, slug: str, number: int) -> Optional[JsonPayload]:
+        """Load a single chapter, slicing the chapters array in Mongo"""
+        projection = {"_id": 0, "version": 1, "chapters": {"$slice": [number - 1, 1]}}
+        with MONGO_LATENCY.labels("get_chapter").time():
+            content = await self.db.ebook_content.find_one({"slug": slug}, projection, sort=[("version", -1)])
+        if not content:
+            if slug != DEFAULT_EBOOK_SLUG:
+                return None
+            content = {"chapters": self.ebook_content["chapters"][number - 1:number]}
+        
+        if not content["chapters"]:
+            return None
+        chapter = {"number": number, **content["chapters"][0]}
+        return await asyncio.to_thread(JsonPayload, {"success": True, "data": chapter})
+    
+    async def list_ebooks(self, skip: int = 0, limit: int = 50) -> List[EbookSummary]:
+        """List the latest version of each ebook in the catalog"""
+        return await self._cached("catalog", partial(self._load_catalog, skip, limit), f"{skip}:{limit}")
+    
+    async def _load_catalog(self, skip: int, limit: int) -> List[EbookSummary]:
+        """Load a catalog page from the database"""
+        fields = ("title", "subtitle", "author", "pages")
+        pipeline = [
+            # Walks the (slug, version) index, chapters are never loaded
+            {"$sort": {"slug": 1, "version": -1}},
+            {"$project": {"slug": 1, "version": 1, **{field: 1 for field in fields}}},
+            {"$group": {
+                "_id": "$slug",
+                "version": {"$first": "$version"},
+                **{field: {"$first": f"${field}"} for field in fields},
+            }},
+            {"$sort": {"_id": 1}},
+            {"$skip": skip},
+            {"$limit": limit},
+        ]
+        with MONGO_LATENCY.labels("list_ebooks").time():
+            documents = await self.db.ebook_content.aggregate(pipeline).to_list(limit)
+        ebooks = [EbookSummary(slug=document.pop("_id"), **document) for document in documents]
+        
+        if not ebooks and skip == 0:
+            ebooks = [EbookSummary(**self.ebook_content)]
+        return ebooks
+    
+    async def generate_pdf(self, user_agent: str, ip_address: str, slug: Optional[str] = None,
+                           ttl_hours: Optional[float] = None, max_downloads: Optional[int] = None,
+                           output_profile: Optional[str] = None) -> str:
         """Generate PDF and return token"""
+        slug = slug or DEFAULT_EBOOK_SLUG
+        output_profile = self.pdf_generator.get_profile(output_profile).name
         try:
             # Get ebook content
-            content = await self.get_ebook_content()
+            content = await self.get_ebook_content(slug)
+            if content is None:
+                raise EbookNotFound(slug)
             
-            # Generate PDF
-            token = self.pdf_generator.generate_pdf(content)
+            # Generate PDF, rendering it only on a cache miss
+            key = self._get_content_key(slug, content, output_profile)
+            cached = await asyncio.to_thread(self.pdf_generator.cache.touch_artifact, key)
+            record_cache("pdf_artifact", hit=cached)
+            if not cached:
+                await self._render(key, content, output_profile)
+            watermark_id = None
+            if self.watermark:
+                watermark_id = self._new_watermark_id()
+                await self._stamp(key, watermark_id, ip_address, output_profile)
+            with MONGO_LATENCY.labels("generate_pdf").time():
+                token = (await self.tokens.mint(key, slug, ttl_hours, max_downloads, watermark_id)).token
             
-            # Track download
+            # Track download, written in the background with the next batch
             download_record = DownloadTracking(
                 user_agent=user_agent,
                 ip_address=ip_address,
-                filename=f"ebook_{token}.pdf"
+                filename=f"ebook_{token}.pdf",
+                slug=slug,
+                watermark_id=watermark_id
             )
-            await self.db.download_tracking.insert_one(download_record.dict())
+            self.download_writer.add(download_record)
             
             return token
             
+        except EbookNotFound:
+            raise
         except Exception as e:
             logger.error(f"Error generating PDF: {str(e)}")
             raise
     
-    async def get_statistics(self) -> Statistics:
-        """Get platform statistics"""
+    async def stream_pdf(self, user_agent: str, ip_address: str, slug: Optional[str] = None,
+                         max_size: int = 4 * 1024 * 1024,
+                         output_profile: Optional[str] = None) -> Tuple[Optional[bytes], Optional[str]]:
+        """Render a PDF for a single response, without storing it or minting a token.
+
+        Returns the PDF bytes, or the path of a temp file holding them when
+        larger than max_size; the caller must delete the file.
+        """
+        slug = slug or DEFAULT_EBOOK_SLUG
+        output_profile = self.pdf_generator.get_profile(output_profile).name
+        content = await self.get_ebook_content(slug)
+        if content is None:
+            raise EbookNotFound(slug)
+        
+        watermark_id = self._new_watermark_id() if self.watermark else None
+        watermark = (watermark_id, self._watermark_text(watermark_id, ip_address)) if watermark_id else None
+        started = time.monotonic()
+        data, path, timings, optimization = await self.render_pool.run(
+            render_spooled, self.pdf_generator.storage_path, content, max_size, watermark, output_profile
+        )
+        record_render(time.monotonic() - started, timings)
+        record_optimization(optimization)
+        
+        self.download_writer.add(DownloadTracking(
+            user_agent=user_agent,
+            ip_address=ip_address,
+            filename=f"{slug}.pdf",
+            slug=slug,
+            watermark_id=watermark_id
+        ))
+        return data, path
+    
+    @staticmethod
+    def _new_watermark_id() -> str:
+        return uuid.uuid4().hex[:16]
+    
+    @staticmethod
+    def _watermark_text(watermark_id: str, ip_address: str) -> str:
+        """Footer printed on each page of a watermarked download"""
+        return (f"Exemplaire personnel n° {watermark_id} · {mask_ip(ip_address)} · "
+                f"{datetime.utcnow().strftime('%d/%m/%Y')}")
+    
+    async def _stamp(self, key: str, watermark_id: str, ip_address: str, output_profile: str):
+        """Store a watermarked copy of an artifact for one download"""
+        _, seconds = await self.render_pool.run(
+            stamp_artifact, self.pdf_generator.storage_path, key, watermark_id,
+            self._watermark_text(watermark_id, ip_address), output_profile
+        )
+        RENDER_PHASE_DURATION.labels("watermark").observe(seconds)
+    
+    def _get_content_key(self, slug: str, content: Dict[str, Any], output_profile: Optional[str] = None) -> str:
+        """Get the render cache key, hashing each loaded content only once per output profile"""
+        output_profile = self.pdf_generator.get_profile(output_profile).name
+        # The content cache hands out the same object until it reloads
+        keyed = self._content_keys.get((slug, output_profile))
+        if keyed is None or keyed[0] is not content:
+            keyed = self._content_keys[(slug, output_profile)] = (
+                content, self.pdf_generator.get_cache_key(content, output_profile)
+            )
+        return keyed[1]
+    
+    async def warm(self, slug: str = DEFAULT_EBOOK_SLUG) -> str:
+        """Pre-render the current ebook in the default output profile so requests only mint tokens"""
+        output_profile = self.pdf_generator.output_profile.name
+        content = await self.get_ebook_content(slug)
+        key = self._get_content_key(slug, content, output_profile)
+        if not await asyncio.to_thread(self.pdf_generator.cache.has_artifact, key):
+            logger.info(f"Warming PDF artifact: {key}")
+            await self._render(key, content, output_profile)
+        
+        self.ready = True
+        return key
+    
+    async def _render(self, key: str, content: Dict[str, Any], output_profile: str):
+        """Render content in the pool, coalescing concurrent renders of the same key"""
+        render = self._renders.get(key)
+        if render is None:
+            render = asyncio.ensure_future(self._run_render(content, output_profile))
+            self._renders[key] = render
+            render.add_done_callback(lambda _: self._renders.pop(key, None))
+        
+        # Shield: a disconnecting client must not cancel a render others wait on
+        await asyncio.shield(render)
+    
+    async def _run_render(self, content: Dict[str, Any], output_profile: str) -> str:
+        """Render content in the pool and record its timings"""
+        # Set when the request that started this render is being profiled
+        session = current_session.get()
+        started = time.monotonic()
+        key, timings, stats, optimization = await self.render_pool.run(
+            render_artifact, self.pdf_generator.storage_path, content, session is not None, output_profile
+        )
+        record_render(time.monotonic() - started, timings)
+        record_optimization(optimization)
+        if session and stats:
+            await session.save("render", stats)
+        return key
+    
+    def ebook_download_counter(self, slug: Optional[str]) -> ShardedCounter:
+        """Get the download counter of an ebook"""
+        slug = slug or DEFAULT_EBOOK_SLUG
+        counter = self._ebook_counters.get(slug)
+        if counter is None:
+            counter = self._ebook_counters[slug] = ShardedCounter(self.db.counters, f"downloads:{slug}")
+        return counter
+    
+    async def get_statistics(self, slug: Optional[str] = None) -> Statistics:
+        """Get platform statistics, or those of one ebook"""
         try:
-            total_downloads = await self.db.download_tracking.count_documents({})
-            return Statistics(total_downloads=total_downloads)
+            return await self._cached("statistics", partial(self._load_statistics, slug), slug)
         except Exception as e:
             logger.error(f"Error getting statistics: {str(e)}")
             return Statistics()
     
+    async def get_statistics_payload(self, slug: Optional[str] = None) -> JsonPayload:
+        """Get the serialized statistics response"""
+        statistics = await self.get_statistics(slug)
+        return await self._payload(f"statistics:{slug}", statistics, lambda: statistics)
+    
+    async def _load_statistics(self, slug: Optional[str] = None) -> Statistics:
+        """Load statistics from the database"""
+        counter = self.download_counter if slug is None else self.ebook_download_counter(slug)
+        with MONGO_LATENCY.labels("get_statistics").time():
+            total_downloads = await counter.get()
+        return Statistics(total_downloads=total_downloads)
+    
+    async def reconcile_download_counter(self) -> int:
+        """Recount download_tracking and its archive, and correct the total and per-ebook counters"""
+        exact = 0
+        groups = []
+        with MONGO_LATENCY.labels("reconcile_download_counter").time():
+            for collection in (self.db.download_tracking, self.db.download_tracking_archive):
+                exact += await collection.count_documents({})
+                groups += await collection.aggregate([
+                    {"$group": {"_id": "$slug", "count": {"$sum": 1}}}
+                ]).to_list(None)
+        drift = await self.download_counter.reconcile(exact)
+        
+        # Records from before the catalog have no slug and belong to the default ebook
+        per_ebook: Dict[str, int] = {}
+        for group in groups:
+            slug = group["_id"] or DEFAULT_EBOOK_SLUG
+            per_ebook[slug] = per_ebook.get(slug, 0) + group["count"]
+        # Counters of ebooks whose records were all purged go back to zero
+        async for shard in self.db.counters.find({"_id": {"$regex": r"^downloads:.+:\d+$"}}, {"_id": 1}):
+            slug = shard["_id"][len("downloads:"):].rsplit(":", 1)[0]
+            per_ebook.setdefault(slug, 0)
+        ebook_drift = 0
+        for slug, count in per_ebook.items():
+            ebook_drift += abs(await self.ebook_download_counter(slug).reconcile(count))
+        
+        if drift or ebook_drift:
+            self.cache.invalidate_namespace("statistics")
+        return drift
+    
     async def get_testimonials(self) -> List[Dict[str, Any]]:
         """Get testimonials"""
         try:
-            testimonials = await self.db.testimonials.find().to_list(1000)
-            if testimonials:
-                return testimonials
-            
-            # Return default testimonials
-            return [
-                {
-                    "name": "Marie L.",
-                    "role": "Étudiante en Commerce",
-                    "content": "J'ai réussi à gagner 1200€ en suivant les conseils sur le freelancing. Parfait pour financer mes études !",
-                    "rating": 5
-                },
-                {
-                    "name": "Thomas R.",
-                    "role": "Étudiant en Informatique",
-                    "content": "Les stratégies de vente en ligne m'ont permis de créer un complément de revenus stable. Très pratique !",
-                    "rating": 5
-                },
-                {
-                    "name": "Sarah M.",
-                    "role": "Étudiante en Droit",
-                    "content": "Guide très complet avec des méthodes réalistes. J'ai pu économiser pour mon voyage d'études.",
-                    "rating": 5
-                }
-            ]
+            return await self._cached("testimonials", self._load_testimonials)
         except Exception as e:
             logger.error(f"Error getting testimonials: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+    
+    async def get_testimonials_payload(self) -> JsonPayload:
+        """Get the serialized testimonials response"""
+        testimonials = await self.get_testimonials()
+        return await self._payload("testimonials", testimonials, lambda: {"success": True, "data": testimonials})
+    
+    async def _load_testimonials(self) -> List[Dict[str, Any]]:
+        """Load testimonials from the database"""
+        with MONGO_LATENCY.labels("get_testimonials").time():
+            testimonials = await self.db.testimonials.find({}, {"_id": 0}).to_list(1000)
+        if testimonials:
+            return testimonials
+        
+        # Return default testimonials
+        return [
+            {
+                "name": "Marie L.",
+                "role": "Étudiante en Commerce",
+                "content": "J'ai réussi à gagner 1200€ en suivant les conseils sur le freelancing. Parfait pour financer mes études !",
+                "rating": 5
+            },
+            {
+                "name": "Thomas R.",
+                "role": "Étudiant en Informatique",
+                "content": "Les stratégies de vente en ligne m'ont permis de créer un complément de revenus stable. Très pratique !",
+                "rating": 5
+            },
+            {
+                "name": "Sarah M.",
+                "role": "Étudiante en Droit",
+                "content": "Guide très complet avec des méthodes réalistes. J'ai pu économiser pour mon voyage d'études.",
+                "rating": 5
+            }
+        ]
\ No newline at end of file
@@ -0,0 +1,263 @@
+import os
+import uuid
+import shutil
+import logging
+import tempfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Iterator, Optional, Union
+from urllib.parse import urlparse, quote
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ArtifactNotFound(Exception):
+    """Raised when an artifact does not exist in the store"""
+
+
+class ArtifactStore(ABC):
+    """Storage for rendered PDFs, chapter parts and watermarked copies.
+
+    Objects are addressed by slash-separated names such as
+    ``artifacts/<key>.pdf``. Implementations must make ``put`` and
+    ``put_file`` atomic: readers see either the old object or the new one.
+    """
+
+    # Local directory where renders are written before put_file
+    scratch_path: Path
+
+    @abstractmethod
+    def put(self, name: str, data: bytes):
+        """Store bytes under name"""
+
+    @abstractmethod
+    def put_file(self, name: str, path: Path):
+        """Store a local file under name, consuming the file"""
+
+    @abstractmethod
+    def get(self, name: str) -> bytes:
+        """Read an object"""
+
+    @abstractmethod
+    def stream(self, name: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Iterate over an inclusive byte range of an object"""
+
+    @abstractmethod
+    def size(self, name: str) -> int:
+        """Get the size of an object in bytes"""
+
+    @abstractmethod
+    def exists(self, name: str) -> bool:
+        """Check if an object exists"""
+
+    @abstractmethod
+    def delete(self, name: str):
+        """Delete an object, ignoring missing ones"""
+
+    @abstractmethod
+    def touch(self, name: str):
+        """Reset the age of an object so cleanup keeps it"""
+
+    @abstractmethod
+    def list_older_than(self, prefix: str, cutoff: float) -> Iterator[str]:
+        """List names under prefix last modified before the cutoff timestamp"""
+
+    def presigned_url(self, name: str, filename: str, expires: int = 3600) -> Optional[str]:
+        """Get a time-limited direct download URL, None if unsupported"""
+        return None
+
+    def cleanup_scratch(self, cutoff: float):
+        """Delete scratch files last modified before the cutoff timestamp, left by interrupted renders"""
+        if not self.scratch_path.is_dir():
+            return
+        for entry in os.scandir(self.scratch_path):
+            if entry.is_file(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                Path(entry.path).unlink(missing_ok=True)
+
+
+class LocalArtifactStore(ArtifactStore):
+    """Artifact store on the local filesystem"""
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+        self.scratch_path = self.root / "tmp"
+        self.scratch_path.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, name: str) -> Path:
+        return self.root / name
+
+    def put(self, name: str, data: bytes):
+        temp_path = self.scratch_path / f"{uuid.uuid4().hex}.tmp"
+        temp_path.write_bytes(data)
+        self.put_file(name, temp_path)
+
+    def put_file(self, name: str, path: Path):
+        target = self._path(name)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Atomic rename on the same filesystem, copy otherwise
+        shutil.move(str(path), str(target))
+
+    def get(self, name: str) -> bytes:
+        try:
+            return self._path(name).read_bytes()
+        except FileNotFoundError:
+            raise ArtifactNotFound(name)
+
+    def stream(self, name: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        try:
+            file = open(self._path(name), "rb")
+        except FileNotFoundError:
+            raise ArtifactNotFound(name)
+        with file:
+            file.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = file.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def size(self, name: str) -> int:
+        try:
+            return self._path(name).stat().st_size
+        except FileNotFoundError:
+            raise ArtifactNotFound(name)
+
+    def exists(self, name: str) -> bool:
+        return self._path(name).exists()
+
+    def delete(self, name: str):
+        self._path(name).unlink(missing_ok=True)
+
+    def touch(self, name: str):
+        try:
+            os.utime(self._path(name))
+        except FileNotFoundError:
+            raise ArtifactNotFound(name)
+
+    def list_older_than(self, prefix: str, cutoff: float) -> Iterator[str]:
+        directory = self._path(prefix)
+        if not directory.is_dir():
+            return
+        for entry in os.scandir(directory):
+            if entry.is_file(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                yield f"{prefix.rstrip('/')}/{entry.name}"
+
+
+class S3ArtifactStore(ArtifactStore):
+    """Artifact store in an S3-compatible bucket (AWS S3, MinIO, ...)"""
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None):
+        import boto3
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.scratch_path = Path(tempfile.gettempdir()) / "pdf-renders"
+        self.scratch_path.mkdir(parents=True, exist_ok=True)
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}{name}"
+
+    @staticmethod
+    def _is_not_found(error) -> bool:
+        code = error.response.get("Error", {}).get("Code")
+        return code in ("404", "NoSuchKey", "NotFound")
+
+    def _call(self, name: str, method: str, **params):
+        """Call an S3 object API, mapping missing objects to ArtifactNotFound"""
+        from botocore.exceptions import ClientError
+
+        try:
+            return getattr(self.client, method)(Bucket=self.bucket, Key=self._key(name), **params)
+        except ClientError as e:
+            if self._is_not_found(e):
+                raise ArtifactNotFound(name)
+            raise
+
+    def put(self, name: str, data: bytes):
+        self._call(name, "put_object", Body=data, ContentType="application/pdf")
+
+    def put_file(self, name: str, path: Path):
+        try:
+            self.client.upload_file(
+                str(path), self.bucket, self._key(name),
+                ExtraArgs={"ContentType": "application/pdf"}
+            )
+        finally:
+            Path(path).unlink(missing_ok=True)
+
+    def get(self, name: str) -> bytes:
+        return self._call(name, "get_object")["Body"].read()
+
+    def stream(self, name: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        body = self._call(name, "get_object", Range=byte_range)["Body"]
+        try:
+            yield from body.iter_chunks(CHUNK_SIZE)
+        finally:
+            body.close()
+
+    def size(self, name: str) -> int:
+        return self._call(name, "head_object")["ContentLength"]
+
+    def exists(self, name: str) -> bool:
+        try:
+            self._call(name, "head_object")
+            return True
+        except ArtifactNotFound:
+            return False
+
+    def delete(self, name: str):
+        self._call(name, "delete_object")
+
+    def touch(self, name: str):
+        # An in-place copy is the only way to refresh LastModified
+        self._call(
+            name, "copy_object",
+            CopySource={"Bucket": self.bucket, "Key": self._key(name)},
+            MetadataDirective="REPLACE",
+            ContentType="application/pdf"
+        )
+
+    def list_older_than(self, prefix: str, cutoff: float) -> Iterator[str]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for item in page.get("Contents", []):
+                if item["LastModified"].timestamp() < cutoff:
+                    yield item["Key"][len(self.prefix):]
+
+    def presigned_url(self, name: str, filename: str, expires: int = 3600) -> Optional[str]:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self._key(name),
+                "ResponseContentDisposition": f"attachment; filename*=utf-8''{quote(filename)}",
+            },
+            ExpiresIn=expires
+        )
+
+
+def create_store(location: str) -> ArtifactStore:
+    """Create a store from a local path, file:// or s3://bucket/prefix URL.
+
+    S3 credentials come from the usual boto3 sources; ``S3_ENDPOINT_URL``
+    points the client at a compatible service such as MinIO.
+    """
+    parsed = urlparse(location)
+    if parsed.scheme == "s3":
+        return S3ArtifactStore(
+            bucket=parsed.netloc,
+            prefix=parsed.path,
+            endpoint_url=os.environ.get("S3_ENDPOINT_URL")
+        )
+    if parsed.scheme == "file":
+        return LocalArtifactStore(parsed.path)
+    if parsed.scheme:
+        raise ValueError(f"Unsupported artifact store: {location}")
+    return LocalArtifactStore(location)
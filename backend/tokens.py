@@ -0,0 +1,123 @@
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from pymongo import ReturnDocument
+from models import DownloadToken
+
+logger = logging.getLogger(__name__)
+
+# Share of the file a limited token may send on top of its downloads, for
+# the byte ranges PDF viewers fetch twice
+RANGE_ALLOWANCE = 0.1
+
+
+class TokenRegistry:
+    """Maps download tokens to artifacts, with expiry and download limits.
+
+    Tokens are documents in the ``download_tokens`` collection keyed by
+    ``_id``, so validation is a single index lookup, and a TTL index on
+    ``expires_at`` purges them. Unlimited tokens are also kept in an
+    in-memory LRU so repeated downloads skip Mongo entirely. Tokens with a
+    download limit always go to Mongo, where the bytes they serve are
+    charged atomically: a limit of n downloads is a budget of n times the
+    file, however the client splits it into ranges.
+    """
+
+    def __init__(self, collection, ttl_hours: float = 24, max_downloads: Optional[int] = None,
+                 lru_size: int = 10000):
+        self.collection = collection
+        self.ttl_hours = ttl_hours
+        self.max_downloads = max_downloads
+        self.lru_size = lru_size
+        self._lru: "OrderedDict[str, DownloadToken]" = OrderedDict()
+
+    async def ensure_indexes(self):
+        """Create the TTL index that purges expired tokens"""
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def mint(self, artifact: str, slug: Optional[str] = None, ttl_hours: Optional[float] = None,
+                   max_downloads: Optional[int] = None, watermark_id: Optional[str] = None) -> DownloadToken:
+        """Register a new token for an artifact of an ebook, or for a watermarked copy of it"""
+        record = DownloadToken(
+            artifact=artifact,
+            slug=slug,
+            watermark_id=watermark_id,
+            expires_at=datetime.utcnow() + timedelta(hours=ttl_hours or self.ttl_hours),
+            max_downloads=max_downloads or self.max_downloads
+        )
+        document = record.dict()
+        document["_id"] = document.pop("token")
+        await self.collection.insert_one(document)
+
+        if record.max_downloads is None:
+            self._remember(record)
+        return record
+
+    async def resolve(self, token: str) -> Optional[DownloadToken]:
+        """Get a valid token without counting a download"""
+        cached = self._lookup(token)
+        if cached:
+            return cached
+
+        document = await self.collection.find_one({"_id": token, "expires_at": {"$gt": datetime.utcnow()}})
+        return self._from_document(document)
+
+    async def redeem(self, token: str, length: int, size: int) -> Optional[DownloadToken]:
+        """Charge a transfer of length bytes of a size-byte file to a token, None if it is invalid or used up"""
+        cached = self._lookup(token)
+        if cached:
+            return cached
+
+        now = datetime.utcnow()
+        allowance = int(size * RANGE_ALLOWANCE)
+        document = await self.collection.find_one_and_update(
+            {
+                "_id": token,
+                "expires_at": {"$gt": now},
+                "$or": [
+                    {"max_downloads": None},
+                    {"$expr": {"$lte": [
+                        {"$add": [{"$ifNull": ["$served_bytes", 0]}, length]},
+                        {"$add": [{"$multiply": ["$max_downloads", size]}, allowance]},
+                    ]}},
+                ],
+            },
+            {"$inc": {"served_bytes": length}},
+            return_document=ReturnDocument.AFTER
+        )
+        return self._from_document(document)
+
+    @staticmethod
+    def has_download_left(record: DownloadToken, size: int) -> bool:
+        """Whether a token can still serve a whole download of a size-byte file"""
+        if record.max_downloads is None:
+            return True
+        return record.served_bytes + size <= record.max_downloads * size + int(size * RANGE_ALLOWANCE)
+
+    def _from_document(self, document: Optional[Dict[str, Any]]) -> Optional[DownloadToken]:
+        """Build a token from its document, caching unlimited ones"""
+        if not document:
+            return None
+        record = DownloadToken(token=document.pop("_id"), **document)
+        if record.max_downloads is None:
+            self._remember(record)
+        return record
+
+    def _lookup(self, token: str) -> Optional[DownloadToken]:
+        """Get an unexpired token from the LRU"""
+        record = self._lru.get(token)
+        if record is None:
+            return None
+        if record.expires_at <= datetime.utcnow():
+            del self._lru[token]
+            return None
+        self._lru.move_to_end(token)
+        return record
+
+    def _remember(self, record: DownloadToken):
+        """Add a token to the LRU, evicting the least recently used"""
+        self._lru[record.token] = record
+        self._lru.move_to_end(record.token)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
@@ -0,0 +1,198 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from pymongo.errors import BulkWriteError
+from models import DownloadTracking
+from counters import ShardedCounter
+from metrics import DOWNLOAD_BUFFER_DEPTH, DOWNLOAD_FLUSH_DURATION, DOWNLOAD_RECORDS
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no lock, one process per spill file
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadWriter:
+    """Buffers download records and writes them to Mongo in batches.
+
+    Records are flushed with ``insert_many(ordered=False)`` when the buffer
+    reaches ``batch_size`` or every ``flush_interval`` seconds. Batches that
+    cannot be written in time are spilled to a bounded JSONL file and
+    replayed on a later flush. Records use their ``id`` as ``_id`` so that a
+    replay of a batch that did reach Mongo is rejected as duplicates instead
+    of being counted twice. Several processes can share the spill file: an
+    flock on ``<spill file>.lock`` keeps appends and the rename taking the
+    file for replay apart, and each replay reads its own renamed copy.
+    """
+
+    def __init__(self, collection, counter: Optional[ShardedCounter] = None,
+                 ebook_counter: Optional[Callable[[Optional[str]], ShardedCounter]] = None, batch_size: int = 100,
+                 flush_interval: float = 1.0, insert_timeout: float = 5.0,
+                 spill_path: Optional[str] = None, max_spill_bytes: int = 50 * 1024 * 1024):
+        self.collection = collection
+        self.counter = counter
+        # Per-ebook counter for a record's slug, incremented alongside the total
+        self.ebook_counter = ebook_counter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.insert_timeout = insert_timeout
+        self.spill_path = Path(spill_path) if spill_path else None
+        self.max_spill_bytes = max_spill_bytes
+        self.buffer: List[DownloadTracking] = []
+        self._full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, record: DownloadTracking):
+        """Queue a record for the next flush"""
+        self.buffer.append(record)
+        DOWNLOAD_BUFFER_DEPTH.inc()
+        if len(self.buffer) >= self.batch_size:
+            self._full.set()
+
+    def start(self):
+        """Start the background flush loop"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write out everything still buffered"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        """Flush on size or time thresholds"""
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing download records: {str(e)}")
+
+    async def flush(self):
+        """Write buffered and spilled records to Mongo"""
+        async with self._flush_lock:
+            healthy = True
+            while self.buffer:
+                batch, self.buffer = self.buffer[:self.batch_size], self.buffer[self.batch_size:]
+                DOWNLOAD_BUFFER_DEPTH.dec(len(batch))
+                if healthy and await self._insert([self._to_document(record) for record in batch]):
+                    continue
+                # Mongo is slow or down: spill the rest without waiting on it again
+                healthy = False
+                self._spill(batch)
+            if healthy and self.spill_path and self.spill_path.exists():
+                await self._replay_spill()
+
+    async def _insert(self, documents: List[Dict[str, Any]]) -> bool:
+        """Insert a batch, return False if it should be retried later"""
+        started = time.monotonic()
+        inserted = documents
+        try:
+            await asyncio.wait_for(
+                self.collection.insert_many(documents, ordered=False),
+                timeout=self.insert_timeout
+            )
+        except BulkWriteError as e:
+            # Duplicates come from replaying a batch that was already written
+            failed = {error.get("index") for error in e.details.get("writeErrors", [])}
+            inserted = [document for i, document in enumerate(documents) if i not in failed]
+            errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+            if errors:
+                logger.error(f"Failed to insert {len(errors)} download records: {errors[0].get('errmsg')}")
+        except Exception as e:
+            logger.error(f"Error inserting download records: {str(e) or type(e).__name__}")
+            return False
+        finally:
+            DOWNLOAD_FLUSH_DURATION.observe(time.monotonic() - started)
+
+        DOWNLOAD_RECORDS.labels("written").inc(len(inserted))
+        if self.counter and inserted:
+            await self.counter.increment(len(inserted))
+        if self.ebook_counter:
+            for slug, count in Counter(document.get("slug") for document in inserted).items():
+                await self.ebook_counter(slug).increment(count)
+        return True
+
+    def _spill(self, batch: List[DownloadTracking]):
+        """Append records to the spill file, dropping them once it is full"""
+        if not self.spill_path:
+            DOWNLOAD_RECORDS.labels("dropped").inc(len(batch))
+            logger.error(f"Dropped {len(batch)} download records, no spill file configured")
+            return
+
+        with self._spill_lock():
+            size = self.spill_path.stat().st_size if self.spill_path.exists() else 0
+            if size >= self.max_spill_bytes:
+                DOWNLOAD_RECORDS.labels("dropped").inc(len(batch))
+                logger.error(f"Dropped {len(batch)} download records, spill file is full")
+                return
+
+            with open(self.spill_path, "a", encoding="utf-8") as spill:
+                for record in batch:
+                    spill.write(record.json() + "\n")
+        DOWNLOAD_RECORDS.labels("spilled").inc(len(batch))
+        logger.warning(f"Spilled {len(batch)} download records to {self.spill_path}")
+
+    @contextmanager
+    def _spill_lock(self):
+        """Hold the lock shared by the processes writing to the spill file"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.spill_path.with_name(self.spill_path.name + ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    async def _replay_spill(self):
+        """Write spilled records back to Mongo"""
+        # Named per process: another worker may be replaying the same spill file
+        replay_name = f"{self.spill_path.name}.{os.getpid()}-{uuid.uuid4().hex[:8]}.replay"
+        replay_path = self.spill_path.with_name(replay_name)
+        with self._spill_lock():
+            try:
+                os.replace(self.spill_path, replay_path)
+            except FileNotFoundError:
+                # Taken by another worker since the exists() check
+                return
+        with open(replay_path, encoding="utf-8") as spill:
+            records = [DownloadTracking.parse_raw(line) for line in spill if line.strip()]
+
+        for i in range(0, len(records), self.batch_size):
+            batch = records[i:i + self.batch_size]
+            if not await self._insert([self._to_document(record) for record in batch]):
+                self._spill(records[i:])
+                break
+        else:
+            logger.info(f"Replayed {len(records)} spilled download records")
+        replay_path.unlink()
+
+    @staticmethod
+    def _to_document(record: DownloadTracking) -> Dict[str, Any]:
+        document = record.dict()
+        document["_id"] = record.id
+        # Analytics rollups pick up events by write time, which lags the timestamp for buffered records
+        document["recorded_at"] = datetime.utcnow()
+        return document
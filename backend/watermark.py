@@ -0,0 +1,115 @@
+import io
+from typing import TYPE_CHECKING, BinaryIO, Dict, Optional, Tuple
+
+# ReportLab and pypdf (which watermarking needs) are imported on first stamp:
+# the API process only imports this module for mask_ip
+if TYPE_CHECKING:
+    from pypdf import PdfReader, PdfWriter
+    from pypdf.generic import IndirectObject, PdfObject
+
+# Gray at 60% opacity, as (red, green, blue, alpha)
+WATERMARK_COLOR = (0.45, 0.45, 0.45, 0.6)
+
+# Resource name of the overlay on stamped pages
+FORM_NAME = "/BksWatermark"
+
+
+def mask_ip(ip_address: str) -> str:
+    """Hide the host part of an IP printed on a page"""
+    if ":" in ip_address:
+        return ":".join(ip_address.split(":")[:3]) + ":…"
+    parts = ip_address.split(".")
+    if len(parts) == 4:
+        return ".".join(parts[:3]) + ".x"
+    return ip_address
+
+
+def render_overlay(text: str, pagesize: Optional[Tuple[float, float]] = None) -> bytes:
+    """Render a one-page transparent PDF with the watermark text in the footer, A4 by default"""
+    from reportlab.lib.colors import Color
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    pagesize = pagesize or A4
+    buffer = io.BytesIO()
+    overlay = canvas.Canvas(buffer, pagesize=pagesize, pageCompression=1)
+    red, green, blue, alpha = WATERMARK_COLOR
+    overlay.setFillColor(Color(red, green, blue, alpha=alpha))
+    overlay.setFont("Helvetica", 7)
+    overlay.drawCentredString(pagesize[0] / 2, 28, text)
+    overlay.showPage()
+    overlay.save()
+    return buffer.getvalue()
+
+
+def _add_object(writer: "PdfWriter", obj: "PdfObject") -> "IndirectObject":
+    """Add an object to writer and get a reference to it.
+
+    pypdf only adds pages and annotations publicly, so this goes through
+    the private PdfWriter._add_object; requirements.txt caps pypdf to the
+    major versions it was checked against.
+    """
+    return writer._add_object(obj)
+
+
+def _overlay_form(overlay: bytes, writer: "PdfWriter") -> "IndirectObject":
+    """Add the overlay page to writer as a Form XObject"""
+    from pypdf import PdfReader
+    from pypdf.generic import DecodedStreamObject, NameObject, RectangleObject
+
+    page = PdfReader(io.BytesIO(overlay)).pages[0]
+    form = DecodedStreamObject()
+    form.set_data(page.get_contents().get_data())
+    form[NameObject("/Type")] = NameObject("/XObject")
+    form[NameObject("/Subtype")] = NameObject("/Form")
+    form[NameObject("/BBox")] = RectangleObject(page.mediabox)
+    form[NameObject("/Resources")] = page["/Resources"].clone(writer)
+    return _add_object(writer, form.flate_encode())
+
+
+def _content_stream(writer: "PdfWriter", data: bytes) -> "IndirectObject":
+    from pypdf.generic import DecodedStreamObject
+
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    return _add_object(writer, stream)
+
+
+def stamp_pdf(base: "PdfReader", overlay: bytes, output: BinaryIO, metadata: Optional[Dict[str, str]] = None):
+    """Write base with the overlay page drawn over each of its pages.
+
+    The overlay is added once as a Form XObject, and each page only gets
+    two shared content streams around its own: ``q`` before it and
+    ``Q q /BksWatermark Do Q`` after it. Page content is neither parsed nor
+    laid out again.
+    """
+    from pypdf import PdfWriter
+    from pypdf.generic import ArrayObject, DictionaryObject, NameObject
+
+    writer = PdfWriter(clone_from=base)
+    form = _overlay_form(overlay, writer)
+    # Save and restore the graphics state so the page's own state cannot leak into the overlay
+    before = _content_stream(writer, b"q\n")
+    after = _content_stream(writer, f"\nQ q {FORM_NAME} Do Q\n".encode("ascii"))
+
+    for page in writer.pages:
+        resources = page.get_inherited("/Resources", None)
+        resources = DictionaryObject() if resources is None else resources.get_object()
+        xobjects = resources.get("/XObject")
+        if xobjects is None:
+            xobjects = resources[NameObject("/XObject")] = DictionaryObject()
+        xobjects.get_object()[NameObject(FORM_NAME)] = form
+        page[NameObject("/Resources")] = resources
+
+        contents = page.get("/Contents")
+        if contents is None:
+            existing = []
+        elif isinstance(contents.get_object(), ArrayObject):
+            existing = list(contents.get_object())
+        else:
+            existing = [contents]
+        page[NameObject("/Contents")] = ArrayObject([before, *existing, after])
+
+    if metadata:
+        writer.add_metadata(metadata)
+    writer.write(output)
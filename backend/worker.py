@@ -0,0 +1,195 @@
+"""Standalone render worker for the durable PDF job queue (``PDF_JOB_QUEUE=mongo``).
+
+Run any number of them, on any node, against the API's Mongo database and
+artifact store; each claims up to ``--concurrency`` jobs at once:
+
+    python worker.py --concurrency 2
+"""
+import os
+import uuid
+import signal
+import socket
+import asyncio
+import logging
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Optional, Set
+
+import typer
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from prometheus_client import start_http_server
+
+import metrics
+from bootstrap import (create_pdf_generator, create_token_registry, create_download_writer,
+                       create_ebook_service, create_job_queue, create_cache_invalidator)
+from jobs import JobQueue
+from models import PDFJob
+from services import EbookService
+from render_pool import RenderPool, RenderQueueFull
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+# Failures of the render processes rather than of the job, worth another attempt
+RETRYABLE_ERRORS = (BrokenProcessPool,)
+
+
+class JobWorker:
+    """Claims jobs from a JobQueue and runs them through an EbookService, up to concurrency at once"""
+
+    def __init__(self, queue: JobQueue, ebook_service: EbookService, worker_id: Optional[str] = None,
+                 concurrency: int = 1, poll_interval: float = 1.0):
+        self.queue = queue
+        self.ebook_service = ebook_service
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._tasks: Set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+        self._wake = asyncio.Event()
+
+    async def run(self):
+        """Claim and process jobs until stop(), then let the jobs in progress finish"""
+        logger.info(f"Render worker {self.worker_id} started, {self.concurrency} jobs at once")
+        while not self._stopping.is_set():
+            if len(self._tasks) < self.concurrency and not self._saturated():
+                try:
+                    job = await self.queue.claim(self.worker_id)
+                    if job is None:
+                        await self.queue.fail_abandoned()
+                except Exception as e:
+                    logger.error(f"Error claiming PDF jobs: {str(e)}")
+                    job = None
+                if job:
+                    task = asyncio.create_task(self._process(job))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._finished)
+                    continue
+
+            # Sleep until a job finishes, or poll again for new jobs
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+        if self._tasks:
+            logger.info(f"Render worker {self.worker_id} stopping, waiting for {len(self._tasks)} jobs")
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stop(self):
+        """Stop claiming jobs"""
+        self._stopping.set()
+        self._wake.set()
+
+    def _saturated(self) -> bool:
+        """Whether the render pool has no free slot, e.g. held by a render that timed out"""
+        pool = self.ebook_service.render_pool
+        return pool.pending >= pool.capacity
+
+    def _finished(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        self._wake.set()
+
+    async def _process(self, job: PDFJob):
+        """Generate the PDF of a claimed job and record the outcome"""
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        try:
+            token = await self.ebook_service.generate_pdf(
+                job.user_agent, job.ip_address, job.slug, output_profile=job.output_profile
+            )
+            outcome = await self._complete(job, "done", status="done", token=token)
+        except RenderQueueFull as e:
+            # The job never rendered: hand it back without spending an attempt
+            logger.warning(f"PDF job {job.id} released, render pool is full: {str(e)}")
+            released = await self.queue.release(job.id, self.worker_id, delay=e.retry_after, count_attempt=False)
+            outcome = "deferred" if released else "lease_lost"
+        except RETRYABLE_ERRORS as e:
+            logger.warning(f"PDF job {job.id} interrupted on attempt {job.attempts}: {str(e) or type(e).__name__}")
+            if job.attempts < self.queue.max_attempts:
+                outcome = "retried" if await self.queue.release(job.id, self.worker_id) else "lease_lost"
+            else:
+                outcome = await self._complete(job, "failed", status="failed", error=str(e) or type(e).__name__)
+        except Exception as e:
+            logger.error(f"PDF job {job.id} failed: {str(e)}")
+            outcome = await self._complete(job, "failed", status="failed", error=str(e) or type(e).__name__)
+        finally:
+            heartbeat.cancel()
+        metrics.PDF_JOBS_PROCESSED.labels(outcome).inc()
+
+    async def _complete(self, job: PDFJob, outcome: str, **fields) -> str:
+        """Record a job outcome, return it, or lease_lost if another worker took the job over"""
+        if await self.queue.complete(job.id, self.worker_id, **fields):
+            return outcome
+        logger.warning(f"PDF job {job.id} was taken over by another worker, dropping its {outcome} result")
+        return "lease_lost"
+
+    async def _heartbeat(self, job_id: str):
+        """Renew the lease of a job while it renders"""
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            try:
+                if not await self.queue.heartbeat(job_id, self.worker_id):
+                    return
+            except Exception as e:
+                # The lease survives a few missed beats
+                logger.error(f"Error renewing the lease of PDF job {job_id}: {str(e)}")
+
+
+async def serve(concurrency: int, poll_interval: float):
+    """Build the services from the environment and run a worker"""
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    # One render process per job claimed at once, so claimed jobs never wait for the pool
+    render_pool = RenderPool(
+        max_workers=concurrency,
+        max_queue=0,
+        timeout=float(os.environ.get('RENDER_TIMEOUT_SECONDS', '120'))
+    )
+    download_writer = create_download_writer(db)
+    ebook_service = create_ebook_service(db, create_pdf_generator(), render_pool, download_writer,
+                                         create_token_registry(db))
+    # Renders pick up edited content as soon as the API does, not once the cache expires
+    cache_invalidator = create_cache_invalidator(db, ebook_service.cache)
+    queue = create_job_queue(db)
+    worker = JobWorker(queue, ebook_service, concurrency=concurrency, poll_interval=poll_interval)
+
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, worker.stop)
+
+    cache_invalidator.start()
+    download_writer.start()
+    try:
+        await worker.run()
+    finally:
+        cache_invalidator.stop()
+        await download_writer.stop()
+        render_pool.shutdown()
+        client.close()
+
+
+def main(
+    concurrency: int = typer.Option(2, "--concurrency", "-c", min=1, envvar="RENDER_WORKERS",
+                                    help="Jobs rendered at once, each in its own process"),
+    poll_interval: float = typer.Option(1.0, envvar="JOB_POLL_SECONDS",
+                                        help="Seconds between queue polls while idle"),
+    metrics_port: int = typer.Option(0, envvar="WORKER_METRICS_PORT",
+                                     help="Serve Prometheus metrics on this port, 0 to disable"),
+):
+    """Render PDF jobs from the pdf_jobs queue until interrupted"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    if metrics_port:
+        start_http_server(metrics_port)
+    asyncio.run(serve(concurrency, poll_interval))
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -20,7 +20,7 @@ const Home = () => {
     const fetchData = async () => {
       try {
         const [ebookResponse, statsResponse, testimonialsResponse] = await Promise.all([
-          axios.get(`${API}/ebook/content`),
+          axios.get(`${API}/ebook/toc`),
           axios.get(`${API}/stats`),
           axios.get(`${API}/testimonials`)
         ]);
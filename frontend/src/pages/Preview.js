@@ -11,25 +11,48 @@ const API = `${BACKEND_URL}/api`;
 
 const Preview = () => {
   const [currentChapter, setCurrentChapter] = useState(0);
-  const [ebookContent, setEbookContent] = useState(null);
+  const [toc, setToc] = useState(null);
+  const [chapters, setChapters] = useState({});
+  const [chapterErrors, setChapterErrors] = useState({});
   const [isGenerating, setIsGenerating] = useState(false);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-    const fetchEbookContent = async () => {
+    const fetchTableOfContents = async () => {
       try {
-        const response = await axios.get(`${API}/ebook/content`);
-        setEbookContent(response.data.data);
+        const response = await axios.get(`${API}/ebook/toc`);
+        setToc(response.data.data);
       } catch (error) {
-        console.error('Error fetching ebook content:', error);
+        console.error('Error fetching table of contents:', error);
       } finally {
         setLoading(false);
       }
     };
 
-    fetchEbookContent();
+    fetchTableOfContents();
   }, []);
 
+  useEffect(() => {
+    // Chapters are fetched one at a time, when first shown
+    if (!toc || chapters[currentChapter] || chapterErrors[currentChapter]) return;
+
+    const fetchChapter = async () => {
+      try {
+        const response = await axios.get(`${API}/ebook/chapters/${currentChapter + 1}`);
+        setChapters((loaded) => ({ ...loaded, [currentChapter]: response.data.data }));
+      } catch (error) {
+        console.error('Error fetching chapter:', error);
+        setChapterErrors((failed) => ({ ...failed, [currentChapter]: true }));
+      }
+    };
+
+    fetchChapter();
+  }, [toc, currentChapter, chapters, chapterErrors]);
+
+  const retryChapter = () => {
+    setChapterErrors((failed) => ({ ...failed, [currentChapter]: false }));
+  };
+
   const handleDownload = async () => {
     if (isGenerating) return;
     
@@ -55,7 +78,7 @@ const Preview = () => {
   };
 
   const nextChapter = () => {
-    if (ebookContent && currentChapter < ebookContent.chapters.length - 1) {
+    if (toc && currentChapter < toc.chapters.length - 1) {
       setCurrentChapter(currentChapter + 1);
     }
   };
@@ -77,7 +100,7 @@ const Preview = () => {
     );
   }
 
-  if (!ebookContent) {
+  if (!toc) {
     return (
       <div className="min-h-screen bg-gray-50 flex items-center justify-center">
         <div className="text-center">
@@ -87,7 +110,8 @@ const Preview = () => {
     );
   }
 
-  const currentChapterData = ebookContent.chapters[currentChapter];
+  const currentChapterSummary = toc.chapters[currentChapter];
+  const currentChapterData = chapters[currentChapter];
 
   return (
     <div className="min-h-screen bg-gray-50">
@@ -137,7 +161,7 @@ const Preview = () => {
                 </CardHeader>
                 <CardContent>
                   <div className="space-y-2">
-                    {ebookContent.chapters.map((chapter, index) => (
+                    {toc.chapters.map((chapter, index) => (
                       <button
                         key={index}
                         onClick={() => setCurrentChapter(index)}
@@ -164,7 +188,7 @@ const Preview = () => {
                 <CardHeader>
                   <div className="flex items-center justify-between">
                     <Badge variant="outline" className="mb-2">
-                      Chapitre {currentChapter + 1} sur {ebookContent.chapters.length}
+                      Chapitre {currentChapter + 1} sur {toc.chapters.length}
                     </Badge>
                     <div className="flex space-x-2">
                       <Button
@@ -179,17 +203,29 @@ const Preview = () => {
                         variant="outline"
                         size="sm"
                         onClick={nextChapter}
-                        disabled={currentChapter === ebookContent.chapters.length - 1}
+                        disabled={currentChapter === toc.chapters.length - 1}
                       >
                         <ChevronRight className="h-4 w-4" />
                       </Button>
                     </div>
                   </div>
-                  <CardTitle className="text-2xl">{currentChapterData.title}</CardTitle>
-                  <CardDescription>{currentChapterData.description}</CardDescription>
+                  <CardTitle className="text-2xl">{currentChapterSummary.title}</CardTitle>
+                  <CardDescription>{currentChapterSummary.description}</CardDescription>
                 </CardHeader>
                 <CardContent>
                   <div className="prose max-w-none">
+                    {chapterErrors[currentChapter] ? (
+                      <div className="text-center py-12">
+                        <p className="text-gray-600 mb-4">Erreur lors du chargement du chapitre</p>
+                        <Button variant="outline" onClick={retryChapter}>
+                          Réessayer
+                        </Button>
+                      </div>
+                    ) : !currentChapterData ? (
+                      <div className="flex justify-center py-12">
+                        <div className="animate-spin rounded-full h-8 w-8 border-b-2 border-indigo-600"></div>
+                      </div>
+                    ) : (
                     <div className="space-y-6">
                       {currentChapterData.content.map((section, index) => (
                         <div key={index}>
@@ -220,6 +256,7 @@ const Preview = () => {
                         </div>
                       ))}
                     </div>
+                    )}
                   </div>
                 </CardContent>
               </Card>
@@ -237,13 +274,13 @@ const Preview = () => {
                 </Button>
                 
                 <div className="text-sm text-gray-500">
-                  {currentChapter + 1} / {ebookContent.chapters.length}
+                  {currentChapter + 1} / {toc.chapters.length}
                 </div>
                 
                 <Button
                   variant="outline"
                   onClick={nextChapter}
-                  disabled={currentChapter === ebookContent.chapters.length - 1}
+                  disabled={currentChapter === toc.chapters.length - 1}
                   className="flex items-center space-x-2"
                 >
                   <span>Chapitre Suivant</span>
@@ -0,0 +1,59 @@
+import sys
+from pathlib import Path
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+# Backend modules are imported flat, as server.py does
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db():
+    """An in-memory stand-in for the Motor database"""
+    return AsyncMongoMockClient()["test"]
+
+
+class FakeClock:
+    """Stands in for the time module of a module under test"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+async def api(monkeypatch, tmp_path):
+    """An HTTP client on the API, its services bound to an in-memory database and tmp_path"""
+    import httpx
+    import server
+    from pdf_generator import PDFGenerator
+    from render_pool import RenderPool
+
+    monkeypatch.setenv("DB_NAME", "test")
+    monkeypatch.setattr(server, "pdf_generator", PDFGenerator(str(tmp_path / "pdfs")))
+    monkeypatch.setattr(server, "render_pool", RenderPool(max_workers=0))
+    server.connect(AsyncMongoMockClient())
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
@@ -0,0 +1,141 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from analytics import DownloadAnalytics, STATE_ID, hash_ip, user_agent_family
+
+pytestmark = pytest.mark.anyio
+
+CHROME = "Mozilla/5.0 (Windows NT 10.0) AppleWebKit/537.36 Chrome/120.0 Safari/537.36"
+IPHONE = "Mozilla/5.0 (iPhone) AppleWebKit Version/17 Mobile Safari/604.1"
+
+
+async def record_downloads(db, count: int, hours_ago: float = 3, recorded_at: datetime = None):
+    timestamp = datetime.utcnow().replace(minute=30, second=0, microsecond=0) - timedelta(hours=hours_ago)
+    await db.download_tracking.insert_many([
+        {
+            "_id": f"{hours_ago}-{i}",
+            "timestamp": timestamp,
+            "recorded_at": recorded_at or timestamp,
+            "slug": "ebook" if i % 2 else None,
+            "ip_address": f"10.0.0.{i % 3}",
+            "user_agent": CHROME if i % 2 else IPHONE,
+            "filename": "ebook.pdf",
+        }
+        for i in range(count)
+    ])
+
+
+async def daily_rollups(db):
+    return {document["slug"]: document for document in await db.download_rollups_daily.find().to_list(None)}
+
+
+@pytest.fixture
+async def analytics(db):
+    analytics = DownloadAnalytics(db, "default", ip_secret="secret")
+    await analytics.ensure_indexes()
+    return analytics
+
+
+async def test_rollup_counts_downloads_ips_and_user_agents(db, analytics):
+    await record_downloads(db, 6)
+
+    assert await analytics.rollup() == 6
+
+    rollups = await daily_rollups(db)
+    assert rollups["ebook"]["downloads"] == 3
+    assert rollups["ebook"]["unique_ips"] == 3
+    assert rollups["ebook"]["user_agents"] == {"chrome": 3}
+    assert rollups["default"]["devices"] == {"mobile": 3}
+    assert await db.download_rollups_hourly.count_documents({}) == 2
+
+
+async def test_rerunning_rollup_adds_nothing(db, analytics):
+    await record_downloads(db, 6)
+    await analytics.rollup()
+
+    assert await analytics.rollup() == 0
+
+    rollups = await daily_rollups(db)
+    assert rollups["ebook"]["downloads"] == 3
+    assert rollups["ebook"]["unique_ips"] == 3
+
+
+async def test_replayed_window_is_not_counted_twice(db, analytics):
+    await record_downloads(db, 6)
+    await analytics.rollup()
+    watermark = (await db.analytics_state.find_one({"_id": STATE_ID}))["watermark"]
+
+    # As if a worker crashed after applying the window but before moving the watermark
+    first = (await db.download_tracking.find_one(sort=[("recorded_at", 1)]))["recorded_at"]
+    await db.analytics_state.update_one(
+        {"_id": STATE_ID}, {"$set": {"pending": {"start": first, "end": watermark}}}
+    )
+    await analytics.rollup()
+
+    rollups = await daily_rollups(db)
+    assert rollups["ebook"]["downloads"] == 3
+    assert rollups["ebook"]["unique_ips"] == 3
+    assert sum(document["downloads"] for document in await db.download_rollups_hourly.find().to_list(None)) == 6
+
+
+async def test_later_events_add_to_the_same_period(db):
+    analytics = DownloadAnalytics(db, "default", settle_seconds=0, ip_secret="secret")
+    await analytics.ensure_indexes()
+    await record_downloads(db, 6, hours_ago=3)
+    await analytics.rollup()
+    # Events about the same hour, recorded after the first pass
+    await record_downloads(db, 4, hours_ago=2.75, recorded_at=datetime.utcnow())
+    # Mongo keeps milliseconds, let the events settle past them
+    await asyncio.sleep(0.01)
+
+    assert await analytics.rollup() == 4
+
+    rollups = await daily_rollups(db)
+    assert rollups["ebook"]["downloads"] == 5
+    # The same three addresses again
+    assert rollups["ebook"]["unique_ips"] == 3
+
+
+async def test_unsettled_events_wait_for_the_next_pass(db, analytics):
+    await record_downloads(db, 4, hours_ago=0)
+
+    assert await analytics.rollup() == 0
+    assert await db.download_rollups_daily.count_documents({}) == 0
+
+
+async def test_get_downloads_reads_rollups(db, analytics):
+    await record_downloads(db, 6)
+    await analytics.rollup()
+    now = datetime.utcnow()
+
+    data = await analytics.get_downloads("hour", now - timedelta(days=1), now + timedelta(hours=1), slug="ebook")
+
+    assert [entry["downloads"] for entry in data["series"]] == [3]
+    assert data["series"][0]["unique_ips"] == 3
+    assert data["totals"]["user_agents"] == {"chrome": 3}
+    assert data["watermark"] is not None
+
+
+async def test_ip_hashes_are_keyed(db, analytics):
+    await record_downloads(db, 2)
+    await analytics.rollup()
+
+    hashes = {document["ip_hash"] for document in await db.download_unique_ips.find().to_list(None)}
+    assert hash_ip("10.0.0.1", b"secret") in hashes
+    assert hash_ip("10.0.0.1", b"secret") != hash_ip("10.0.0.1", b"other")
+
+
+async def test_unconfigured_secret_is_shared_through_the_database(db):
+    first = DownloadAnalytics(db, "default")
+    second = DownloadAnalytics(db, "default")
+
+    assert await first._secret() == await second._secret()
+
+
+def test_user_agent_family():
+    assert user_agent_family(CHROME) == ("chrome", "desktop")
+    assert user_agent_family(IPHONE) == ("safari", "mobile")
+    assert user_agent_family("curl/8.0") == ("bot", "bot")
+    assert user_agent_family("Unknown") == ("unknown", "desktop")
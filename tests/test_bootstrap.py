@@ -0,0 +1,36 @@
+import bootstrap
+from render_pool import RenderPool
+
+
+def test_services_are_configured_from_the_environment(db, tmp_path, monkeypatch):
+    monkeypatch.setenv("PDF_STORAGE_PATH", str(tmp_path))
+    monkeypatch.setenv("PDF_OUTPUT_PROFILE", "print")
+    monkeypatch.setenv("TOKEN_MAX_DOWNLOADS", "3")
+    monkeypatch.setenv("PDF_EXPIRY_HOURS", "2")
+    monkeypatch.setenv("WATERMARK_DOWNLOADS", "true")
+    monkeypatch.setenv("JOB_MAX_ATTEMPTS", "5")
+
+    pdf_generator = bootstrap.create_pdf_generator()
+    tokens = bootstrap.create_token_registry(db)
+    service = bootstrap.create_ebook_service(db, pdf_generator, RenderPool(max_workers=0),
+                                             bootstrap.create_download_writer(db), tokens)
+
+    assert pdf_generator.output_profile.name == "print"
+    assert (tokens.max_downloads, tokens.ttl_hours) == (3, 2)
+    assert service.tokens is tokens
+    assert service.watermark
+    assert bootstrap.create_job_queue(db).max_attempts == 5
+
+
+def test_defaults_are_unlimited_and_unmarked(db, tmp_path, monkeypatch):
+    for name in ("TOKEN_MAX_DOWNLOADS", "WATERMARK_DOWNLOADS"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("PDF_STORAGE_PATH", str(tmp_path))
+
+    tokens = bootstrap.create_token_registry(db)
+    service = bootstrap.create_ebook_service(db, bootstrap.create_pdf_generator(), RenderPool(max_workers=0),
+                                             bootstrap.create_download_writer(db), tokens)
+
+    assert tokens.max_downloads is None
+    assert not service.watermark
+
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+import cache
+from cache import TTLCache
+
+pytestmark = pytest.mark.anyio
+
+
+class Loader:
+    """Counts calls, and holds each load until released"""
+
+    def __init__(self, value="value"):
+        self.value = value
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        return self.value
+
+
+async def test_concurrent_misses_share_one_load():
+    ttl_cache = TTLCache()
+    loader = Loader()
+
+    waiting = [asyncio.create_task(ttl_cache.get_or_load("key", loader, 60)) for _ in range(5)]
+    await asyncio.sleep(0)
+    loader.release.set()
+
+    assert await asyncio.gather(*waiting) == ["value"] * 5
+    assert loader.calls == 1
+    assert await ttl_cache.get_or_load("key", loader, 60) == "value"
+    assert loader.calls == 1
+
+
+async def test_invalidation_during_a_load_discards_its_result():
+    ttl_cache = TTLCache()
+    stale = Loader("stale")
+    waiting = asyncio.create_task(ttl_cache.get_or_load("key", stale, 60))
+    await asyncio.sleep(0)
+
+    ttl_cache.invalidate("key")
+    fresh = Loader("fresh")
+    fresh.release.set()
+    assert await ttl_cache.get_or_load("key", fresh, 60) == "fresh"
+
+    stale.release.set()
+    # Callers already waiting get the value they asked for, but it is not kept
+    assert await waiting == "stale"
+    assert await ttl_cache.get_or_load("key", Loader("unused"), 60) == "fresh"
+
+
+async def test_invalidate_namespace_drops_its_items_only():
+    ttl_cache = TTLCache()
+    for key in ("toc:a", "toc:b", "catalog:0:50"):
+        loader = Loader(key)
+        loader.release.set()
+        await ttl_cache.get_or_load(key, loader, 60)
+
+    ttl_cache.invalidate_namespace("toc")
+
+    assert list(ttl_cache._entries) == ["catalog:0:50"]
+
+
+async def test_loader_errors_and_none_are_not_cached():
+    ttl_cache = TTLCache()
+
+    async def failing():
+        raise ValueError("Mongo is down")
+
+    with pytest.raises(ValueError):
+        await ttl_cache.get_or_load("key", failing, 60)
+    missing = Loader(None)
+    missing.release.set()
+    assert await ttl_cache.get_or_load("ebook_content:unknown", missing, 60) is None
+    assert await ttl_cache.get_or_load("ebook_content:unknown", missing, 60) is None
+
+    assert missing.calls == 2
+    assert ttl_cache._entries == {}
+
+
+async def test_entries_expire(monkeypatch, clock):
+    monkeypatch.setattr(cache, "time", clock)
+    ttl_cache = TTLCache()
+    loader = Loader()
+    loader.release.set()
+
+    await ttl_cache.get_or_load("key", loader, 10)
+    clock.advance(5)
+    await ttl_cache.get_or_load("key", loader, 10)
+    assert loader.calls == 1
+
+    clock.advance(5)
+    await ttl_cache.get_or_load("key", loader, 10)
+    assert loader.calls == 2
+
+
+async def test_size_is_bounded_least_recently_used_first(monkeypatch, clock):
+    monkeypatch.setattr(cache, "time", clock)
+    ttl_cache = TTLCache(max_entries=3)
+
+    async def load(key, ttl=60):
+        loader = Loader(key)
+        loader.release.set()
+        return await ttl_cache.get_or_load(key, loader, ttl)
+
+    for key in ("a", "b", "c"):
+        await load(key)
+    await load("a")
+    await load("d")
+    assert list(ttl_cache._entries) == ["c", "a", "d"]
+
+    # Expired entries go first, whatever their use
+    await load("short", ttl=1)
+    clock.advance(2)
+    await load("e")
+    assert "short" not in ttl_cache._entries
+    assert len(ttl_cache._entries) == 3
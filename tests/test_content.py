@@ -0,0 +1,82 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+EBOOK = {
+    "slug": "guide",
+    "version": 2,
+    "title": "Guide",
+    "subtitle": "Sous-titre",
+    "author": "Auteur",
+    "pages": 12,
+    "chapters": [
+        {
+            "title": f"Chapitre {number}",
+            "description": f"Description {number}",
+            "content": [{"subtitle": f"Section {section}", "text": "Texte"} for section in range(number)],
+        }
+        for number in range(1, 4)
+    ],
+}
+
+
+@pytest.fixture
+async def ebook(api):
+    import server
+
+    await server.db.ebook_content.insert_many([
+        {**EBOOK, "version": 1, "title": "Ancien guide"},
+        dict(EBOOK),
+    ])
+    return EBOOK
+
+
+@pytest.mark.parametrize("number", [1, 2, 3])
+async def test_chapter_is_sliced_from_the_latest_version(api, ebook, number):
+    response = await api.get(f"/api/ebooks/guide/chapters/{number}")
+
+    assert response.status_code == 200
+    assert response.json()["data"] == {"number": number, **ebook["chapters"][number - 1]}
+
+
+@pytest.mark.parametrize("number", [0, -1, 4, 100])
+async def test_chapters_out_of_range_are_not_found(api, ebook, number):
+    assert (await api.get(f"/api/ebooks/guide/chapters/{number}")).status_code == 404
+
+
+async def test_unknown_ebooks_are_not_found(api):
+    assert (await api.get("/api/ebooks/unknown/chapters/1")).status_code == 404
+    assert (await api.get("/api/ebooks/unknown/toc")).status_code == 404
+
+
+async def test_default_ebook_chapters_fall_back_to_the_built_in_content(api):
+    import server
+
+    chapters = server.ebook_service.ebook_content["chapters"]
+    response = await api.get("/api/ebook/chapters/1")
+
+    assert response.json()["data"]["title"] == chapters[0]["title"]
+    assert (await api.get(f"/api/ebook/chapters/{len(chapters) + 1}")).status_code == 404
+
+
+async def test_table_of_contents_counts_sections_without_texts(api, ebook):
+    response = await api.get("/api/ebooks/guide/toc")
+
+    toc = response.json()["data"]
+    assert toc["title"] == "Guide"
+    assert [chapter["number"] for chapter in toc["chapters"]] == [1, 2, 3]
+    assert [chapter["section_count"] for chapter in toc["chapters"]] == [1, 2, 3]
+    assert "content" not in toc["chapters"][0]
+
+
+@pytest.mark.parametrize("path", ["/api/ebooks/guide/chapters/2", "/api/ebooks/guide/toc",
+                                  "/api/ebooks/guide/content"])
+async def test_content_revalidates_with_its_etag(api, ebook, path):
+    response = await api.get(path)
+    etag = response.headers["etag"]
+
+    revalidated = await api.get(path, headers={"If-None-Match": etag})
+
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == etag
+    assert revalidated.content == b""
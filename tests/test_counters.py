@@ -0,0 +1,53 @@
+import pytest
+
+from counters import ShardedCounter
+from pdf_generator import PDFGenerator
+from services import EbookService
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_increments_are_spread_over_shards(db):
+    counter = ShardedCounter(db.counters, "downloads", shards=4)
+
+    for _ in range(40):
+        await counter.increment()
+    await counter.increment(10)
+
+    assert await counter.get() == 50
+    shards = await db.counters.find().to_list(None)
+    assert 1 < len(shards) <= 4
+    assert all(shard["_id"].startswith("downloads:") for shard in shards)
+
+
+async def test_counters_do_not_share_shards(db):
+    total = ShardedCounter(db.counters, "downloads")
+    ebook = ShardedCounter(db.counters, "downloads:ebook")
+
+    await total.increment(3)
+    await ebook.increment(2)
+
+    assert await total.get() == 3
+    assert await ebook.get() == 2
+
+
+async def test_reconcile_corrects_drift(db):
+    counter = ShardedCounter(db.counters, "downloads")
+    await counter.increment(7)
+
+    assert await counter.reconcile(5) == -2
+    assert await counter.get() == 5
+    assert await counter.reconcile(5) == 0
+
+
+async def test_reconcile_resets_counters_of_ebooks_without_records(db, tmp_path):
+    service = EbookService(db, PDFGenerator(str(tmp_path)))
+    await service.ebook_download_counter("purged").increment(4)
+    await service.ebook_download_counter("kept").increment(1)
+    await service.download_counter.increment(5)
+    await db.download_tracking.insert_many([{"slug": "kept"}, {"slug": "kept"}])
+
+    assert await service.reconcile_download_counter() == -3
+    assert await service.ebook_download_counter("purged").get() == 0
+    assert await service.ebook_download_counter("kept").get() == 2
+    assert await service.download_counter.get() == 2
@@ -0,0 +1,231 @@
+import pytest
+from starlette.requests import Request
+
+from downloads import artifact_response, etag_matches, parse_range, rendered_response, transfer_length
+from storage import LocalArtifactStore
+
+PDF = bytes(range(256)) * 4
+
+
+def request_with(**headers) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(name.replace("_", "-").lower().encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalArtifactStore(tmp_path)
+    store.put("artifacts/abc.pdf", PDF)
+    return store
+
+
+async def serve(store, **headers):
+    response = await artifact_response(
+        request_with(**headers), store, "artifacts/abc.pdf", etag="abc", filename="ebook.pdf",
+        cache_control="private"
+    )
+    body = b""
+    if hasattr(response, "body_iterator"):
+        async for chunk in response.body_iterator:
+            body += chunk
+    return response, body
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=900-2000", (900, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    (" bytes=5-5 ", (5, 5)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=-", "items=0-10", "bytes=0-10,20-30", "bytes=a-b"])
+def test_parse_range_ignores_malformed_headers(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=50-10", "bytes=-0"])
+def test_parse_range_rejects_unsatisfiable_ranges(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ("", False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"other", "abc"', True),
+    ("*", True),
+    ('"other"', False),
+    ("abc", False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, '"abc"') is expected
+
+
+@pytest.mark.anyio
+async def test_artifact_is_served_whole_with_validators(store):
+    response, body = await serve(store)
+
+    assert response.status_code == 200
+    assert body == PDF
+    assert response.headers["etag"] == '"abc"'
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-length"] == str(len(PDF))
+
+
+@pytest.mark.anyio
+async def test_matching_if_none_match_gets_304(store):
+    response, body = await serve(store, if_none_match='"abc"')
+
+    assert response.status_code == 304
+    assert body == b""
+
+
+@pytest.mark.anyio
+async def test_range_gets_206(store):
+    response, body = await serve(store, range="bytes=10-19")
+
+    assert response.status_code == 206
+    assert body == PDF[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(PDF)}"
+
+
+@pytest.mark.anyio
+async def test_unsatisfiable_range_gets_416(store):
+    response, _ = await serve(store, range=f"bytes={len(PDF)}-")
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(PDF)}"
+
+
+@pytest.mark.anyio
+async def test_stale_if_range_gets_the_whole_file(store):
+    response, body = await serve(store, range="bytes=10-19", if_range='"old"')
+
+    assert response.status_code == 200
+    assert body == PDF
+
+
+@pytest.mark.anyio
+async def test_rendered_response_streams_and_deletes_its_temp_file(tmp_path):
+    path = tmp_path / "render.pdf"
+    path.write_bytes(PDF)
+
+    response = rendered_response(None, str(path), "ebook.pdf")
+    body = b"".join([chunk async for chunk in response.body_iterator])
+
+    assert body == PDF
+    assert response.headers["content-length"] == str(len(PDF))
+    assert response.headers["cache-control"] == "no-store"
+    assert not path.exists()
+
+
+@pytest.mark.anyio
+async def test_abandoned_rendered_response_deletes_its_temp_file(tmp_path):
+    path = tmp_path / "render.pdf"
+    path.write_bytes(PDF * 100)
+
+    response = rendered_response(None, str(path), "ebook.pdf")
+    # The client went away after the first chunk
+    iterator = response.body_iterator.__aiter__()
+    await iterator.__anext__()
+    await iterator.aclose()
+
+    assert not path.exists()
+
+@pytest.mark.parametrize("headers, expected", [
+    ({}, 1000),
+    ({"range": "bytes=0-99"}, 100),
+    ({"range": "bytes=100-"}, 900),
+    # Suffix ranges are charged what they send, the whole file included
+    ({"range": "bytes=-100"}, 100),
+    ({"range": "bytes=-99999999"}, 1000),
+    ({"range": "bytes=10-19", "if_range": '"old"'}, 1000),
+    ({"range": "bytes=0-10,20-30"}, 1000),
+    ({"if_none_match": '"abc"'}, 0),
+    ({"if_none_match": '"abc"', "range": "bytes=0-99"}, 0),
+    ({"range": "bytes=1000-"}, 0),
+])
+def test_transfer_length_counts_the_bytes_served(headers, expected):
+    assert transfer_length(request_with(**headers), "abc", 1000) == expected
+
+
+@pytest.fixture
+async def limited(api, monkeypatch):
+    """A token limited to one download of a stored artifact"""
+    import server
+
+    monkeypatch.setattr(server.download_tokens, "max_downloads", 1)
+    key = "a" * 64
+    server.pdf_generator.cache.store.put(server.pdf_generator.cache.artifact_name(key), PDF)
+    return await server.download_tokens.mint(key)
+
+
+@pytest.mark.anyio
+async def test_limited_token_is_used_up_by_a_download(api, limited):
+    url = f"/api/download-pdf/{limited.token}"
+    response = await api.get(url)
+    assert response.status_code == 200
+    assert response.content == PDF
+    etag = response.headers["etag"]
+
+    assert (await api.get(url, headers={"If-None-Match": etag})).status_code == 304
+    assert (await api.get(url)).status_code == 404
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("continuation", ["bytes=1-", "bytes=-99999999", "bytes=-100"])
+async def test_ranges_do_not_get_around_the_download_limit(api, limited, continuation):
+    url = f"/api/download-pdf/{limited.token}"
+    response = await api.get(url, headers={"Range": f"bytes=0-{len(PDF) - 101}"})
+    assert response.status_code == 206
+
+    # The last 100 bytes fit in what is left, the whole file does not
+    response = await api.get(url, headers={"Range": continuation})
+    assert response.status_code == (206 if continuation == "bytes=-100" else 404)
+
+
+@pytest.mark.anyio
+async def test_limited_tokens_do_not_expose_the_artifact_key(api, limited):
+    import server
+
+    server.ebook_service.ready = True
+    response = await api.get(f"/api/download-pdf/{limited.token}")
+
+    assert limited.artifact not in response.headers["etag"]
+    assert "artifact" not in (await api.get("/api/health")).json()
+    assert (await api.get(f"/api/artifacts/{limited.artifact}.pdf")).status_code == 404
+
+
+@pytest.mark.anyio
+async def test_artifacts_are_shared_without_download_limit(api):
+    import server
+
+    key = "b" * 64
+    server.pdf_generator.cache.store.put(server.pdf_generator.cache.artifact_name(key), PDF)
+    response = await api.get(f"/api/artifacts/{key}.pdf", params={"slug": "mon-ebook"})
+
+    assert response.status_code == 200
+    assert response.headers["etag"] == f'"{key}"'
+    assert response.headers["content-disposition"] == "attachment; filename*=utf-8''mon-ebook.pdf"
+
+
+@pytest.mark.anyio
+async def test_artifacts_are_not_shared_unmarked_when_watermarking(api, monkeypatch):
+    import server
+
+    monkeypatch.setattr(server.ebook_service, "watermark", True)
+    key = "c" * 64
+    server.pdf_generator.cache.store.put(server.pdf_generator.cache.artifact_name(key), PDF)
+
+    assert (await api.get(f"/api/artifacts/{key}.pdf")).status_code == 404
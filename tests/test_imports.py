@@ -0,0 +1,23 @@
+import subprocess
+import sys
+
+import pytest
+
+from tests.conftest import BACKEND_DIR
+
+
+def loaded_modules(module: str) -> set:
+    """Import a module in a fresh interpreter and list the top-level packages it loaded"""
+    code = f"import sys, {module}; print(' '.join(sorted({{name.split('.')[0] for name in sys.modules}})))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True,
+                            check=True, env={"PATH": ""})
+    return set(result.stdout.split())
+
+
+@pytest.mark.parametrize("module", ["worker", "cli"])
+def test_worker_and_cli_start_without_fastapi(module):
+    assert not {"fastapi", "starlette"} & loaded_modules(module)
+
+
+def test_api_starts_without_reportlab_nor_pypdf():
+    assert not {"reportlab", "pypdf", "pikepdf"} & loaded_modules("server")
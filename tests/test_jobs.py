@@ -0,0 +1,137 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from jobs import JobQueue, PDFJobManager
+from models import PDFJob
+
+pytestmark = pytest.mark.anyio
+
+
+async def queue_job(queue: JobQueue, **fields) -> PDFJob:
+    job = PDFJob(user_agent="test", ip_address="127.0.0.1", **fields)
+    await queue.collection.insert_one(job.dict())
+    return job
+
+
+async def expire_lease(queue: JobQueue, job_id: str):
+    await queue.collection.update_one(
+        {"id": job_id}, {"$set": {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+    )
+
+
+async def test_claim_takes_oldest_queued_job_once(db):
+    queue = JobQueue(db.pdf_jobs)
+    first = await queue_job(queue, created_at=datetime.utcnow() - timedelta(minutes=1))
+    await queue_job(queue)
+
+    job = await queue.claim("worker-a")
+
+    assert job.id == first.id
+    assert job.status == "rendering"
+    assert job.worker == "worker-a"
+    assert job.attempts == 1
+    assert job.lease_expires_at > datetime.utcnow()
+    assert (await queue.claim("worker-b")).id != first.id
+    assert await queue.claim("worker-c") is None
+
+
+async def test_heartbeat_and_complete_require_the_lease_holder(db):
+    queue = JobQueue(db.pdf_jobs, lease_seconds=30)
+    job = await queue_job(queue)
+    claimed = await queue.claim("worker-a")
+
+    assert await queue.heartbeat(job.id, "worker-a")
+    assert not await queue.heartbeat(job.id, "worker-b")
+    assert not await queue.complete(job.id, "worker-b", status="done", token="stolen")
+    assert await queue.complete(job.id, "worker-a", status="done", token="token")
+
+    document = await db.pdf_jobs.find_one({"id": job.id})
+    assert document["status"] == "done"
+    assert document["token"] == "token"
+    assert document["lease_expires_at"] is None
+    # The job is finished, the worker no longer holds a lease on it
+    assert not await queue.heartbeat(claimed.id, "worker-a")
+
+
+async def test_expired_lease_is_claimed_again(db):
+    queue = JobQueue(db.pdf_jobs)
+    job = await queue_job(queue)
+    await queue.claim("worker-a")
+    assert await queue.claim("worker-b") is None
+
+    await expire_lease(queue, job.id)
+    retried = await queue.claim("worker-b")
+
+    assert retried.id == job.id
+    assert retried.worker == "worker-b"
+    assert retried.attempts == 2
+    # The first worker lost the job and cannot record a result over the retry
+    assert not await queue.complete(job.id, "worker-a", status="done", token="late")
+
+
+async def test_fail_abandoned_only_fails_jobs_out_of_attempts(db):
+    queue = JobQueue(db.pdf_jobs, max_attempts=2)
+    job = await queue_job(queue)
+    for worker in ("worker-a", "worker-b"):
+        assert (await queue.claim(worker)).id == job.id
+        await expire_lease(queue, job.id)
+
+    # Out of attempts, so no worker claims it again
+    assert await queue.claim("worker-c") is None
+    assert await queue.fail_abandoned() == 1
+    document = await db.pdf_jobs.find_one({"id": job.id})
+    assert document["status"] == "failed"
+    assert "2 times" in document["error"]
+    assert await queue.fail_abandoned() == 0
+
+
+async def test_release_without_attempt_waits_for_its_delay(db):
+    queue = JobQueue(db.pdf_jobs)
+    job = await queue_job(queue)
+    await queue.claim("worker-a")
+
+    assert await queue.release(job.id, "worker-a", delay=60, count_attempt=False)
+
+    document = await db.pdf_jobs.find_one({"id": job.id})
+    assert document["status"] == "queued"
+    assert document["attempts"] == 0
+    assert document["worker"] is None
+    assert await queue.claim("worker-b") is None
+
+    await db.pdf_jobs.update_one({"id": job.id}, {"$set": {"available_at": datetime.utcnow()}})
+    assert (await queue.claim("worker-b")).attempts == 1
+
+
+async def test_depth_counts_by_status(db):
+    queue = JobQueue(db.pdf_jobs)
+    await queue_job(queue, created_at=datetime.utcnow() - timedelta(seconds=30))
+    await queue_job(queue)
+    await queue.claim("worker-a")
+
+    depth = await queue.depth()
+
+    assert depth["queued"] == 1
+    assert depth["rendering"] == 1
+    assert depth["oldest_queued_seconds"] < 30
+
+
+async def test_watch_forgets_wake_up_event_of_jobs_run_elsewhere(db):
+    manager = PDFJobManager(db, ebook_service=None, queue=JobQueue(db.pdf_jobs))
+    job = await manager.submit("test", "127.0.0.1")
+
+    statuses = []
+
+    async def watch():
+        async for update in manager.watch(job.id, poll_interval=0.01):
+            statuses.append(update.status)
+
+    watcher = asyncio.create_task(watch())
+    await asyncio.sleep(0.05)
+    assert job.id in manager._changed
+    await db.pdf_jobs.update_one({"id": job.id}, {"$set": {"status": "done"}})
+    await asyncio.wait_for(watcher, timeout=1)
+
+    assert statuses == ["queued", "done"]
+    assert job.id not in manager._changed
@@ -0,0 +1,80 @@
+import io
+
+import pikepdf
+import pytest
+from pypdf import PdfReader
+
+import optimize
+from optimize import OUTPUT_PROFILES, get_profile, optimize_pdf
+from pdf_generator import PDFGenerator
+from default_content import get_default_content
+
+
+@pytest.fixture(scope="module")
+def base(tmp_path_factory):
+    """The default ebook rendered without optimizations"""
+    generator = PDFGenerator(str(tmp_path_factory.mktemp("pdfs")))
+    data, _ = generator.render_spooled(get_default_content(), 10 * 1024 * 1024, output_profile="none")
+    return data
+
+
+def optimized(base: bytes, profile: str):
+    output = io.BytesIO()
+    report = optimize_pdf(io.BytesIO(base), output, get_profile(profile))
+    return output.getvalue(), report
+
+
+@pytest.mark.parametrize("profile", list(OUTPUT_PROFILES))
+def test_optimized_pdf_keeps_every_page_and_its_text(base, profile):
+    data, report = optimized(base, profile)
+
+    original, result = PdfReader(io.BytesIO(base)), PdfReader(io.BytesIO(data))
+    assert len(result.pages) == len(original.pages)
+    assert result.pages[3].extract_text() == original.pages[3].extract_text()
+    assert report["profile"] == profile
+    assert report["bytes_before"] == len(base)
+    assert report["bytes_after"] == len(data)
+
+
+@pytest.mark.parametrize("profile", ["web", "print"])
+def test_optimized_pdf_is_smaller(base, profile):
+    data, report = optimized(base, profile)
+
+    assert len(data) < len(base)
+    assert report["saved_ratio"] > 0
+
+
+def test_web_profile_linearizes_with_object_streams(base):
+    data, _ = optimized(base, "web")
+
+    with pikepdf.open(io.BytesIO(data)) as pdf:
+        assert pdf.is_linearized
+    assert b"/ObjStm" in data
+
+
+def test_print_profile_keeps_a_plain_structure(base):
+    data, _ = optimized(base, "print")
+
+    with pikepdf.open(io.BytesIO(data)) as pdf:
+        assert not pdf.is_linearized
+    assert b"/ObjStm" not in data
+
+
+def test_none_profile_copies_the_pdf(base):
+    data, report = optimized(base, "none")
+
+    assert data == base
+    assert report["saved_ratio"] == 0
+
+
+def test_without_pikepdf_only_resources_are_deduplicated(base, monkeypatch):
+    monkeypatch.setattr(optimize, "HAS_PIKEPDF", False)
+    data, _ = optimized(base, "web")
+
+    assert len(PdfReader(io.BytesIO(data)).pages) == len(PdfReader(io.BytesIO(base)).pages)
+    assert b"/Linearized" not in data[:1024]
+
+
+def test_unknown_profiles_are_rejected():
+    with pytest.raises(ValueError):
+        get_profile("ultra")
@@ -0,0 +1,115 @@
+import gzip
+import json
+
+import pytest
+from starlette.requests import Request
+
+import payloads
+from payloads import JsonPayload, negotiate_encoding, parse_accept_encoding, payload_response
+
+DATA = {"chapters": [{"title": f"Chapitre {number}", "content": "é" * 100} for number in range(10)]}
+ALL = ("br", "gzip", "identity")
+
+
+def request_with(**headers) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(name.replace("_", "-").lower().encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding("gzip, br;q=0.5, identity;q=0, deflate;q=abc") == {
+        "gzip": 1.0, "br": 0.5, "identity": 0.0, "deflate": 0.0,
+    }
+    assert parse_accept_encoding(None) == {}
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, "identity"),
+    ("", "identity"),
+    ("gzip", "gzip"),
+    ("gzip, br", "br"),
+    ("GZIP, deflate", "gzip"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("br;q=0, gzip;q=0", "identity"),
+    ("*", "br"),
+    ("*;q=0.1, gzip;q=0.5", "gzip"),
+    ("identity;q=0, *;q=0", "identity"),
+])
+def test_negotiate_encoding(header, expected):
+    assert negotiate_encoding(header, ALL) == expected
+
+
+def test_negotiation_only_picks_available_encodings():
+    assert negotiate_encoding("br", ("gzip", "identity")) == "identity"
+
+
+def test_each_encoding_has_its_own_etag():
+    payload = JsonPayload(DATA)
+
+    assert set(payload.bodies) == set(ALL)
+    assert len(set(payload.etags.values())) == 3
+    assert payload.etags["identity"] == payload.etag
+    assert json.loads(gzip.decompress(payload.bodies["gzip"])) == DATA
+
+
+def test_small_payloads_are_not_compressed():
+    payload = JsonPayload({"ok": True})
+
+    assert set(payload.bodies) == {"identity"}
+
+
+def test_payloads_without_brotli_fall_back_to_gzip(monkeypatch):
+    monkeypatch.setattr(payloads, "brotli", None)
+    payload = JsonPayload(DATA)
+
+    response = payload_response(request_with(accept_encoding="br, gzip"), payload, "public")
+    assert response.headers["content-encoding"] == "gzip"
+
+
+def test_response_is_served_in_the_negotiated_encoding():
+    payload = JsonPayload(DATA)
+
+    response = payload_response(request_with(accept_encoding="gzip"), payload, "public, max-age=60")
+
+    assert response.status_code == 200
+    assert response.body == payload.bodies["gzip"]
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == payload.etags["gzip"]
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["cache-control"] == "public, max-age=60"
+
+
+def test_identity_response_has_no_content_encoding():
+    payload = JsonPayload(DATA)
+
+    response = payload_response(request_with(), payload, "public")
+
+    assert response.body == payload.body
+    assert "content-encoding" not in response.headers
+
+
+@pytest.mark.parametrize("cached", ALL)
+def test_any_cached_encoding_gets_304(cached):
+    payload = JsonPayload(DATA)
+
+    response = payload_response(
+        request_with(accept_encoding="br", if_none_match=payload.etags[cached]), payload, "public"
+    )
+
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == payload.etags["br"]
+    assert response.headers["vary"] == "Accept-Encoding"
+
+
+def test_stale_etag_gets_the_new_payload():
+    old, new = JsonPayload(DATA), JsonPayload({**DATA, "title": "Nouveau"})
+
+    response = payload_response(request_with(if_none_match=old.etag), new, "public")
+
+    assert response.status_code == 200
+    assert response.headers["etag"] == new.etag
@@ -0,0 +1,46 @@
+import os
+import tempfile
+
+import pytest
+from pypdf import PdfReader
+
+from pdf_generator import PDFGenerator
+from default_content import get_default_content
+
+CONTENT = get_default_content()
+
+
+@pytest.fixture
+def scratch(tmp_path, monkeypatch):
+    """The directory temp files go to"""
+    path = tmp_path / "tmp"
+    path.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(path))
+    return path
+
+
+@pytest.fixture
+def generator(tmp_path):
+    return PDFGenerator(str(tmp_path / "pdfs"))
+
+
+@pytest.mark.parametrize("watermark", [None, ("wm-1", "Copie de test")])
+@pytest.mark.parametrize("profile", ["none", "web"])
+def test_large_renders_leave_a_single_temp_file(generator, scratch, watermark, profile):
+    data, path = generator.render_spooled(CONTENT, 1024, watermark, profile)
+
+    assert data is None
+    # Intermediate stages are gone, only the output is left for the response to stream
+    assert os.listdir(scratch) == [os.path.basename(path)]
+    reader = PdfReader(path)
+    assert len(reader.pages) > len(CONTENT["chapters"])
+    if watermark:
+        assert reader.trailer["/Info"]["/WatermarkId"] == "wm-1"
+
+
+def test_small_renders_stay_in_memory(generator, scratch):
+    data, path = generator.render_spooled(CONTENT, 10 * 1024 * 1024, ("wm-1", "Copie de test"), "web")
+
+    assert path is None
+    assert data.startswith(b"%PDF")
+    assert os.listdir(scratch) == []
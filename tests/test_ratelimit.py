@@ -0,0 +1,97 @@
+import pytest
+
+import ratelimit
+from ratelimit import MemoryRateLimitBackend, RateLimited, RateLimiter
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def limiter(monkeypatch, clock):
+    monkeypatch.setattr(ratelimit, "time", clock)
+    return RateLimiter(MemoryRateLimitBackend(), rate_per_minute=15, burst=3, dedup_window=10)
+
+
+async def test_burst_then_limited(limiter):
+    for _ in range(3):
+        await limiter.check("client")
+
+    with pytest.raises(RateLimited) as raised:
+        await limiter.check("client")
+    # One token comes back every 4 seconds at 15 per minute
+    assert raised.value.retry_after == 4
+
+
+async def test_bucket_refills_at_the_configured_rate(limiter, clock):
+    for _ in range(3):
+        await limiter.check("client")
+
+    clock.advance(2)
+    with pytest.raises(RateLimited) as raised:
+        await limiter.check("client")
+    assert raised.value.retry_after == 2
+
+    clock.advance(2)
+    await limiter.check("client")
+    with pytest.raises(RateLimited):
+        await limiter.check("client")
+
+
+async def test_refill_stops_at_burst(limiter, clock):
+    await limiter.check("client")
+    clock.advance(3600)
+
+    for _ in range(3):
+        await limiter.check("client")
+    with pytest.raises(RateLimited):
+        await limiter.check("client")
+
+
+async def test_clients_and_scopes_have_their_own_buckets(limiter):
+    for _ in range(3):
+        await limiter.check("client", "generate-pdf")
+
+    await limiter.check("other-client", "generate-pdf")
+    await limiter.check("client", "other-scope")
+
+
+async def test_recent_results_expire_with_the_dedup_window(limiter, clock):
+    await limiter.remember("client", "ebook:web", "token")
+    assert await limiter.recent("client", "ebook:web") == "token"
+    assert await limiter.recent("client", "ebook:print") is None
+
+    clock.advance(10)
+    assert await limiter.recent("client", "ebook:web") is None
+
+
+@pytest.fixture
+async def stored_ebook(api):
+    """The default ebook's artifact, already rendered"""
+    import server
+    from default_content import DEFAULT_EBOOK_SLUG
+
+    content = await server.ebook_service.get_ebook_content(DEFAULT_EBOOK_SLUG)
+    key = server.ebook_service._get_content_key(DEFAULT_EBOOK_SLUG, content, server.pdf_generator.output_profile.name)
+    server.pdf_generator.cache.store.put(server.pdf_generator.cache.artifact_name(key), b"%PDF-1.4" * 100)
+    return key
+
+
+async def test_repeated_clicks_get_the_same_token(api, stored_ebook):
+    first = (await api.post("/api/generate-pdf")).json()
+    second = (await api.post("/api/generate-pdf")).json()
+
+    assert first["token"] == second["token"]
+
+
+async def test_used_up_tokens_are_not_handed_out_again(api, stored_ebook, monkeypatch):
+    import server
+
+    monkeypatch.setattr(server.download_tokens, "max_downloads", 1)
+    first = (await api.post("/api/generate-pdf")).json()
+    assert (await api.post("/api/generate-pdf")).json()["token"] == first["token"]
+    assert (await api.get(first["download_url"])).status_code == 200
+
+    second = (await api.post("/api/generate-pdf")).json()
+
+    assert second["token"] != first["token"]
+    assert (await api.get(second["download_url"])).status_code == 200
@@ -0,0 +1,110 @@
+import os
+import time
+
+import pytest
+
+import render_cache
+from render_cache import RenderCache, content_hash
+from storage import LocalArtifactStore
+
+CONTENT = {
+    "title": "Titre",
+    "subtitle": "Sous-titre",
+    "author": "Auteur",
+    "chapters": [{"title": "Un", "description": "", "content": []}],
+}
+
+
+class CountingStore(LocalArtifactStore):
+    """Local store counting the touches that reach it"""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.touches = 0
+
+    def touch(self, name: str):
+        self.touches += 1
+        super().touch(name)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return RenderCache(CountingStore(tmp_path), touch_interval=60)
+
+
+def age(store: LocalArtifactStore, name: str, hours: float):
+    """Backdate an object's modification time"""
+    mtime = time.time() - hours * 3600
+    os.utime(store.root / name, (mtime, mtime))
+
+
+def test_key_ignores_field_order_and_document_metadata():
+    reordered = dict(reversed(list(CONTENT.items())))
+    stored = {**CONTENT, "_id": "abc", "slug": "ebook", "version": 3, "updated_at": "2024-01-01"}
+
+    assert content_hash(CONTENT, "style") == content_hash(reordered, "style") == content_hash(stored, "style")
+
+
+def test_key_changes_with_content_and_style():
+    edited = {**CONTENT, "chapters": [{**CONTENT["chapters"][0], "title": "Deux"}]}
+
+    keys = {content_hash(CONTENT, "style"), content_hash(edited, "style"), content_hash(CONTENT, "other")}
+    assert len(keys) == 3
+
+
+def test_stored_artifact_is_found_by_key(cache, tmp_path):
+    key = content_hash(CONTENT)
+    assert not cache.has_artifact(key)
+    assert not cache.touch_artifact(key)
+
+    temp_path = cache.get_temp_path(key)
+    temp_path.write_bytes(b"%PDF-1.4")
+    cache.store_artifact(key, temp_path)
+
+    assert cache.has_artifact(key)
+    assert cache.store.get(cache.artifact_name(key)) == b"%PDF-1.4"
+    assert not temp_path.exists()
+
+
+def test_touches_are_throttled(cache, monkeypatch, clock):
+    monkeypatch.setattr(render_cache, "time", clock)
+    cache.store.put(cache.artifact_name("key"), b"%PDF-1.4")
+
+    assert cache.touch_artifact("key")
+    assert cache.touch_artifact("key")
+    assert cache.store.touches == 1
+
+    clock.advance(60)
+    assert cache.touch_artifact("key")
+    assert cache.store.touches == 2
+
+
+def test_cleanup_keeps_cached_objects_one_touch_interval_longer(tmp_path):
+    cache = RenderCache(LocalArtifactStore(tmp_path), touch_interval=3600)
+    for name in ("artifacts/recent.pdf", "artifacts/old.pdf", "parts/old.pdf",
+                 "personalized/recent.pdf", "personalized/old.pdf"):
+        cache.store.put(name, b"%PDF-1.4")
+    # Past the expiry, but maybe touched less than an interval ago
+    age(cache.store, "artifacts/recent.pdf", 24.5)
+    age(cache.store, "personalized/recent.pdf", 23)
+    for name in ("artifacts/old.pdf", "parts/old.pdf", "personalized/old.pdf"):
+        age(cache.store, name, 26)
+
+    cache.cleanup(hours=24)
+
+    assert cache.store.exists("artifacts/recent.pdf")
+    assert cache.store.exists("personalized/recent.pdf")
+    assert not cache.store.exists("artifacts/old.pdf")
+    assert not cache.store.exists("parts/old.pdf")
+    assert not cache.store.exists("personalized/old.pdf")
+
+
+def test_cleanup_resets_touch_throttling(cache, monkeypatch, clock):
+    monkeypatch.setattr(render_cache, "time", clock)
+    cache.store.put(cache.artifact_name("key"), b"%PDF-1.4")
+    cache.touch_artifact("key")
+
+    cache.cleanup(hours=24)
+    cache.touch_artifact("key")
+
+    assert cache.store.touches == 2
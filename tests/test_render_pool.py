@@ -0,0 +1,106 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import server
+import services
+from pdf_generator import PDFGenerator
+from render_pool import RenderPool, RenderQueueFull, RenderTimeout
+from services import EbookService
+
+pytestmark = pytest.mark.anyio
+
+
+async def wait_until(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.01)
+
+
+async def test_full_pool_rejects_with_retry_estimate():
+    pool = RenderPool(max_workers=0, max_queue=1)
+    release = threading.Event()
+    running = [asyncio.create_task(pool.run(release.wait)) for _ in range(2)]
+    await wait_until(lambda: pool.pending == 2)
+
+    with pytest.raises(RenderQueueFull) as raised:
+        await pool.run(release.wait)
+    assert raised.value.retry_after >= 1
+
+    release.set()
+    await asyncio.gather(*running)
+    assert pool.pending == 0
+
+
+async def test_full_pool_answers_503_with_retry_after(api):
+    server.render_pool.pending = server.render_pool.capacity
+
+    response = await api.post("/api/generate-pdf")
+
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) >= 1
+
+
+async def test_identical_misses_share_one_render(db, tmp_path, monkeypatch):
+    renders = []
+
+    def render_artifact(storage_path, content, profile, output_profile):
+        renders.append(content["title"])
+        time.sleep(0.1)
+        return "key", {}, None, None
+
+    monkeypatch.setattr(services, "render_artifact", render_artifact)
+    service = EbookService(db, PDFGenerator(str(tmp_path)), RenderPool(max_workers=0))
+
+    tokens = await asyncio.gather(*[service.generate_pdf("test", "127.0.0.1") for _ in range(5)])
+
+    assert len(renders) == 1
+    assert len(set(tokens)) == 5
+
+
+async def test_pool_is_recreated_after_a_worker_dies():
+    pool = RenderPool(max_workers=1)
+    try:
+        with pytest.raises(BrokenProcessPool):
+            await pool.run(os._exit, 1)
+
+        assert await pool.run(os.getpid) != os.getpid()
+        assert pool.pending == 0
+    finally:
+        pool.shutdown()
+
+
+async def test_timeout_kills_the_render_and_frees_its_slot():
+    pool = RenderPool(max_workers=1, timeout=0.5)
+    try:
+        stuck_pid = await pool.run(os.getpid)
+
+        with pytest.raises(RenderTimeout):
+            await pool.run(time.sleep, 30)
+        await wait_until(lambda: pool.pending == 0)
+
+        assert await pool.run(os.getpid) != stuck_pid
+    finally:
+        pool.shutdown()
+
+
+async def test_renders_killed_with_a_timed_out_one_run_again(caplog):
+    pool = RenderPool(max_workers=2, timeout=2)
+    try:
+        await asyncio.gather(pool.run(os.getpid), pool.run(os.getpid))
+        stuck = asyncio.create_task(pool.run(time.sleep, 30))
+        await asyncio.sleep(0.5)
+        # Still running when the pool is killed, 2s after the stuck render started
+        bystander = asyncio.create_task(pool.run(time.sleep, 1.7))
+
+        with pytest.raises(RenderTimeout):
+            await stuck
+        assert await bystander is None
+        assert "running it again" in caplog.text
+    finally:
+        pool.shutdown()
@@ -0,0 +1,108 @@
+import os
+import time
+
+import pytest
+
+from storage import ArtifactNotFound, LocalArtifactStore, S3ArtifactStore, create_store
+
+PDF = b"%PDF-1.4 " + bytes(range(256)) * 1024
+
+
+@pytest.fixture(params=["local", "s3"])
+def store(request, tmp_path, monkeypatch):
+    if request.param == "local":
+        yield LocalArtifactStore(tmp_path / "store")
+        return
+
+    import boto3
+    from moto import mock_aws
+
+    for name, value in (("AWS_ACCESS_KEY_ID", "test"), ("AWS_SECRET_ACCESS_KEY", "test"),
+                        ("AWS_DEFAULT_REGION", "us-east-1")):
+        monkeypatch.setenv(name, value)
+    with mock_aws():
+        boto3.client("s3").create_bucket(Bucket="renders")
+        store = create_store("s3://renders/ebooks")
+        assert isinstance(store, S3ArtifactStore)
+        store.scratch_path = tmp_path / "scratch"
+        store.scratch_path.mkdir()
+        yield store
+
+
+def test_put_get_size_and_exists(store):
+    assert not store.exists("artifacts/a.pdf")
+
+    store.put("artifacts/a.pdf", PDF)
+
+    assert store.exists("artifacts/a.pdf")
+    assert store.get("artifacts/a.pdf") == PDF
+    assert store.size("artifacts/a.pdf") == len(PDF)
+
+
+def test_put_file_consumes_the_scratch_file(store):
+    path = store.scratch_path / "render.tmp"
+    path.write_bytes(PDF)
+
+    store.put_file("artifacts/a.pdf", path)
+
+    assert store.get("artifacts/a.pdf") == PDF
+    assert not path.exists()
+
+
+def test_stream_ranges(store):
+    store.put("artifacts/a.pdf", PDF)
+
+    assert b"".join(store.stream("artifacts/a.pdf")) == PDF
+    assert b"".join(store.stream("artifacts/a.pdf", 100, 199)) == PDF[100:200]
+    assert b"".join(store.stream("artifacts/a.pdf", len(PDF) - 10)) == PDF[-10:]
+
+
+@pytest.mark.parametrize("method", ["get", "size", "touch"])
+def test_missing_objects_raise(store, method):
+    with pytest.raises(ArtifactNotFound):
+        getattr(store, method)("artifacts/missing.pdf")
+    with pytest.raises(ArtifactNotFound):
+        b"".join(store.stream("artifacts/missing.pdf"))
+
+
+def test_touch_and_list_older_than(store):
+    store.put("artifacts/a.pdf", PDF)
+    store.put("parts/b.pdf", PDF)
+    store.touch("artifacts/a.pdf")
+
+    assert list(store.list_older_than("artifacts/", time.time() + 60)) == ["artifacts/a.pdf"]
+    assert list(store.list_older_than("artifacts/", time.time() - 60)) == []
+    assert list(store.list_older_than("missing/", time.time() + 60)) == []
+
+
+def test_delete(store):
+    store.put("artifacts/a.pdf", PDF)
+
+    store.delete("artifacts/a.pdf")
+    store.delete("artifacts/a.pdf")
+
+    assert not store.exists("artifacts/a.pdf")
+
+
+def test_presigned_url(store):
+    store.put("artifacts/a.pdf", PDF)
+
+    url = store.presigned_url("artifacts/a.pdf", "mon ebook.pdf")
+
+    if isinstance(store, LocalArtifactStore):
+        assert url is None
+    else:
+        assert "renders" in url and "ebooks/artifacts/a.pdf" in url
+        assert "response-content-disposition" in url and "Signature" in url
+
+
+def test_cleanup_scratch_removes_stale_files_only(store):
+    stale, fresh = store.scratch_path / "stale.tmp", store.scratch_path / "fresh.tmp"
+    stale.write_bytes(PDF)
+    fresh.write_bytes(PDF)
+    os.utime(stale, (time.time() - 7200, time.time() - 7200))
+
+    store.cleanup_scratch(time.time() - 3600)
+
+    assert not stale.exists()
+    assert fresh.exists()
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from tokens import TokenRegistry
+
+pytestmark = pytest.mark.anyio
+
+SIZE = 1000
+
+
+async def test_redeem_charges_bytes_against_the_download_limit(db):
+    tokens = TokenRegistry(db.download_tokens, max_downloads=2)
+    record = await tokens.mint("artifact")
+
+    assert await tokens.redeem(record.token, SIZE, SIZE)
+    assert await tokens.redeem(record.token, SIZE, SIZE)
+    assert await tokens.redeem(record.token, SIZE, SIZE) is None
+    assert (await db.download_tokens.find_one({"_id": record.token}))["served_bytes"] == 2 * SIZE
+
+
+async def test_ranges_add_up_to_whole_downloads(db):
+    tokens = TokenRegistry(db.download_tokens, max_downloads=1)
+    record = await tokens.mint("artifact")
+
+    # A viewer reading the file in ranges, fetching a few of them twice
+    for _ in range(10):
+        assert await tokens.redeem(record.token, 100, SIZE)
+    assert await tokens.redeem(record.token, 100, SIZE)
+    # Past the allowance, even the smallest range is refused
+    assert await tokens.redeem(record.token, 1, SIZE) is None
+
+
+async def test_resolve_does_not_charge_the_token(db):
+    tokens = TokenRegistry(db.download_tokens, max_downloads=1)
+    record = await tokens.mint("artifact")
+
+    for _ in range(3):
+        assert (await tokens.resolve(record.token)).artifact == "artifact"
+    assert await tokens.redeem(record.token, SIZE, SIZE)
+    assert await tokens.redeem(record.token, SIZE, SIZE) is None
+
+
+async def test_unlimited_tokens_are_served_from_memory(db):
+    tokens = TokenRegistry(db.download_tokens)
+    record = await tokens.mint("artifact")
+    await db.download_tokens.delete_many({})
+
+    for _ in range(5):
+        assert (await tokens.redeem(record.token, SIZE, SIZE)).artifact == "artifact"
+
+
+async def test_expired_and_unknown_tokens_are_rejected(db):
+    tokens = TokenRegistry(db.download_tokens, max_downloads=5)
+    record = await tokens.mint("artifact")
+    await db.download_tokens.update_one(
+        {"_id": record.token}, {"$set": {"expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+    )
+
+    assert await tokens.redeem(record.token, SIZE, SIZE) is None
+    assert await tokens.resolve(record.token) is None
+    assert await tokens.redeem("unknown", SIZE, SIZE) is None
+
+
+async def test_lru_evicts_least_recently_used(db):
+    tokens = TokenRegistry(db.download_tokens, lru_size=2)
+    first, second, third = [await tokens.mint(f"artifact-{i}") for i in range(3)]
+
+    assert first.token not in tokens._lru
+    assert list(tokens._lru) == [second.token, third.token]
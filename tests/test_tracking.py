@@ -0,0 +1,110 @@
+import pytest
+
+from counters import ShardedCounter
+from models import DownloadTracking
+from tracking import DownloadWriter
+
+pytestmark = pytest.mark.anyio
+
+
+class FlakyCollection:
+    """Wraps a collection whose inserts fail while down is set"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.down = False
+
+    async def insert_many(self, documents, ordered=True):
+        if self.down:
+            raise ConnectionError("Mongo is down")
+        return await self.collection.insert_many(documents, ordered=ordered)
+
+
+def records(count: int):
+    return [DownloadTracking(user_agent="test", ip_address="127.0.0.1", filename="ebook.pdf") for _ in range(count)]
+
+
+def spilled_lines(writer: DownloadWriter) -> int:
+    if not writer.spill_path.exists():
+        return 0
+    return len(writer.spill_path.read_text(encoding="utf-8").splitlines())
+
+
+async def test_spilled_records_are_replayed_once_mongo_is_back(db, tmp_path):
+    collection = FlakyCollection(db.download_tracking)
+    counter = ShardedCounter(db.counters, "downloads")
+    writer = DownloadWriter(collection, counter=counter, batch_size=2, spill_path=str(tmp_path / "spill.jsonl"))
+
+    collection.down = True
+    for record in records(5):
+        writer.add(record)
+    await writer.flush()
+    assert spilled_lines(writer) == 5
+    assert await db.download_tracking.count_documents({}) == 0
+
+    collection.down = False
+    await writer.flush()
+
+    assert await db.download_tracking.count_documents({}) == 5
+    assert await counter.get() == 5
+    # Only the lock file remains, no spill nor replay copies
+    assert [path.name for path in tmp_path.iterdir()] == ["spill.jsonl.lock"]
+
+
+async def test_replay_skips_records_already_written(db, tmp_path):
+    counter = ShardedCounter(db.counters, "downloads")
+    writer = DownloadWriter(db.download_tracking, counter=counter, spill_path=str(tmp_path / "spill.jsonl"))
+    batch = records(4)
+    # The first two reached Mongo before the insert timed out and the batch was spilled
+    await db.download_tracking.insert_many([DownloadWriter._to_document(record) for record in batch[:2]])
+    writer._spill(batch)
+
+    await writer.flush()
+
+    assert await db.download_tracking.count_documents({}) == 4
+    # Only the records the replay added are counted
+    assert await counter.get() == 2
+
+
+async def test_writers_sharing_a_spill_file_replay_every_record_once(db, tmp_path):
+    spill_path = str(tmp_path / "spill.jsonl")
+    counter = ShardedCounter(db.counters, "downloads")
+    first = DownloadWriter(db.download_tracking, counter=counter, spill_path=spill_path)
+    second = DownloadWriter(db.download_tracking, counter=counter, spill_path=spill_path)
+    first._spill(records(3))
+    second._spill(records(3))
+
+    await first.flush()
+    await second.flush()
+
+    assert await db.download_tracking.count_documents({}) == 6
+    assert await counter.get() == 6
+
+
+async def test_full_spill_file_drops_records(db, tmp_path):
+    collection = FlakyCollection(db.download_tracking)
+    collection.down = True
+    writer = DownloadWriter(collection, spill_path=str(tmp_path / "spill.jsonl"), max_spill_bytes=1)
+    writer._spill(records(1))
+    for record in records(3):
+        writer.add(record)
+
+    await writer.flush()
+
+    assert spilled_lines(writer) == 1
+    assert writer.buffer == []
+
+
+async def test_records_are_dropped_without_spill_file(db):
+    collection = FlakyCollection(db.download_tracking)
+    collection.down = True
+    writer = DownloadWriter(collection)
+    for record in records(3):
+        writer.add(record)
+
+    await writer.flush()
+
+    assert writer.buffer == []
+    collection.down = False
+    await writer.flush()
+    assert await db.download_tracking.count_documents({}) == 0
@@ -0,0 +1,54 @@
+import io
+
+import pytest
+from pypdf import PdfReader
+
+from pdf_generator import PDFGenerator
+from default_content import get_default_content
+from watermark import FORM_NAME, mask_ip, render_overlay, stamp_pdf
+
+
+@pytest.fixture(scope="module")
+def base(tmp_path_factory):
+    """The default ebook rendered without optimizations"""
+    generator = PDFGenerator(str(tmp_path_factory.mktemp("pdfs")))
+    data, _ = generator.render_spooled(get_default_content(), 10 * 1024 * 1024, output_profile="none")
+    return data
+
+
+def stamp(base: bytes, text: str = "Copie wm-1 - 10.0.0.x") -> PdfReader:
+    output = io.BytesIO()
+    stamp_pdf(PdfReader(io.BytesIO(base)), render_overlay(text), output, {"/WatermarkId": "wm-1"})
+    return PdfReader(io.BytesIO(output.getvalue()))
+
+
+@pytest.mark.parametrize("ip, expected", [
+    ("192.168.1.42", "192.168.1.x"),
+    ("2001:db8:85a3:8d3:1319:8a2e:370:7348", "2001:db8:85a3:…"),
+    ("unknown", "unknown"),
+])
+def test_mask_ip(ip, expected):
+    assert mask_ip(ip) == expected
+
+
+def test_stamped_copy_keeps_every_page(base):
+    stamped = stamp(base)
+
+    assert len(stamped.pages) == len(PdfReader(io.BytesIO(base)).pages)
+    assert stamped.metadata["/WatermarkId"] == "wm-1"
+
+
+def test_watermark_is_drawn_on_every_page(base):
+    stamped = stamp(base)
+
+    for page in stamped.pages:
+        assert FORM_NAME in page["/Resources"]["/XObject"]
+        assert page.get_contents().get_data().rstrip().endswith(f"Q q {FORM_NAME} Do Q".encode())
+        assert "Copie wm-1 - 10.0.0.x" in page.extract_text()
+
+
+def test_page_text_is_kept(base):
+    original, stamped = PdfReader(io.BytesIO(base)), stamp(base)
+
+    for before, after in zip(original.pages, stamped.pages):
+        assert before.extract_text().strip() in after.extract_text()
@@ -0,0 +1,106 @@
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from jobs import JobQueue
+from models import PDFJob
+from render_pool import RenderPool, RenderQueueFull
+from worker import JobWorker
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeEbookService:
+    """Stands in for EbookService, failing or succeeding as told"""
+
+    def __init__(self, error: Exception = None, max_workers: int = 1):
+        self.render_pool = RenderPool(max_workers=max_workers, max_queue=0)
+        self.error = error
+        self.calls = 0
+
+    async def generate_pdf(self, user_agent, ip_address, slug=None, output_profile=None):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return f"token-{self.calls}"
+
+
+async def queue_jobs(queue: JobQueue, count: int):
+    for _ in range(count):
+        await queue.collection.insert_one(PDFJob(user_agent="test", ip_address="127.0.0.1").dict())
+
+
+async def run_worker(worker: JobWorker, seconds: float = 0.2):
+    task = asyncio.create_task(worker.run())
+    await asyncio.sleep(seconds)
+    worker.stop()
+    await asyncio.wait_for(task, timeout=1)
+
+
+async def test_processes_queued_jobs(db):
+    queue = JobQueue(db.pdf_jobs)
+    await queue_jobs(queue, 3)
+    service = FakeEbookService()
+
+    await run_worker(JobWorker(queue, service, worker_id="worker-a", concurrency=2, poll_interval=0.01))
+
+    documents = await db.pdf_jobs.find().to_list(None)
+    assert sorted(document["status"] for document in documents) == ["done"] * 3
+    assert all(document["token"].startswith("token-") for document in documents)
+
+
+async def test_queue_full_defers_job_without_spending_attempts(db):
+    queue = JobQueue(db.pdf_jobs, max_attempts=3)
+    await queue_jobs(queue, 2)
+    service = FakeEbookService(error=RenderQueueFull(retry_after=30))
+
+    await run_worker(JobWorker(queue, service, worker_id="worker-a", poll_interval=0.01))
+
+    # Each job was tried once, then handed back for later instead of failing
+    assert service.calls == 2
+    documents = await db.pdf_jobs.find().to_list(None)
+    assert [document["status"] for document in documents] == ["queued", "queued"]
+    assert [document["attempts"] for document in documents] == [0, 0]
+    assert all(document["available_at"] is not None for document in documents)
+
+
+async def test_saturated_pool_stops_claims(db):
+    queue = JobQueue(db.pdf_jobs)
+    await queue_jobs(queue, 1)
+    service = FakeEbookService()
+    # A render that timed out still holds the only slot
+    service.render_pool.pending = service.render_pool.capacity
+
+    await run_worker(JobWorker(queue, service, worker_id="worker-a", poll_interval=0.01))
+
+    assert service.calls == 0
+    document = await db.pdf_jobs.find_one()
+    assert document["status"] == "queued"
+    assert document["attempts"] == 0
+
+
+async def test_broken_pool_retries_then_fails(db):
+    queue = JobQueue(db.pdf_jobs, max_attempts=2)
+    await queue_jobs(queue, 1)
+    service = FakeEbookService(error=BrokenProcessPool("worker died"))
+
+    await run_worker(JobWorker(queue, service, worker_id="worker-a", poll_interval=0.01))
+
+    assert service.calls == 2
+    document = await db.pdf_jobs.find_one()
+    assert document["status"] == "failed"
+    assert document["attempts"] == 2
+
+
+async def test_job_errors_fail_the_job(db):
+    queue = JobQueue(db.pdf_jobs)
+    await queue_jobs(queue, 1)
+    service = FakeEbookService(error=ValueError("Ebook not found"))
+
+    await run_worker(JobWorker(queue, service, worker_id="worker-a", poll_interval=0.01))
+
+    document = await db.pdf_jobs.find_one()
+    assert document["status"] == "failed"
+    assert document["error"] == "Ebook not found"
+    assert document["attempts"] == 1